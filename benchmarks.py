@@ -0,0 +1,261 @@
+"""
+Micro benchmarks for the hot paths that load tests do not isolate well.
+
+    python benchmarks.py settings --guilds 10000
+    python benchmarks.py paginator --tracks 1000
+    python benchmarks.py aliases --messages 100000
+    python benchmarks.py memory --tracks 100000
+
+Every benchmark prints its own timings, nothing connects to discord or lavalink.
+"""
+
+# Discord Packages
+from discord.ext import commands
+from discord.ext.commands.view import StringView
+from lavalink import AudioTrack
+
+import gc
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from argparse import ArgumentParser, RawTextHelpFormatter
+from types import SimpleNamespace
+
+import yaml
+
+# Bot Utilities
+from cogs.utils.alias import Aliaser
+from cogs.utils.localizer import Localizer
+from cogs.utils.mixplayer import MixQueue, QueuedTrack
+from cogs.utils.paginator import LazyQueuePaginator
+from cogs.utils.settingsstorage import SqliteStorage, YamlStorage
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def per_op(seconds, count):
+    return f'{seconds * 1000:8.1f}ms total  {seconds / count * 1e6:8.2f}us/op'
+
+
+def queued_track(index, requester=1):
+    return QueuedTrack(f'QAAAjQIAJVJpY2sgQXN0bGV5{index:08d}', f'id{index:08d}', f'Artist {index % 97} - Song {index}',
+                       f'https://www.youtube.com/watch?v=id{index:08d}', f'Artist {index % 97}', 210000, requester)
+
+
+def best_of(rounds, function):
+    return min(timed(function)[0] for _ in range(rounds))
+
+
+def guild_settings(guild_id):
+    return {
+        '_servername': f'Guild {guild_id}',
+        'prefixes': ['!', '?'],
+        'locale': 'en_en',
+        'channels': {'text': [guild_id * 10 + 1], 'music': [guild_id * 10 + 2]},
+        'roles': {'dj': [guild_id * 10 + 3]},
+        'duration': {'max': 600, 'is_dynamic': True},
+        'vote_threshold': 50
+    }
+
+
+def bench_settings(args):
+    rng = random.Random(args.seed)
+    guild_ids = [str(guild_id) for guild_id in range(args.guilds)]
+    lookups = [(rng.choice(guild_ids), ['channels', 'music']) for _ in range(args.ops)]
+    changes = [(rng.choice(guild_ids), ['vote_threshold'], rng.randint(0, 100)) for _ in range(args.ops)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engines = {
+            'yaml': lambda: YamlStorage(os.path.join(tmp, 'settings.yaml'), flush_delay=3600, max_flush_delay=3600),
+            'sqlite': lambda: SqliteStorage(os.path.join(tmp, 'settings.sqlite3'), flush_delay=3600,
+                                            max_flush_delay=3600)
+        }
+        for name, open_storage in engines.items():
+            storage = open_storage()
+            for guild_id in guild_ids:
+                for key, value in guild_settings(int(guild_id)).items():
+                    storage.set(guild_id, [key], value)
+            storage.close()
+
+            print(f'{name}, {args.guilds} guilds')
+            seconds, storage = timed(open_storage)
+            print(f'  open      {seconds * 1000:8.1f}ms')
+            seconds, _ = timed(lambda: [storage.get(guild_id, keys) for guild_id, keys in lookups])
+            print(f'  get       {per_op(seconds, args.ops)}')
+            seconds, _ = timed(lambda: [storage.set(*change) for change in changes])
+            print(f'  set       {per_op(seconds, args.ops)}  (on the caller, writes happen behind it)')
+            seconds, _ = timed(storage.flush)
+            print(f'  flush     {seconds * 1000:8.1f}ms  (writer thread)')
+            storage.close()
+
+    # What every settings change cost before the storage engines, the whole document dumped on the event loop
+    document = {guild_id: guild_settings(int(guild_id)) for guild_id in guild_ids}
+    seconds, _ = timed(lambda: yaml.dump(document, indent=2))
+    print(f'whole document dump, as done per change before: {seconds * 1000:.1f}ms')
+
+
+def bench_paginator(args):
+    localizer = Localizer('./localization', 'en_en')
+    queue = MixQueue()
+    for index in range(args.tracks):
+        queue.add_track(index % 7, queued_track(index, requester=index % 7))
+
+    def first_page():
+        return LazyQueuePaginator(localizer, queue, 0).render_page(0)
+
+    def every_page():
+        paginator = LazyQueuePaginator(localizer, queue, 0)
+        return [paginator.render_page(page) for page in range(paginator.page_count)]
+
+    # Compiled templates are cached per (template, lang, prefix), the uncached runs format like every call did before
+    print(f'LazyQueuePaginator, {args.tracks} tracks from 7 users, best of {args.rounds}')
+    for name, render in (('first page, as !queue shows it', first_page), ('every page', every_page)):
+        compiled = best_of(args.rounds, render)
+        cached_compile = localizer._compile
+        localizer._compile = localizer._compile_template
+        uncompiled = best_of(args.rounds, render)
+        localizer._compile = cached_compile
+        print(f'  {name}')
+        print(f'    templates resolved every call  {uncompiled * 1000:8.2f}ms')
+        print(f'    compiled templates             {compiled * 1000:8.2f}ms')
+
+
+async def _noop(ctx):
+    pass
+
+
+def command_tree(parent, tree):
+    """ Adds a command, or a group with its subcommands, for every entry of a commands.yaml """
+    for name, properties in tree.items():
+        sub_commands = properties.get('sub_commands') if isinstance(properties, dict) else None
+        if sub_commands:
+            group = commands.Group(_noop, name=name)
+            command_tree(group, sub_commands)
+            parent.add_command(group)
+        else:
+            parent.add_command(commands.Command(_noop, name=name))
+
+
+def invocations(tree, words=()):
+    """ Every alias path of a commands.yaml, subcommands included """
+    for name, properties in tree.items():
+        aliases = properties if isinstance(properties, list) else properties['aliases']
+        sub_commands = properties.get('sub_commands') if isinstance(properties, dict) else None
+        for alias in aliases:
+            yield words + (alias,)
+            if sub_commands:
+                yield from invocations(sub_commands, words + (alias,))
+
+
+def bench_aliases(args):
+    rng = random.Random(args.seed)
+    aliaser = Aliaser('./localization', 'en_en')
+    root = commands.Group(_noop, name='root')
+    command_tree(root, aliaser.get_locale('en_en')['aliases'])
+    bot = SimpleNamespace(all_commands=root.all_commands)
+
+    messages = []
+    for locale in aliaser.localization_table:
+        for words in invocations(aliaser.get_locale(locale)['aliases']):
+            messages.append((locale, '!' + ' '.join(words) + ' some arguments'))
+    messages = [rng.choice(messages) for _ in range(args.messages)]
+
+    def resolve(get_command):
+        for locale, content in messages:
+            view = StringView(content)
+            view.skip_string('!')
+            view.get_word()
+            get_command(SimpleNamespace(bot=bot, prefix='!', view=view, locale=locale))
+
+    # Reading the prefix and the first word is done by discord.py for every message, aliases or not
+    setup = best_of(args.rounds, lambda: resolve(lambda ctx: ctx))
+    seconds = best_of(args.rounds, lambda: resolve(aliaser.get_command))
+    print(f'{args.messages} messages over {len(aliaser.localization_table)} locales, best of {args.rounds}')
+    print(f'  view setup only   {per_op(setup, args.messages)}')
+    print(f'  alias resolution  {per_op(seconds - setup, args.messages)}  (without the view setup)')
+
+
+def lavalink_track(index):
+    """ A track the way a lavalink search returns it, encoded as json like on the wire """
+    return json.dumps({
+        'track': f'QAAAjQIAJVJpY2sgQXN0bGV5IC0gTmV2ZXIgR29ubmEgR2l2ZSBZb3UgVXAADlJpY2tBc3RsZXlWRVZP{index:08d}',
+        'info': {
+            'identifier': f'id{index:08d}',
+            'isSeekable': True,
+            'author': f'Artist {index % 97}',
+            'length': 210000,
+            'isStream': False,
+            'position': 0,
+            'title': f'Artist {index % 97} - Song {index}',
+            'uri': f'https://www.youtube.com/watch?v=id{index:08d}'
+        }
+    })
+
+
+def retained(build, payloads):
+    """ Bytes still allocated once every payload is decoded and turned into a queue entry """
+    gc.collect()
+    tracemalloc.start()
+    queue = [build(json.loads(payload), index % 50) for index, payload in enumerate(payloads)]
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del queue
+    return size
+
+
+def bench_memory(args):
+    rng = random.Random(args.seed)
+    distinct = [lavalink_track(index) for index in range(args.distinct or args.tracks)]
+    payloads = [rng.choice(distinct) for _ in range(args.tracks)] if args.distinct else distinct
+    thumbnail = 'https://i.ytimg.com/vi/{}/hqdefault.jpg'
+
+    # The queue held the AudioTracks music.py built, with the thumbnail url in their extra dict
+    entries = {
+        'AudioTrack': lambda data, requester: AudioTrack(
+            data, requester, thumbnail_url=thumbnail.format(data['info']['identifier'])),
+        'QueuedTrack': lambda data, requester: QueuedTrack.from_dict(
+            data, requester, thumbnail_url=thumbnail.format(data['info']['identifier']))
+    }
+    print(f'{args.tracks} queued tracks, {len(distinct)} distinct')
+    for name, build in entries.items():
+        size = retained(build, payloads)
+        print(f'  {name:<12} {size / 2 ** 20:8.1f}MiB  {size / args.tracks:6.0f}B/track')
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(prog='Shite Music Bot benchmarks', description='Times single components of the bot',
+                            formatter_class=RawTextHelpFormatter)
+    parser.add_argument("--seed", type=int, default=0, help='Seed of the generated data')
+    benchmarks = parser.add_subparsers(dest='benchmark', required=True)
+
+    settings = benchmarks.add_parser('settings', help='Settings storage engines')
+    settings.add_argument("--guilds", type=int, default=10000, help='Guilds with stored settings')
+    settings.add_argument("--ops", type=int, default=10000, help='Lookups and changes timed per engine')
+    settings.set_defaults(run=bench_settings)
+
+    paginator = benchmarks.add_parser('paginator', help='Localized queue pages')
+    paginator.add_argument("--tracks", type=int, default=1000, help='Tracks in the queue')
+    paginator.add_argument("--rounds", type=int, default=20, help='Builds timed, the fastest is reported')
+    paginator.set_defaults(run=bench_paginator)
+
+    aliases = benchmarks.add_parser('aliases', help='Alias resolution of incoming commands')
+    aliases.add_argument("--messages", type=int, default=100000, help='Messages resolved, spread over every locale')
+    aliases.add_argument("--rounds", type=int, default=5, help='Runs timed, the fastest is reported')
+    aliases.set_defaults(run=bench_aliases)
+
+    memory = benchmarks.add_parser('memory', help='Memory held by queued tracks')
+    memory.add_argument("--tracks", type=int, default=100000, help='Tracks in the queues')
+    memory.add_argument("--distinct", type=int, default=0,
+                        help='Different tracks drawn from, 0 makes every queued track different')
+    memory.set_defaults(run=bench_memory)
+
+    arguments = parser.parse_args()
+    arguments.run(arguments)
@@ -2,28 +2,38 @@
 import discord
 from discord.ext import commands
 
+import asyncio
 import codecs
 import os
+import sys
 import time
 import traceback
 from argparse import ArgumentParser, RawTextHelpFormatter
+from contextlib import nullcontext
 
-import aiohttp
 import yaml
 
 # Bot Utilities
 from cogs.utils.alias import Aliaser
+from cogs.utils.cache import LRUCache, PersistentCache
+from cogs.utils.cluster import Cluster, ClusterLauncher, shard_ids
 from cogs.utils.context import Context
+from cogs.utils.localefiles import LocaleFiles
 from cogs.utils.localizer import Localizer, LocalizerWrapper
 from cogs.utils.logger import BotLogger
+from cogs.utils.metrics import MetricsRegistry
+from cogs.utils.reactionrouter import ReactionRouter
 from cogs.utils.settingsmanager import Settings
+from cogs.utils.tracer import Tracer, span
+from cogs.utils.webclient import WebClient
 
 initial_extensions = [
     'cogs.errors',
     'cogs.cogs',
     'cogs.settings',
     'cogs.misc',
-    'cogs.helpformatter'
+    'cogs.helpformatter',
+    'cogs.metrics'
 ]
 
 on_ready_extensions = [
@@ -35,20 +45,55 @@ def _get_prefix(bot, message):
     if not message.guild:
         prefix = bot.settings.default_prefix
         return commands.when_mentioned_or(prefix)(bot, message)
-    prefixes = bot.settings.get(message.guild, 'prefixes', 'default_prefix')
+    prefixes = bot.settings.resolve(message.guild).prefixes
     return commands.when_mentioned_or(*prefixes)(bot, message)
 
 
-class Bot(commands.Bot):
-    def __init__(self, datadir, debug: bool = False):
+class Bot(commands.AutoShardedBot):
+    def __init__(self, datadir, debug: bool = False, cluster: Cluster = None, shard_count: int = None):
+        if cluster is None:
+            cluster = Cluster()
+        # A single process lets discord pick the shard count, clusters split the configured shards between them
+        shards = shard_ids(cluster.cluster_id, cluster.clusters, shard_count) if shard_count else None
         super().__init__(command_prefix=_get_prefix,
-                         description=conf["bot"]["description"])
+                         description=conf["bot"]["description"],
+                         shard_count=shard_count, shard_ids=shards)
+        self.cluster = cluster
 
-        self.settings = Settings(datadir, **conf['default server settings'])
+        self.settings = Settings(datadir, storage=conf.get('settings storage', 'yaml'),
+                                 **conf['default server settings'])
         self.APIkeys = conf.get('APIkeys', {})
 
-        self.localizer = Localizer(conf.get('locale path', "./localization"), conf.get('locale', 'en_en'))
-        self.aliaser = Aliaser(conf.get('locale path', "./localization"), conf.get('locale', 'en_en'))
+        thumbnail_conf = conf.get('thumbnail cache', {})
+        track_conf = conf.get('track cache', {})
+        lyrics_conf = conf.get('lyrics cache', {})
+        # Every cluster keeps its own thumbnail file, they would overwrite each other otherwise
+        thumbnail_file = 'thumbnails.json' if cluster.clusters <= 1 else f'thumbnails-{cluster.cluster_id}.json'
+        lyrics_file = 'lyrics.json' if cluster.clusters <= 1 else f'lyrics-{cluster.cluster_id}.json'
+        self.caches = {
+            'thumbnails': PersistentCache(f'{datadir}/cache/{thumbnail_file}', size=thumbnail_conf.get('size', 4096),
+                                          ttl=thumbnail_conf.get('ttl', 604800),
+                                          failure_ttl=thumbnail_conf.get('failure ttl', 3600)),
+            'tracks': LRUCache(size=track_conf.get('size', 1024), ttl=track_conf.get('ttl', 1800),
+                               failure_ttl=track_conf.get('failure ttl', 60)),
+            'lyrics': PersistentCache(f'{datadir}/cache/{lyrics_file}', size=lyrics_conf.get('size', 512),
+                                      ttl=lyrics_conf.get('ttl', 604800),
+                                      failure_ttl=lyrics_conf.get('failure ttl', 3600))
+        }
+
+        self.metrics_conf = conf.get('metrics', {}) or {}
+        self.snapshot_conf = conf.get('snapshots', {}) or {}
+        self.resume_timeout = conf.get('lavalink resume timeout', 60)
+        self.metrics = MetricsRegistry(prefix='musicbot_')
+        self.command_counter = self.metrics.counter('commands_total', 'Commands invoked', ('command', 'status'))
+        self.command_duration = self.metrics.histogram('command_duration_seconds', 'Time spent running commands',
+                                                       ('command',))
+
+        self.locale_files = LocaleFiles()
+        self.localizer = Localizer(conf.get('locale path', "./localization"), conf.get('locale', 'en_en'),
+                                   self.locale_files)
+        self.aliaser = Aliaser(conf.get('locale path', "./localization"), conf.get('locale', 'en_en'),
+                               self.locale_files)
 
         self.datadir = datadir
         self.debug = debug
@@ -56,6 +101,24 @@ class Bot(commands.Bot):
         self.logger = self.main_logger.bot_logger.getChild("Bot")
         self.logger.debug("Debug: %s" % debug)
 
+        tracing_conf = conf.get('tracing', {}) or {}
+        self.tracer = Tracer(sample_rate=tracing_conf.get('sample rate', 0.0),
+                             slow_threshold=tracing_conf.get('slow command', 2.0),
+                             logger=self.main_logger.bot_logger.getChild("Tracer"))
+        web_conf = conf.get('http', {}) or {}
+        self.web = WebClient(metrics=self.metrics, logger=self.main_logger.bot_logger.getChild("Web"),
+                             limit=web_conf.get('connections', 100),
+                             limit_per_host=web_conf.get('connections per host', 10),
+                             dns_ttl=web_conf.get('dns cache ttl', 300), timeout=web_conf.get('timeout', 15),
+                             retries=web_conf.get('retries', 2))
+        self.reaction_router = ReactionRouter(metrics=self.metrics,
+                                              logger=self.main_logger.bot_logger.getChild("ReactionRouter"))
+        for event in ('on_reaction_add', 'on_raw_message_delete', 'on_raw_bulk_message_delete'):
+            self.add_listener(getattr(self.reaction_router, event), event)
+
+        self.before_invoke(self._trace_command_begin)
+        self.after_invoke(self._trace_command_end)
+
         for extension in initial_extensions:
             try:
                 self.load_extension(extension)
@@ -68,18 +131,39 @@ class Bot(commands.Bot):
         await self.process_commands(message)
 
     async def process_commands(self, message):
-        ctx = await self.get_context(message, cls=Context)
+        trace = self.tracer.start()
+        with trace.span('context') if trace is not None else nullcontext():
+            ctx = await self.get_context(message, cls=Context)
+        ctx.trace = trace
 
         # Replace aliases with commands
-        ctx = self.aliaser.get_command(ctx)
+        with span(ctx, 'alias'):
+            ctx = self.aliaser.get_command(ctx)
 
         # Add the localizer
-        if ctx.command and ctx.command.cog_name:
-            ctx.localizer = LocalizerWrapper(self.localizer, ctx.locale, ctx.command.cog_name.lower())
-        else:
-            ctx.localizer = LocalizerWrapper(self.localizer, ctx.locale, None)
+        with span(ctx, 'localizer'):
+            if ctx.command and ctx.command.cog_name:
+                ctx.localizer = LocalizerWrapper(self.localizer, ctx.locale, ctx.command.cog_name.lower(), trace)
+            else:
+                ctx.localizer = LocalizerWrapper(self.localizer, ctx.locale, None, trace)
 
+        start = time.perf_counter()
         await self.invoke(ctx)
+        if ctx.command is not None:
+            name = ctx.command.qualified_name
+            self.command_counter.inc(command=name, status='failed' if ctx.command_failed else 'completed')
+            self.command_duration.observe(time.perf_counter() - start, command=name)
+            if trace is not None:
+                trace.name = name
+                self.tracer.finish(trace)
+
+    async def _trace_command_begin(self, ctx):
+        if ctx.trace is not None:
+            ctx.trace.begin('command')
+
+    async def _trace_command_end(self, ctx):
+        if ctx.trace is not None:
+            ctx.trace.end('command')
 
     async def on_ready(self):
         if not hasattr(self, 'uptime'):
@@ -97,11 +181,35 @@ class Bot(commands.Bot):
         print(f'Version: {discord.__version__}\n')
         self.logger.debug("Bot Ready\n\n\n")
 
-        self.session = aiohttp.ClientSession(loop=self.loop)
         await self.change_presence(activity=discord.Game(type=0,
                                                          name=conf["bot"]["playing status"]),
                                    status=discord.Status.online)
 
+    def save_caches(self):
+        for cache in self.caches.values():
+            if isinstance(cache, PersistentCache):
+                cache.save()
+
+    async def start(self, *args, **kwargs):
+        await self.cluster.connect()
+        await super().start(*args, **kwargs)
+
+    async def close(self):
+        snapshots = self.get_cog('Snapshots')
+        if snapshots is not None and snapshots.interval:
+            try:
+                await snapshots.save()
+            except Exception:
+                self.logger.exception("Saving the players failed")
+        self.settings.close()
+        self.save_caches()
+        if hasattr(self, 'lyrics'):
+            self.lyrics.close()
+        self.reaction_router.close()
+        await self.cluster.close()
+        await self.web.close()
+        await super().close()
+
     def run(self):
         try:
             super().run(conf["bot"]["token"], reconnect=True)
@@ -111,8 +219,8 @@ class Bot(commands.Bot):
             print(e)
 
 
-def run_bot(datadir, debug: bool = False):
-    bot = Bot(datadir, debug=debug)
+def run_bot(datadir, debug: bool = False, cluster: Cluster = None, shard_count: int = None):
+    bot = Bot(datadir, debug=debug, cluster=cluster, shard_count=shard_count)
     bot.run()
 
 
@@ -123,6 +231,9 @@ if __name__ == '__main__':
 
     parser.add_argument("-D", "--debug", action='store_true', help='Sets debug to true')
     parser.add_argument("-d", "--data-directory", help='Define an alternate data directory location')
+    parser.add_argument("--clusters", type=int, help='Amount of bot processes, overrides the config')
+    parser.add_argument("--shards", type=int, help='Total amount of shards, overrides the config')
+    parser.add_argument("--cluster-id", type=int, help='Used by the launcher to start a single cluster')
 
     args = parser.parse_args()
     if args.debug or os.environ.get('debug'):
@@ -140,5 +251,34 @@ if __name__ == '__main__':
     with codecs.open(f"{datadir}/config.yaml", 'r', encoding='utf8') as f:
         conf = yaml.load(f, Loader=yaml.SafeLoader)
 
-    logger = BotLogger(is_debug, conf.get('log_path', f'{datadir}/logs'))
-    run_bot(debug=is_debug, datadir=datadir)
+    cluster_conf = conf.get('cluster', {}) or {}
+    clusters = args.clusters or cluster_conf.get('clusters') or 1
+    shard_count = args.shards or cluster_conf.get('shards')
+    ipc_port = cluster_conf.get('ipc port', 8765)
+    log_path = conf.get('log_path', f'{datadir}/logs')
+
+    if clusters > 1:
+        if not shard_count:
+            parser.error('Running several clusters needs a shard count')
+        if conf.get('settings storage', 'yaml') != 'sqlite':
+            parser.error('Running several clusters needs "settings storage: sqlite"')
+
+    if clusters > 1 and args.cluster_id is None:
+        logger = BotLogger(is_debug, log_path)
+        # Import settings.yaml before the workers start, so they don't race to do it
+        Settings(datadir, storage='sqlite', **conf['default server settings']).close()
+
+        argv = [sys.argv[0], '--data-directory', datadir, '--clusters', str(clusters), '--shards', str(shard_count)]
+        if is_debug:
+            argv.append('--debug')
+        launcher = ClusterLauncher(argv, clusters, shard_count, port=ipc_port,
+                                   identify_delay=cluster_conf.get('identify delay', 5.0),
+                                   logger=logger.bot_logger.getChild("Cluster"))
+        asyncio.run(launcher.run())
+    else:
+        if args.cluster_id is not None:
+            log_path = f'{log_path}/cluster-{args.cluster_id}'
+        logger = BotLogger(is_debug, log_path)
+        cluster = Cluster(args.cluster_id or 0, clusters, port=ipc_port if clusters > 1 else None,
+                          logger=logger.bot_logger.getChild("Cluster"))
+        run_bot(debug=is_debug, datadir=datadir, cluster=cluster, shard_count=shard_count)
@@ -119,7 +119,7 @@ class Help(commands.Cog):
         ctx.view.skip_ws()
         v = ctx.view
         invoker = v.buffer[v.index:v.end]
-        ctx = self.bot.aliaser.get_subcommand(ctx, group=None, parents=[])
+        ctx = self.bot.aliaser.get_subcommand(ctx)
         command = v.buffer[v.index:v.end]
 
         ctx = prefix_cleaner(ctx)
@@ -0,0 +1,103 @@
+"""
+Serves the bot metrics over http for prometheus to scrape
+"""
+
+# Discord Packages
+from discord.ext import commands, tasks
+
+import asyncio
+
+from aiohttp import web
+
+
+class Metrics(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        self.logger = self.bot.main_logger.bot_logger.getChild("Metrics")
+        self.runner = None
+
+        metrics = self.bot.metrics
+        metrics.gauge('gateway_latency_seconds', 'Discord websocket latency').set_function(self.gateway_latency)
+        metrics.gauge('guilds', 'Guilds the bot is in').set_function(lambda: len(self.bot.guilds))
+        metrics.gauge('players', 'Players per lavalink node', ('node',)).set_function(
+            lambda: self.per_node(lambda player: 1))
+        metrics.gauge('listeners', 'Listeners per lavalink node', ('node',)).set_function(
+            lambda: self.per_node(lambda player: len(player.listeners)))
+        metrics.gauge('queued_tracks', 'Queued tracks per lavalink node', ('node',)).set_function(
+            lambda: self.per_node(lambda player: len(player.queue)))
+        metrics.gauge('cache_entries', 'Entries per cache', ('cache',)).set_function(
+            lambda: self.per_cache('entries'))
+        metrics.counter('cache_hits_total', 'Cache hits', ('cache',)).set_function(lambda: self.per_cache('hits'))
+        metrics.counter('cache_misses_total', 'Cache misses', ('cache',)).set_function(
+            lambda: self.per_cache('misses'))
+        metrics.counter('cache_coalesced_total', 'Lookups that waited on a fetch already running', ('cache',)) \
+            .set_function(lambda: self.per_cache('coalesced'))
+        metrics.gauge('cache_hit_ratio', 'Share of cache lookups that were hits', ('cache',)).set_function(
+            lambda: self.per_cache('hit_rate'))
+        metrics.gauge('open_menus', 'Interactive menus waiting for reactions').set_function(
+            lambda: len(self.bot.reaction_router))
+        self.loop_lag = metrics.gauge('event_loop_lag_seconds', 'Delay of the last event loop probe')
+
+        self.probe_loop_lag.start()
+        port = self.bot.metrics_conf.get('port')
+        if port:
+            # Every cluster serves its own metrics, on the configured port offset by its cluster id
+            port += self.bot.cluster.cluster_id
+            self.bot.loop.create_task(self.start_server(self.bot.metrics_conf.get('host', '127.0.0.1'), port))
+
+    def cog_unload(self):
+        self.probe_loop_lag.cancel()
+        if self.runner is not None:
+            self.bot.loop.create_task(self.runner.cleanup())
+
+    def gateway_latency(self):
+        latency = self.bot.latency
+        # Latency is nan or inf until the first heartbeat
+        return latency if latency == latency and latency != float('inf') else 0.0
+
+    def per_node(self, value):
+        lavalink = getattr(self.bot, 'lavalink', None)
+        if lavalink is None:
+            return {}
+        values = {(node.name,): 0 for node in lavalink.node_manager.nodes}
+        for player in lavalink.player_manager.players.values():
+            key = (player.node.name,)
+            values[key] = values.get(key, 0) + value(player)
+        return values
+
+    def per_cache(self, stat):
+        return {(name,): cache.stats[stat] for name, cache in self.bot.caches.items()}
+
+    @tasks.loop(seconds=5.0)
+    async def probe_loop_lag(self):
+        interval = 0.1
+        start = self.bot.loop.time()
+        await asyncio.sleep(interval)
+        self.loop_lag.set(max(self.bot.loop.time() - start - interval, 0.0))
+
+    async def start_server(self, host, port):
+        app = web.Application()
+        app.router.add_get('/metrics', self.handle_metrics)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        try:
+            await web.TCPSite(self.runner, host, port).start()
+        except OSError:
+            self.logger.exception("Serving metrics on %s:%s failed" % (host, port))
+            await self.runner.cleanup()
+            self.runner = None
+            return
+        self.logger.info("Serving metrics on http://%s:%s/metrics" % (host, port))
+
+    async def handle_metrics(self, request):
+        try:
+            body = self.bot.metrics.render()
+        except Exception:
+            self.logger.exception("Rendering metrics failed")
+            raise web.HTTPInternalServerError()
+        return web.Response(body=body.encode('utf-8'),
+                            headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+
+def setup(bot):
+    bot.add_cog(Metrics(bot))
@@ -13,6 +13,21 @@ from cogs.utils import bot_version
 class Misc(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.bot.cluster.register('guilds', self.local_guilds)
+        self.bot.cluster.register('musicinfo', self.local_musicinfo)
+
+    async def local_guilds(self):
+        return [guild.name for guild in self.bot.guilds]
+
+    async def local_musicinfo(self):
+        lavalink = getattr(self.bot, 'lavalink', None)
+        if lavalink is None:
+            return {'players': 0, 'listeners': 0}
+
+        listeners = 0
+        for guild, player in lavalink.player_manager.players.items():
+            listeners += len(player.listeners)
+        return {'players': len(lavalink.player_manager.players), 'listeners': listeners}
 
     def get_uptime(self):
         now = time.time()
@@ -41,40 +56,73 @@ class Misc(commands.Cog):
     @commands.is_owner()
     async def _guilds(self, ctx):
         guilds = f"{self.bot.user.name} is in:\n"
-        for guild in self.bot.guilds:
-            guilds += f"{guild.name}\n"
+        for cluster_id, names in await self.bot.cluster.query('guilds'):
+            if self.bot.cluster.clusters > 1:
+                guilds += f"**Cluster {cluster_id}:**\n"
+            for name in names or []:
+                guilds += f"{name}\n"
         await ctx.send(guilds)
 
+    @commands.command(name='cachestats', hidden=True)
+    @commands.is_owner()
+    async def _cache_stats(self, ctx):
+        embed = discord.Embed(title='Caches', color=ctx.me.color)
+        for name, cache in self.bot.caches.items():
+            stats = cache.stats
+            embed.add_field(name=name, value=f'**Entries:** {stats["entries"]}\n **Hits:** {stats["hits"]}\n '
+                                             f'**Misses:** {stats["misses"]}\n **Coalesced:** {stats["coalesced"]}\n '
+                                             f'**Hit rate:** {stats["hit_rate"]:.1%}')
+        await ctx.send(embed=embed)
+
     @commands.command()
     async def musicinfo(self, ctx):
         """
         Info about the music player
         """
         embed = discord.Embed(title='{music.title}', color=ctx.me.color)
-        lavalink = self.bot.lavalink
-
-        listeners = 0
-        for guild, player in lavalink.player_manager.players.items():
-            listeners += len(player.listeners)
+        players = listeners = 0
+        for cluster_id, info in await self.bot.cluster.query('musicinfo'):
+            if info is not None:
+                players += info['players']
+                listeners += info['listeners']
 
-        embed.add_field(name='{music.players}', value=f'{len(lavalink.player_manager.players)}')
+        embed.add_field(name='{music.players}', value=f'{players}')
         embed.add_field(name='{music.listeners}', value=f'{listeners}')
         embed = ctx.localizer.format_embed(embed)
         await ctx.send(embed=embed)
 
+    @commands.command(name='tracestats', hidden=True)
+    @commands.is_owner()
+    async def _trace_stats(self, ctx, *, command: str = None):
+        tracer = self.bot.tracer
+        embed = discord.Embed(color=ctx.me.color)
+        if command is None:
+            embed.title = 'Traced commands'
+            traced = tracer.commands()
+            embed.description = '\n'.join(f'`{name}`: {count}' for name, count in sorted(traced.items())) or \
+                f'Nothing traced yet, the sample rate is {tracer.sample_rate:.0%}'
+            return await ctx.send(embed=embed)
+
+        embed.title = f'Stage timings of {command}'
+        stats = tracer.percentiles(command)
+        for stage, (count, (p50, p90, p99)) in stats.items():
+            embed.add_field(name=stage, value=f'**p50:** {p50 * 1000:.1f}ms\n **p90:** {p90 * 1000:.1f}ms\n '
+                                              f'**p99:** {p99 * 1000:.1f}ms\n **Samples:** {count}')
+        if not stats:
+            embed.description = 'No traces for this command'
+        await ctx.send(embed=embed)
+
     @commands.command(name="reloadlocale")
     @commands.is_owner()
     async def reload_locale(self, ctx):
-        self.bot.localizer.index_localizations()
-        self.bot.localizer.load_localizations()
-        await ctx.send("Localizations reloaded.")
+        changed = self.bot.localizer.refresh()
+        await ctx.send(f"Localizations reloaded: {', '.join(changed) or 'no changes'}.")
 
     @commands.command(name="reloadalias")
     @commands.is_owner()
     async def reload_alias(self, ctx):
-        self.bot.aliaser.index_localizations()
-        self.bot.aliaser.load_localizations()
-        await ctx.send("Aliases reloaded.")
+        changed = self.bot.aliaser.refresh()
+        await ctx.send(f"Aliases reloaded: {', '.join(changed) or 'no changes'}.")
 
     @commands.command()
     async def info(self, ctx):
@@ -3,42 +3,72 @@ Music commands
 """
 # Discord Packages
 import discord
-import lavalink
-from discord.ext import commands
+from discord.ext import commands, tasks
 
 import asyncio
-import json
 import math
 import re
-import urllib
+import time
 from typing import Optional
 
-from bs4 import BeautifulSoup
-
 from .utils import checks, thumbnailer, timeformatter
-from .utils.paginator import QueuePaginator, Scroller, TextPaginator
+from .utils.cache import PersistentCache
+from .utils.lyrics import Lyrics, clean_title
+from .utils.mixplayer import QueuedTrack
+from .utils.paginator import LazyQueuePaginator, Scroller, TextPaginator
 from .utils.selector import Selector
+from .utils.tracer import span
 
 time_rx = re.compile('[0-9]+')
 url_rx = re.compile('https?:\\/\\/(?:www\\.)?.+')
+space_rx = re.compile('\\s+')
+
+
+def normalize_query(query: str):
+    """ Search queries are matched case insensitively, urls are kept as is. """
+    query = space_rx.sub(' ', query.strip())
+    if url_rx.match(query):
+        return query
+    source, _, terms = query.partition(':')
+    return f'{source.lower()}:{terms.strip().lower()}'
 
 
 class Music(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.logger = self.bot.main_logger.bot_logger.getChild("Music")
+        self.persist_caches.start()
+
+        if not hasattr(bot, 'lyrics'):
+            bot.lyrics = Lyrics(bot, bot.caches['lyrics'])
+
+        self.rest_latency = self.bot.metrics.histogram('lavalink_rest_seconds', 'Lavalink track lookup latency',
+                                                       ('node',))
+        self.tracks_queued = self.bot.metrics.counter('tracks_queued_total', 'Tracks added to queues')
+
+    def cog_unload(self):
+        self.persist_caches.cancel()
+        self.bot.save_caches()
+
+    @tasks.loop(minutes=5.0)
+    async def persist_caches(self):
+        for cache in self.bot.caches.values():
+            if isinstance(cache, PersistentCache) and cache.dirty:
+                await self.bot.loop.run_in_executor(None, cache.write, cache.dump())
 
     async def cog_check(self, ctx):
         if not ctx.guild:
             raise commands.NoPrivateMessage
-        textchannels = self.bot.settings.get(ctx.guild, 'channels.text', [])
+        with span(ctx, 'cog_check'):
+            textchannels = self.bot.settings.resolve(ctx.guild).text_channels
         if textchannels:
             if ctx.channel.id not in textchannels:
                 return False
         return True
 
     async def cog_before_invoke(self, ctx):
-        await self.ensure_voice(ctx)
+        with span(ctx, 'ensure_voice'):
+            await self.ensure_voice(ctx)
 
     async def connect_to(self, guild_id: int, channel_id: str):
         """ Connects to the given voicechannel ID. A channel_id of `None` means disconnect. """
@@ -54,7 +84,7 @@ class Music(commands.Cog):
         if not url_rx.match(query):
             query = f'ytsearch:{query}'
 
-        results = await player.node.get_tracks(query)
+        results = await self.get_tracks(player.node, query)
 
         if not results or not results['tracks']:
             return await ctx.send(ctx.localizer.format_str("{nothing_found}"))
@@ -66,21 +96,20 @@ class Music(commands.Cog):
 
             maxlength = self.max_track_length(ctx.guild, player)
             if maxlength:
-                numtracks = 0
-                for track in tracks:
-                    if track['info']['length'] <= maxlength:
-                        thumbnail_url = await thumbnailer.ThumbNailer.identify(
-                            self, track['info']['identifier'], track['info']['uri'])
-                        track = lavalink.models.AudioTrack(track, ctx.author.id, thumbnail_url=thumbnail_url)
-                        player.add(requester=ctx.author.id, track=track)
-                        numtracks += 1
-            else:
-                numtracks = len(tracks)
-                for track in tracks:
-                    thumbnail_url = await thumbnailer.ThumbNailer.identify(
-                        self, track['info']['identifier'], track['info']['uri'])
-                    track = lavalink.models.AudioTrack(track, ctx.author.id, thumbnail_url=thumbnail_url)
-                    player.add(requester=ctx.author.id, track=track)
+                tracks = [track for track in tracks if track['info']['length'] <= maxlength]
+
+            tracks = [QueuedTrack.from_dict(track, ctx.author.id, thumbnail_url=thumbnailer.ThumbNailer.youtube(
+                track['info']['identifier'], track['info']['uri'])) for track in tracks]
+            numtracks = player.add_tracks(requester=ctx.author.id, tracks=tracks)
+            self.tracks_queued.inc(numtracks)
+
+            if not player.is_playing:
+                await player.play()
+
+            # Thumbnails that need a lookup are resolved after the tracks are queued
+            unresolved = [track for track in tracks if track.thumbnail_url is None]
+            if unresolved:
+                self.bot.loop.create_task(thumbnailer.ThumbNailer.identify_tracks(self, unresolved))
 
             embed.title = '{playlist_enqued}'
             embed.description = f'{results["playlistInfo"]["name"]} - {numtracks} {{tracks}}'
@@ -131,9 +160,10 @@ class Music(commands.Cog):
         player.add_skipper(ctx.author)
         total = len(player.listeners)
         skips = len(player.skip_voters)
-        threshold = self.bot.settings.get(ctx.guild, 'vote_threshold', 'default_threshold')
+        threshold = self.bot.settings.resolve(ctx.guild).threshold
 
-        if skips/total >= threshold/100 or player.current.requester == ctx.author.id:
+        # Nobody counts as listening until the voice states are known, only the requester can skip then
+        if total and skips/total >= threshold/100 or player.current.requester == ctx.author.id:
             await player.skip()
             if player.current:
                 song = f'**[{player.current.title}]({player.current.uri})**'
@@ -233,14 +263,13 @@ class Music(commands.Cog):
             return await ctx.send(embed=embed)
 
         if user is None:
-            queue = player.global_queue()
-            pagified_queue = QueuePaginator(ctx.localizer, queue, color=ctx.me.color)
+            pagified_queue = LazyQueuePaginator(ctx.localizer, player.queue, color=ctx.me.color)
 
         else:
-            user_queue = player.user_queue(user.id, dual=True)
-            if not user_queue:
+            if not player.user_queue(user.id):
                 return await ctx.send(ctx.localizer.format_str("{queue.empty}", _user=user.name))
-            pagified_queue = QueuePaginator(ctx.localizer, user_queue, color=ctx.me.color, user_name=user.name)
+            pagified_queue = LazyQueuePaginator(ctx.localizer, player.queue, color=ctx.me.color, requester=user.id,
+                                                user_name=user.name)
 
         scroller = Scroller(ctx, pagified_queue)
         await scroller.start_scrolling()
@@ -250,11 +279,11 @@ class Music(commands.Cog):
         """ Shows your queue. """
         player = self.bot.lavalink.player_manager.get(ctx.guild.id)
 
-        user_queue = player.user_queue(ctx.author.id, dual=True)
-        if not user_queue:
+        if not player.user_queue(ctx.author.id):
             return await ctx.send(ctx.localizer.format_str("{my_queue}"))
 
-        pagified_queue = QueuePaginator(ctx.localizer, user_queue, color=ctx.me.color, user_name=ctx.author.name)
+        pagified_queue = LazyQueuePaginator(ctx.localizer, player.queue, color=ctx.me.color, requester=ctx.author.id,
+                                            user_name=ctx.author.name)
         scroller = Scroller(ctx, pagified_queue)
         await scroller.start_scrolling()
 
@@ -329,7 +358,7 @@ class Music(commands.Cog):
         # Create a nice embed explaining what happened
         song = f'**[{moved.title}]({moved.uri})**'
         embed = discord.Embed(color=ctx.me.color, description=song, title='{moved.moved}')
-        thumbnail_url = moved.extra["thumbnail_url"]
+        thumbnail_url = moved.thumbnail_url
         member = ctx.guild.get_member(moved.requester)
         if thumbnail_url:
             embed.set_thumbnail(url=thumbnail_url)
@@ -433,7 +462,7 @@ class Music(commands.Cog):
         if not query.startswith('ytsearch:') and not query.startswith('scsearch:'):
             query = 'ytsearch:' + query
 
-        results = await player.node.get_tracks(query)
+        results = await self.get_tracks(player.node, query)
 
         embed = discord.Embed(description='{nothing_found}', color=0x36393F)
         if not results or not results['tracks']:
@@ -555,7 +584,7 @@ class Music(commands.Cog):
         description = ctx.localizer.format_str("{history.current}", _title=track.title, _uri=track.uri,
                                                _id=track.requester) + '\n\n'
         description += ctx.localizer.format_str("{history.previous}", _len=len(history)-1) + '\n'
-        thumbnail_url = track.extra["thumbnail_url"]
+        thumbnail_url = track.thumbnail_url
         for index, track in enumerate(history[1:], start=1):
             description += ctx.localizer.format_str("{history.track}", _index=-index, _title=track.title,
                                                     _uri=track.uri, _id=track.requester) + '\n'
@@ -573,56 +602,42 @@ class Music(commands.Cog):
 
         player = self.bot.lavalink.player_manager.get(ctx.guild.id)
 
-        genius_access_token = self.bot.APIkeys.get('genius', None)
-
-        if genius_access_token is None:
+        if self.bot.lyrics.token is None:
             return await ctx.send('Missing API key')
 
-        excluded_words = ['music', 'video', 'version', 'original', 'lyrics', 'lyric',
-                          'official', 'live', 'instrumental', 'audio', 'hd']
-
         query = ' '.join(query)
 
         if not query and player.is_playing:
-            query = player.current.title
-            query = re.sub(r'[-()_\[\]]', '', query)
-            filtered_words = [word for word in query.split() if word.lower() not in excluded_words]
-            query = ' '.join(filtered_words)
-
-        async def get_site_content(url):
-            async with self.bot.session.get(url) as resp:
-                response = await resp.read()
-            return response.decode('utf-8')
+            query = clean_title(player.current.title)
 
-        embed = discord.Embed(description=':mag_right:')
-        status_msg = await ctx.send(embed=embed)
+        # Lyrics of the playing and next track are usually prefetched, only show the search when they weren't
+        status_msg = None
+        if not self.bot.lyrics.cached(query):
+            embed = discord.Embed(description=':mag_right:')
+            status_msg = await ctx.send(embed=embed)
 
         try:
-            url = 'https://api.genius.com/search?' + urllib.parse.urlencode(
-                {'access_token': genius_access_token, 'q': query})
-            result = await get_site_content(url)
-            response = json.loads(result)
-            song_id = response['response']['hits'][0]['result']['id']
-        except Exception:
+            song = await self.bot.lyrics.get(query)
+        except Exception as e:
+            self.logger.debug("Lyrics lookup for %s failed: %s" % (query, e))
+            song = None
+        if song is None:
             embed = discord.Embed(description=':x:', color=0xFF0000)
+            if status_msg is None:
+                return await ctx.send(embed=embed)
             return await status_msg.edit(embed=embed)
 
-        result = await get_site_content(f'https://api.genius.com/songs/{song_id}?access_token={genius_access_token}')
-        song = json.loads(result)['response']['song']
-
-        response = await get_site_content(song['url'])
-        scraped_data = BeautifulSoup(response, 'html.parser')
-        lyrics = scraped_data.find(class_='lyrics').get_text()
-
+        lyrics = song['lyrics']
         paginator = TextPaginator(max_size=2000, max_lines=50, color=0xFFFF64)
         for line in lyrics.split('\n'):
             paginator.add_line(line)
 
-        await status_msg.delete()
+        if status_msg is not None:
+            await status_msg.delete()
 
         paginator.pages[0].url = song['url']
-        paginator.pages[0].title = song['full_title']
-        paginator.pages[0].set_thumbnail(url=song['header_image_thumbnail_url'])
+        paginator.pages[0].title = song['title']
+        paginator.pages[0].set_thumbnail(url=song['thumbnail'])
         paginator.pages[0].set_author(name='Genius', icon_url='https://i.imgur.com/NmCTsoF.png')
 
         if len(paginator.pages) < 4:
@@ -654,56 +669,40 @@ class Music(commands.Cog):
             ('\N{BLACK RIGHT-POINTING DOUBLE TRIANGLE WITH VERTICAL BAR}', player.seek, 1000),
         ]
 
-        selection = None
-        arg = None
-
-        def check(reaction, user):
-            if user is None or user.id != ctx.author.id:
-                return False
-
-            if reaction.message.id != msg.id:
-                return False
-
-            for (emoji, func, _arg) in scrubber:
-                if emoji == reaction.emoji:
-                    nonlocal selection
-                    nonlocal arg
-                    selection = func
-                    arg = _arg
-                    return True
-            return False
+        controls_by_emoji = {emoji: (func, arg) for (emoji, func, arg) in scrubber}
 
         embed.description = '{scrub.add}'
         embed = ctx.localizer.format_embed(embed)
         msg = await ctx.send(embed=embed)
+        # Opened before the reactions are added, so reactions made while they are added are not lost
+        session = self.bot.reaction_router.open(msg.id, ctx.author.id, controls_by_emoji, 15.0)
 
-        for (emoji, _, _) in scrubber:
-            await msg.add_reaction(emoji)
+        with session:
+            for (emoji, _, _) in scrubber:
+                await msg.add_reaction(emoji)
+
+            embed.description = controls
+            embed = ctx.localizer.format_embed(embed)
+            await msg.edit(embed=embed)
+            while True:
+                try:
+                    reaction, user = await session.wait()
+                except asyncio.TimeoutError:
+                    try:
+                        await msg.delete()
+                        await ctx.message.delete()
+                    except discord.Forbidden:
+                        pass
+                    except discord.HTTPException:
+                        pass
+                    finally:
+                        break
 
-        embed.description = controls
-        embed = ctx.localizer.format_embed(embed)
-        await msg.edit(embed=embed)
-        scrubbing = True
-        while scrubbing:
-            try:
-                reaction, user = await self.bot.wait_for('reaction_add', timeout=15.0, check=check)
-            except asyncio.TimeoutError:
-                # PEP8EDIT scrolling = False
                 try:
-                    await msg.delete()
-                    await ctx.message.delete()
+                    await msg.remove_reaction(reaction, user)
                 except discord.Forbidden:
                     pass
-                except discord.HTTPException:
-                    pass
-                finally:
-                    break
-
-            try:
-                await msg.remove_reaction(reaction, user)
-            except discord.Forbidden:
-                pass
-            if selection is not None:
+                selection, arg = controls_by_emoji[reaction.emoji]
                 if not isinstance(arg, bool):
                     arg = player.position + arg * 1000
                 await selection(arg)
@@ -717,8 +716,11 @@ class Music(commands.Cog):
         except AttributeError:
             region = ctx.guild.region
 
-        player = self.bot.lavalink.player_manager.create(ctx.guild.id, endpoint=region)
-        # Create returns a player if one exists, otherwise creates.
+        player = self.bot.lavalink.player_manager.get(ctx.guild.id)
+        if player is None:
+            # New players go to the least loaded node, preferably in the region of the guild
+            node = self.bot.node_selector.select(region)
+            player = self.bot.lavalink.player_manager.create(ctx.guild.id, endpoint=region, node=node)
 
         # Add commands that require joining voice to work.
         should_connect = ctx.command.callback.__name__ in ('_play', '_find', '_search', '_sk')
@@ -743,7 +745,7 @@ class Music(commands.Cog):
             if not permissions.connect or not permissions.speak:  # Check user limit too?
                 raise commands.CommandInvokeError('I need the `CONNECT` and `SPEAK` permissions.')
 
-            voice_channels = self.bot.settings.get(ctx.guild, 'channels.music', [])
+            voice_channels = self.bot.settings.resolve(ctx.guild).music_channels
 
             if voice_channels:
                 if voice_channel.id not in voice_channels:
@@ -762,6 +764,27 @@ class Music(commands.Cog):
             if int(player.channel_id) != ctx.author.voice.channel.id:
                 raise commands.CommandInvokeError('You need to be in my voicechannel.')
 
+    async def get_tracks(self, node, query):
+        """ Resolves a query through lavalink, results are shared between guilds for a while. """
+        cache = self.bot.caches['tracks']
+        key = normalize_query(query)
+        fetched = False
+
+        async def fetch():
+            nonlocal fetched
+            fetched = True
+            start = time.perf_counter()
+            try:
+                return await node.get_tracks(query)
+            finally:
+                self.rest_latency.observe(time.perf_counter() - start, node=node.name)
+
+        results = await cache.get_or_fetch(key, fetch)
+        # Only a fresh lookup sets the entry, a cached failure has to expire instead of being kept alive
+        if fetched and (not results or not results.get('tracks')):
+            cache.set(key, results, ttl=cache.failure_ttl)
+        return results
+
     async def enqueue(self, ctx, track, embed):
         player = self.bot.lavalink.player_manager.get(ctx.guild.id)
 
@@ -775,24 +798,20 @@ class Music(commands.Cog):
         if isinstance(track, dict):
             thumbnail_url = await thumbnailer.ThumbNailer.identify(
                 self, track['info']['identifier'], track['info']['uri'])
-            track = lavalink.models.AudioTrack(track, ctx.author.id, thumbnail_url=thumbnail_url)
+            track = QueuedTrack.from_dict(track, ctx.author.id, thumbnail_url=thumbnail_url)
 
         track, pos_global, pos_local = player.add(requester=ctx.author.id, track=track)
+        self.tracks_queued.inc()
 
         if player.current is not None:
-            queue_duration = 0
-            for i, track in enumerate(player.queue):
-                if i == pos_global:
-                    break
-                queue_duration += int(track.duration)
-
+            queue_duration = player.queue.duration_until(pos_global)
             until_play = queue_duration + player.current.duration - player.position
             until_play = timeformatter.format_ms(until_play)
             embed.add_field(name="{enqueue.position}", value=f"`{pos_local + 1}({pos_global + 1})`", inline=True)
             embed.add_field(name="{enqueue.playing_in}", value=f"`{until_play} ({{enqueue.estimated}})`", inline=True)
 
         embed.title = '{enqueue.enqueued}'
-        thumbnail_url = track.extra["thumbnail_url"]
+        thumbnail_url = track.thumbnail_url
 
         if thumbnail_url:
             embed.set_thumbnail(url=thumbnail_url)
@@ -803,8 +822,9 @@ class Music(commands.Cog):
         return embed
 
     def max_track_length(self, guild, player):
-        is_dynamic = self.bot.settings.get(guild, 'duration.is_dynamic', 'default_duration_type')
-        maxlength = self.bot.settings.get(guild, 'duration.max', None)
+        resolved = self.bot.settings.resolve(guild)
+        is_dynamic = resolved.is_dynamic
+        maxlength = resolved.max_duration
         if maxlength is None:
             return None
         if len(player.listeners):  # Avoid division by 0.
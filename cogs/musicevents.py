@@ -7,33 +7,60 @@ import lavalink
 import lavalink.events
 from discord.ext import commands, tasks
 
+# Bot Utilities
+from cogs.utils.idlescheduler import IdleScheduler
+from cogs.utils.lyrics import clean_title
+
 
 class MusicEvents(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.leave_timer.start()
+        self.node_health.start()
         self.logger = self.bot.main_logger.bot_logger.getChild("Errors")
+        self.idle = IdleScheduler(self.leave_idle, logger=self.bot.main_logger.bot_logger.getChild("IdleScheduler"))
+        self.idle.start()
+
+        self.tracks_started = self.bot.metrics.counter('tracks_started_total', 'Tracks started', ('node',))
+        self.node_disconnects = self.bot.metrics.counter('node_disconnects_total', 'Lavalink node disconnects',
+                                                         ('node',))
+        self.node_changes = self.bot.metrics.counter('player_node_changes_total', 'Players moved to another node')
         bot.lavalink.add_event_hook(self.track_hook)
 
     def cog_unload(self):
+        self.node_health.cancel()
+        self.idle.close()
         self.bot.lavalink._event_hooks.clear()
 
     async def track_hook(self, event):
         if isinstance(event, lavalink.events.TrackEndEvent):
             pass  # Send track ended message to channel.
         if isinstance(event, lavalink.events.TrackStartEvent):
-            pass
+            self.tracks_started.inc(node=event.player.node.name)
+            self.prefetch_lyrics(event.player)
         if isinstance(event, lavalink.events.QueueEndEvent):
-            channel = self.bot.get_channel(event.player.fetch('channel'))
-            await self.check_leave_voice(channel.guild)
+            self.check_idle(event.player)
         if isinstance(event, lavalink.events.PlayerUpdateEvent):
             pass
         if isinstance(event, lavalink.events.NodeDisconnectedEvent):
-            pass
+            self.node_disconnects.inc(node=event.node.name)
+            await self.bot.failover.evacuate(event.node, 'node disconnected (%s: %s)' % (event.code, event.reason))
         if isinstance(event, lavalink.events.NodeConnectedEvent):
-            pass
+            await self.bot.node_sessions.configure(event.node)
         if isinstance(event, lavalink.events.NodeChangedEvent):
-            pass
+            self.node_changes.inc()
+            self.logger.info("Player of guild %s changed node from %s to %s" % (
+                event.player.guild_id, event.old_node.name, event.new_node.name))
+
+    def prefetch_lyrics(self, player):
+        """ Looks up the lyrics of the playing and next track, so !lyrics has them ready """
+        lyrics = getattr(self.bot, 'lyrics', None)
+        if lyrics is None or lyrics.token is None:
+            return
+        if player.current is not None and not player.current.stream:
+            lyrics.prefetch(clean_title(player.current.title))
+        upcoming = next(iter(player.queue), None)
+        if upcoming is not None and not upcoming.stream:
+            lyrics.prefetch(clean_title(upcoming.title))
 
     async def connect_to(self, guild_id: int, channel_id: str):
         """ Connects to the given voicechannel ID. A channel_id of `None` means disconnect. """
@@ -43,39 +70,49 @@ class MusicEvents(commands.Cog):
     @commands.Cog.listener()
     async def on_voice_state_update(self, member, before, after):
         """ Updates listeners when the bot or a user changes voice state """
-        if member.id == self.bot.user.id and after.channel is not None:
+        if member.id == self.bot.user.id:
+            if after.channel is None:
+                self.idle.cancel(member.guild.id)
+                return
             voice_channel = after.channel
             player = self.bot.lavalink.player_manager.get(member.guild.id)
             player.clear_listeners()
             for member in voice_channel.members:
                 if not member.bot:
                     player.update_listeners(member, member.voice)
+            self.check_idle(player)
 
         if not member.bot:
             player = self.bot.lavalink.player_manager.get(member.guild.id)
             if player is not None:
                 player.update_listeners(member, after)
-                await self.check_leave_voice(member.guild)
+                self.check_idle(player)
 
-    async def check_leave_voice(self, guild):
-        """ Checks if the bot should leave the voice channel """
-        # TODO, disconnect timer?
-        player = self.bot.lavalink.player_manager.get(guild.id)
+    def check_idle(self, player):
+        """ Arms the idle deadline of a guild when nobody is listening, and cancels it when someone is """
+        if len(player.listeners) == 0 and player.is_connected:
+            guild = self.bot.get_guild(player.guild_id)
+            timeout = self.bot.settings.resolve(guild).idle_timeout if guild is not None else 0
+            self.idle.arm(player.guild_id, timeout)
+        else:
+            self.idle.cancel(player.guild_id)
+
+    async def leave_idle(self, guild_id):
+        """ Leaves the voice channel if the bot still has no listeners and nothing to play """
+        player = self.bot.lavalink.player_manager.get(guild_id)
+        if player is None:
+            return
         if len(player.listeners) == 0 and player.is_connected:
             if player.queue.empty and player.current is None:
                 await player.stop()
-                await self.connect_to(guild.id, None)
-
-    async def leave_check(self):
-        for player_id in self.bot.lavalink.player_manager.players:
-            await self.check_leave_voice(self.bot.get_guild(player_id))
+                await self.connect_to(guild_id, None)
 
-    @tasks.loop(seconds=10.0)
-    async def leave_timer(self):
+    @tasks.loop(seconds=30.0)
+    async def node_health(self):
         try:
-            await self.leave_check()
-        except Exception as err:
-            self.logger.debug("Error in leave_timer loop.\nTraceback: %s" % (err))
+            await self.bot.failover.check_nodes()
+        except Exception:
+            self.logger.exception("Checking the lavalink nodes failed")
 
 
 def setup(bot):
@@ -11,7 +11,10 @@ import yaml
 # Bot Utilities
 from cogs.helpformatter import commandhelper
 from cogs.utils.paginator import Scroller
+from .utils.failover import Failover
 from .utils.mixplayer import MixPlayer
+from .utils.nodeselector import NodeSelector
+from .utils.nodesessions import NodeSessions
 
 
 class NodeManager(commands.Cog):
@@ -22,11 +25,19 @@ class NodeManager(commands.Cog):
 
         music_extensions = [
             'cogs.music',
-            'cogs.musicevents'
+            'cogs.musicevents',
+            'cogs.snapshots'
         ]
 
         if not hasattr(bot, 'lavalink'):
             bot.lavalink = lavalink.Client(bot.user.id, player=MixPlayer)
+            bot.node_selector = NodeSelector(bot.lavalink)
+            bot.failover = Failover(bot.lavalink, bot.node_selector, logger=self.logger.getChild("Failover"))
+            cluster = bot.cluster
+            filename = 'lavalink_sessions.json' if cluster.clusters <= 1 else \
+                f'lavalink_sessions-{cluster.cluster_id}.json'
+            bot.node_sessions = NodeSessions(f'{bot.datadir}/{filename}', timeout=bot.resume_timeout,
+                                             logger=self.logger.getChild("Sessions"))
 
             self.load_nodes_from_file()
 
@@ -53,13 +64,24 @@ class NodeManager(commands.Cog):
                 if node['name'] in name_cache:
                     continue
 
-                self.bot.lavalink.add_node(**node)
+                self.add_node(**node)
                 self.logger.debug("Adding Lavalink node: %s on %s with the port %s in %s" % (
                     node['name'], node['host'],
                     node['port'], node['region'],))
                 new_nodes.append({**node})
             return new_nodes
 
+    def add_node(self, host, port, password, region, name=None, **kwargs):
+        """ Adds a node with a persisted resume key, so its players survive a restart of the bot """
+        sessions = self.bot.node_sessions
+        # Same default name as lavalink.py gives the node
+        kwargs.setdefault('resume_key', sessions.key(name or f'{region}-{host}:{port}'))
+        kwargs.setdefault('resume_timeout', sessions.timeout)
+        self.bot.lavalink.add_node(host, port, password, region, name=name, **kwargs)
+        node = self.bot.lavalink.node_manager.nodes[-1]
+        sessions.prepare(node)
+        return node
+
     async def _regioner(self, region):
         flags = {
             'us': ':flag_us:',
@@ -87,8 +109,10 @@ class NodeManager(commands.Cog):
 
         if isinstance(node, list):
             for n in node:
+                score = self.bot.node_selector.score(n)
+                score = 'unavailable' if score is None else f'{score:.1f}'
                 embed.add_field(name=f'{await self._regioner(n.region)} **Name:** {n.name}',
-                                value=f'**Host:** {n.host}\n **Port:** {n.port}')
+                                value=f'**Host:** {n.host}\n **Port:** {n.port}\n **Score:** {score}')
 
         if isinstance(node, Node):
             embed.add_field(name=f'{await self._regioner(node.region)} **Name:** {node.name}',
@@ -119,7 +143,7 @@ class NodeManager(commands.Cog):
     @_node.command(name='add')
     @commands.is_owner()
     async def _add(self, ctx, host, port, password, region, name=None):
-        self.bot.lavalink.add_node(host, port, password, region, name)
+        self.add_node(host, port, password, region, name)
         self.logger.debug("Adding Lavalink node: %s on %s with the port %s in %s" % (host, port, region, name,))
         embed = await self._node_presenter(ctx, {'host': host, 'port': port, 'password': password,
                                                  'region': region, 'name': name})
@@ -147,8 +171,11 @@ class NodeManager(commands.Cog):
                 embed = await self._node_presenter(ctx, _node)
                 embed.title = 'Removed node from bot'
                 await ctx.send(embed=embed)
+                await self.bot.failover.evacuate(_node, 'node is being removed')
+                self.bot.failover.forget(_node)
                 self.bot.lavalink.node_manager.remove_node(_node)
                 self.logger.info("Removed Lavalink node: %s" % _node.host)
+                break
         if not sent_feedback:
             await ctx.send('No node found')
 
@@ -28,10 +28,8 @@ class Settings(commands.Cog):
     @commands.guild_only()
     @_set.command(name='serverlocale')
     async def _set_guild_locale(self, ctx, locale):
-        self.bot.localizer.index_localizations()
-        self.bot.aliaser.index_localizations()
-        self.bot.localizer.load_localizations()
-        self.bot.aliaser.load_localizations()
+        self.bot.localizer.refresh()
+        self.bot.aliaser.refresh()
 
         if locale in self.bot.aliaser.localization_table.keys():
 
@@ -195,6 +193,20 @@ class Settings(commands.Cog):
             embed.description = 'Static'
         await ctx.send(embed=embed)
 
+    @checks.is_admin()
+    @commands.guild_only()
+    @_set.command(name='idletimeout')
+    async def set_idle_timeout(self, ctx, timeout: int = None):
+        if timeout is not None and timeout < 0:
+            return await ctx.send('Must be 0 or more')
+
+        self.bot.settings.set(ctx.guild, 'idle_timeout', timeout)
+        timeout = self.bot.settings.get(ctx.guild, 'idle_timeout', 'default_idle_timeout')
+
+        embed = discord.Embed(title='Idle timeout set to', color=ctx.me.color)
+        embed.description = f'{timeout} seconds'
+        await ctx.send(embed=embed)
+
     @commands.guild_only()
     @_set.command(name='current')
     async def current_settings(self, ctx):
@@ -214,6 +226,9 @@ class Settings(commands.Cog):
         is_dynamic = self.bot.settings.get(ctx.guild, 'duration.is_dynamic', 'default_is_dynamic')
         embed.add_field(name='{current.dynamicmax}', value=is_dynamic)
 
+        idle_timeout = self.bot.settings.get(ctx.guild, 'idle_timeout', 'default_idle_timeout')
+        embed.add_field(name='{current.idletimeout}', value=f'{idle_timeout} seconds')
+
         duration = self.bot.settings.get(ctx.guild, 'maxduration')
         if duration:
             embed.add_field(name='{current.maxduration}', value=f'{duration} minutes')
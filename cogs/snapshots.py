@@ -0,0 +1,201 @@
+"""
+Saves the players periodically and restores them when the bot starts again
+"""
+
+# Discord Packages
+import lavalink.events
+from discord.ext import commands, tasks
+
+import asyncio
+import time
+
+# Bot Utilities
+from cogs.utils.snapshots import SnapshotStore, load_queue, load_track
+
+
+class Snapshots(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        self.logger = self.bot.main_logger.bot_logger.getChild("Snapshots")
+
+        conf = self.bot.snapshot_conf
+        self.interval = conf.get('interval', 30)
+        self.max_age = conf.get('max age', 3600)
+        self.concurrency = conf.get('restore concurrency', 20)
+        # Every cluster keeps its own snapshots, like the thumbnail cache
+        cluster = self.bot.cluster
+        filename = 'snapshots.db' if cluster.clusters <= 1 else f'snapshots-{cluster.cluster_id}.db'
+        self.store = SnapshotStore(f'{self.bot.datadir}/{filename}')
+
+        self.restored = self.bot.metrics.counter('players_restored_total', 'Players restored from a snapshot',
+                                                 ('status',))
+        self.snapshot_duration = self.bot.metrics.histogram('snapshot_duration_seconds', 'Time spent saving players')
+
+        self._awaiting_update = set()
+        bot.lavalink.add_event_hook(self.player_update_hook)
+
+        if self.interval:
+            self.snapshot.change_interval(seconds=self.interval)
+            self.bot.loop.create_task(self.start())
+
+    def cog_unload(self):
+        self.snapshot.cancel()
+        self.store.close()
+
+    async def save(self):
+        start = time.perf_counter()
+        players = list(self.bot.lavalink.player_manager.players.values())
+        written = await self.store.save(self.bot.loop, players)
+        self.snapshot_duration.observe(time.perf_counter() - start)
+        return written
+
+    @tasks.loop(seconds=30.0)
+    async def snapshot(self):
+        try:
+            await self.save()
+        except Exception:
+            self.logger.exception("Saving the players failed")
+
+    async def player_update_hook(self, event):
+        if isinstance(event, lavalink.events.PlayerUpdateEvent):
+            self._awaiting_update.discard(int(event.player.guild_id))
+
+    async def wait_for_nodes(self, timeout: float = 30.0):
+        """ Players can't be restored before a lavalink node is there to play on """
+        deadline = time.monotonic() + timeout
+        while not self.bot.lavalink.node_manager.available_nodes:
+            if time.monotonic() > deadline:
+                return False
+            await asyncio.sleep(0.5)
+        return True
+
+    async def start(self):
+        try:
+            await self.restore()
+        except Exception:
+            self.logger.exception("Restoring the players failed")
+        # Snapshots only start once restoring is done, players still connecting would be dropped otherwise
+        self.snapshot.start()
+
+    async def restore(self):
+        """ Restores every stored player, returns how many were restored """
+        snapshots = self.store.load(self.max_age)
+        if not snapshots:
+            return 0
+        if not await self.wait_for_nodes():
+            self.logger.warning("No lavalink node available, %s players were not restored" % len(snapshots))
+            return 0
+
+        start = time.perf_counter()
+        resumed = await self.attach_players(snapshots)
+        snapshots = [snapshot for snapshot in snapshots if snapshot[0] not in resumed]
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def restore_one(guild_id, state, queue):
+            async with semaphore:
+                try:
+                    return await self.restore_player(guild_id, state, queue)
+                except Exception:
+                    self.logger.exception("Restoring the player of guild %s failed" % guild_id)
+                    return False
+
+        restored = sum(await asyncio.gather(*(restore_one(*snapshot) for snapshot in snapshots)))
+        self.restored.inc(len(resumed), status='resumed')
+        self.restored.inc(restored, status='restored')
+        self.restored.inc(len(snapshots) - restored, status='skipped')
+        self.logger.info("Took over %s players from lavalink and restored %s of %s others in %.2fs" % (
+            len(resumed), restored, len(snapshots), time.perf_counter() - start))
+        return len(resumed) + restored
+
+    async def attach_players(self, snapshots, timeout: float = 6.0):
+        """
+        Rebuilds the players a resumed lavalink session kept playing, without sending anything to the node.
+        Lavalink reports the position of every player every 5 seconds, players without a report weren't kept.
+        Returns the ids of the guilds that were taken over.
+        """
+        resuming = self.bot.node_sessions.resuming
+        nodes = {node.name: node for node in self.bot.lavalink.node_manager.available_nodes if node.name in resuming}
+        if not nodes:
+            return set()
+
+        attached = set()
+        for guild_id, state, queue in snapshots:
+            node = nodes.get(state.get('node'))
+            guild = self.bot.get_guild(guild_id)
+            if node is None or guild is None or state['current'] is None:
+                continue
+            # The voice connection belongs to lavalink, the bot is still in the channel if it was kept
+            voice = guild.me.voice
+            if voice is None or voice.channel is None or self.bot.lavalink.player_manager.get(guild_id) is not None:
+                continue
+
+            player = self.bot.lavalink.player_manager.create(guild_id, node=node)
+            load_queue(player.queue, queue)
+            player.current = load_track(state['current']).to_audio_track()
+            player.channel_id = str(voice.channel.id)
+            # Listeners are otherwise only known once someone's voice state changes
+            for member in voice.channel.members:
+                if not member.bot:
+                    player.update_listeners(member, member.voice)
+            player.volume = state['volume']
+            player.paused = state['paused']
+            player.boosted = state['boosted']
+            attached.add(guild_id)
+
+        self._awaiting_update.update(attached)
+        deadline = time.monotonic() + timeout
+        while self._awaiting_update and time.monotonic() < deadline:
+            await asyncio.sleep(0.25)
+        for guild_id in self._awaiting_update:
+            self.bot.lavalink.player_manager.remove(guild_id)
+        attached -= self._awaiting_update
+        self._awaiting_update.clear()
+        return attached
+
+    async def restore_player(self, guild_id: int, state: dict, queue: dict, connect_timeout: float = 10.0):
+        """ Rebuilds the queue of a guild, rejoins its voice channel and resumes the track that was playing """
+        guild = self.bot.get_guild(guild_id)
+        if guild is None or state['channel'] is None:
+            return False
+        channel = guild.get_channel(int(state['channel']))
+        if channel is None:
+            return False
+
+        player = self.bot.lavalink.player_manager.get(guild_id)
+        if player is not None and (player.current is not None or not player.queue.empty):
+            # Someone started playing something while the bot was starting
+            return False
+        if player is None:
+            try:
+                region = guild.region.value
+            except AttributeError:
+                region = guild.region
+            node = self.bot.node_selector.select(region)
+            player = self.bot.lavalink.player_manager.create(guild_id, endpoint=region, node=node)
+
+        load_queue(player.queue, queue)
+        ws = self.bot._connection._get_websocket(guild_id)
+        await ws.voice_state(str(guild_id), str(channel.id))
+
+        deadline = time.monotonic() + connect_timeout
+        while not player.is_connected:
+            if time.monotonic() > deadline:
+                player.queue.clear()
+                return False
+            await asyncio.sleep(0.1)
+
+        if state['current'] is not None:
+            await player.play(load_track(state['current']), start_time=state['position'])
+        else:
+            await player.play()
+        if state['volume'] != player.volume:
+            await player.set_volume(state['volume'])
+        if state['boosted']:
+            await player.bassboost(True)
+        if state['paused']:
+            await player.set_pause(True)
+        return True
+
+
+def setup(bot):
+    bot.add_cog(Snapshots(bot))
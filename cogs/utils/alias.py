@@ -4,157 +4,180 @@ from discord.ext import commands
 from glob import glob
 from os import path
 
-import yaml
+# Bot Utilities
+from cogs.utils.localefiles import LocaleFiles
 
 """
-Not the prettiest this, works by replacing any found aliases in a command string with the actual command names.
-Allows per guild aliases of subcommands without doing anything to discord.py itself. Suggestions of better/correct
-ways of doing this appreciated.
+Resolves per guild aliases through a trie built from commands.yaml. Top level commands are looked up directly,
+subcommand aliases are swapped for the actual names in the command string so discord.py finds them. Allows per
+guild aliases of subcommands without doing anything to discord.py itself.
 """
 
 
 class Aliaser:
-    def __init__(self, localization_folder, default_lang):
+    def __init__(self, localization_folder, default_lang, files: LocaleFiles = None):
         self.localization_folder = path.realpath(localization_folder)
         self.default_lang = default_lang
+        self.files = files if files is not None else LocaleFiles()
         self.index_localizations()
         self.load_localizations()
 
-    def _gen_alias_dict(self, commands):
-        """ Reverses the direction of a dict of commans→aliases to be alias→command. """
-        inverted = {}
-        subcommands = {}
+    def _gen_alias_trie(self, commands):
+        """
+        Maps every alias, and the command name itself, to the command name, the trie of its subcommands and its
+        entry in commands.yaml. Help and the command lookup both use it.
+        """
+        trie = {}
         for cmd, properties in commands.items():
             if isinstance(properties, list):
-                for alias in properties:
-                    inverted[alias] = cmd
+                aliases, sub_commands = properties, None
             else:
-                for alias in properties['aliases']:
-                    inverted[alias] = cmd
-                if properties.get('sub_commands', None):
-                    subcommands[cmd] = self._gen_alias_dict(properties['sub_commands'])
-        inverted['sub_commands'] = subcommands
-        return inverted
+                aliases, sub_commands = properties['aliases'], properties.get('sub_commands', None)
+            node = (cmd, self._gen_alias_trie(sub_commands) if sub_commands else None, properties)
+            for alias in aliases:
+                trie[alias] = node
+            trie.setdefault(cmd, node)
+        return trie
 
     def index_localizations(self):
         self.localization_table = {}
+        self._signatures = {}
         for folder in glob(path.join(self.localization_folder, "*/")):
             if 'global' in folder:
                 continue
             folder_base = path.basename(path.dirname(folder))
             self.localization_table[folder_base] = False
 
+    # loads the default aliases, the rest are loaded when they are first used
     def load_localizations(self):
         for lang in self.localization_table.keys():
-            with open(path.join(self.localization_folder, lang, "commands.yaml"), "r", encoding='utf-8') as f:
-                data = yaml.load(f, Loader=yaml.SafeLoader)
-            self.localization_table[lang] = {'aliases': data, 'commands': self._gen_alias_dict(data)}
-
-    def convert_alias(self, locale, default=None, parents=None):
-        if parents is None:
-            parents = []
-        try:
-            locale = self.localization_table[locale]
-        except KeyError:
-            locale = self.localization_table[self.default_lang]
-
-        # Traverse through the alias tree as dictated by the parents list
-        def traverse(alias_tree, parents, alias):
-            # Return the command when no more parents exist
-            if not parents:
-                return alias_tree.get(alias, None)
-            parent = parents.pop(0)
-            sub_commands = alias_tree.get('sub_commands', None)
-            if not sub_commands:
+            self.localization_table[lang] = False
+        self._signatures = {}
+        if self.default_lang in self.localization_table:
+            self._load_localization(self.default_lang)
+
+    def _load_localization(self, lang):
+        file = path.join(self.localization_folder, lang, "commands.yaml")
+        data = self.files.load(file)
+        self._signatures[lang] = LocaleFiles.signature([file])
+        self.localization_table[lang] = {'aliases': data, 'trie': self._gen_alias_trie(data)}
+        return self.localization_table[lang]
+
+    # reloads aliases whose files changed, and indexes new ones
+    def refresh(self):
+        for folder in glob(path.join(self.localization_folder, "*/")):
+            if 'global' in folder:
+                continue
+            self.localization_table.setdefault(path.basename(path.dirname(folder)), False)
+
+        changed = [lang for lang, files in self._signatures.items()
+                   if files != LocaleFiles.signature([path.join(self.localization_folder, lang, "commands.yaml")])]
+        for lang in changed:
+            self._load_localization(lang)
+        return changed
+
+    def get_locale(self, locale):
+        """ Returns the alias tables of locale, falls back to the default locale. """
+        table = self.localization_table.get(locale)
+        if table is None:
+            locale = self.default_lang
+            table = self.localization_table[locale]
+        if table is False:
+            table = self._load_localization(locale)
+        return table
+
+    def _find(self, trie, names):
+        """ The trie node of the command at the path of command names, None if there is none """
+        node = None
+        for name in names:
+            if trie is None:
                 return None
-            alias_tree = sub_commands.get(parent, None)
-            if not alias_tree:
+            node = trie.get(name)
+            # Only the name itself counts, not an alias of another command that happens to match it
+            if node is None or node[0] != name:
                 return None
-            return traverse(alias_tree, parents, alias)
+            trie = node[1]
+        return node
 
-        alias_tree = locale['commands']
-        command = traverse(alias_tree, parents, default)
-        if command:
-            return command
-        return default
+    def convert_alias(self, locale, default=None, parents=None):
+        """ The command name alias stands for, below the parent command names. Returns alias if it is unknown """
+        locale = self.get_locale(locale)
+        trie = locale['trie']
+        if parents:
+            node = self._find(trie, parents)
+            trie = node[1] if node is not None else None
+        node = (trie or {}).get(default)
+        return node[0] if node is not None else default
 
     def get_cmd_help(self, locale, command=None, parents=None):
-        """ Fetches the command info dictionary """
-        if parents is None:
-            parents = []
-        locale = self.localization_table[locale]
-
-        def traverse(command_tree, parents, command):
-            # Return the command when no more parents exist
-            if not parents:
-                return command_tree.get(command, [])
-
-            parent = command_tree.get(parents.pop(0), None)
-            if not parent:
-                return None
-            command_tree = parent.get('sub_commands', [])
-            if not command_tree:
+        """ Fetches the command info dictionary, command and parents are command names """
+        locale = self.get_locale(locale)
+        if not command:
+            return locale['aliases']
+        if parents:
+            node = self._find(locale['trie'], parents)
+            if node is None or not node[1]:
                 return None
-            return traverse(command_tree, parents, command)
-
-        command_tree = locale['aliases']
-        if command:
-            return traverse(command_tree, parents, command)
-        return command_tree
+            trie = node[1]
+        else:
+            trie = locale['trie']
+        node = self._find(trie, [command])
+        return node[2] if node is not None else []
 
     def get_command(self, ctx):
-        """ Get a top level command. """
+        """ Get a top level command, and translate any subcommand aliases. """
         if not ctx.prefix:
             ctx.command = None
             return ctx
-        ctx.view.undo()
-        ctx.invoker = ctx.view.buffer[ctx.view.index:ctx.view.end]
-        alias = ctx.view.get_word()
-        command = self.convert_alias(ctx.locale, alias)
+        view = ctx.view
+        view.undo()
+        ctx.invoker = view.buffer[view.index:view.end]
+        alias = view.get_word()
+        command, sub_trie, _ = self.get_locale(ctx.locale)['trie'].get(alias, (alias, None, None))
         ctx.invoked_with = command
         ctx.command = ctx.bot.all_commands.get(command)
         if ctx.command and isinstance(ctx.command, commands.GroupMixin):
-            ctx = self.get_subcommand(ctx, ctx.command, [str(ctx.command)])
+            self.get_subcommand(ctx, ctx.command, sub_trie)
         return ctx
 
-    def _replace_command(self, view, index, alias, command):
-        buf = view.buffer
-        changed = buf[index:]
-        view.buffer = buf[:index] + changed.replace(alias, command, 1)
-        return view
-
-    def get_subcommand(self, ctx, group=None, parents=None):
-        """ Recursicely replaces all subcommand aliases with subcommands."""
-        if parents is None:
-            parents = []
+    def get_subcommand(self, ctx, group=None, trie=None):
+        """ Walks the subcommand words after the view index through the alias trie. The buffer is only
+        rebuilt, once, when an alias differs from the subcommand name discord.py will look up.
+        Without a group the words are resolved starting from the top level commands, like help does. """
+        if group is None:
+            group = ctx.bot
+            trie = self.get_locale(ctx.locale)['trie']
         view = ctx.view
         prev = view.previous
         idx = view.index
 
-        # get the alias used
-        view.skip_ws()
-        alias = view.get_word()
-
-        sub_command = self.convert_alias(ctx.locale, alias, parents.copy())
-        parents.append(sub_command)
-
-        # Replace the alias in the command
-        self._replace_command(view, idx, alias, sub_command)
-
-        # Update the view to account for difference in length
-        strdiff = len(sub_command) - len(alias)
-        view.end += strdiff
-        view.index += strdiff
-
-        # Get the subcommand
-        if group:
-            sub = group.all_commands.get(sub_command, None)
-        else:
-            sub = ctx.bot.all_commands.get(sub_command, None)
-
-        # Translate any subsubcommands
-        if sub and isinstance(sub, commands.GroupMixin):
-            self.get_subcommand(ctx, sub, parents)
+        replacements = []
+        while group is not None and isinstance(group, commands.GroupMixin):
+            view.skip_ws()
+            start = view.index
+            alias = view.get_word()
+            if not alias:
+                break
+            sub_command, trie, _ = (trie or {}).get(alias, (alias, None, None))
+            if sub_command != alias:
+                replacements.append((start, view.index, sub_command))
+            group = group.all_commands.get(sub_command, None)
+
+        # The trie already knows the subcommand, but it can't be handed over: Group.invoke in discord.py resets
+        # ctx.invoked_subcommand and reads the next word of the view again, for every group level. Setting
+        # ctx.command to the resolved subcommand instead would skip the checks and callbacks of its parent groups.
+        # So discord.py has to find the names in the buffer, which is rewritten only when an alias was used.
+        if replacements:
+            buf = view.buffer
+            parts = []
+            last = 0
+            for start, end, sub_command in replacements:
+                parts.append(buf[last:start])
+                parts.append(sub_command)
+                last = end
+            parts.append(buf[last:])
+            view.buffer = ''.join(parts)
+            view.end = len(view.buffer)
 
         # Reset the view indexes
         view.index = idx
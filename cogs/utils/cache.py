@@ -0,0 +1,167 @@
+import asyncio
+import codecs
+import json
+import os
+import time
+from collections import OrderedDict
+
+"""
+Small caches shared between guilds
+"""
+
+_missing = object()
+
+
+class LRUCache:
+    def __init__(self, size: int = 1024, ttl: int = 3600, failure_ttl: int = 300):
+        """
+        Least recently used cache with expiring entries.
+        :param size: Max amount of entries kept
+        :param ttl: Seconds a value is kept
+        :param failure_ttl: Seconds a failed lookup (None) is kept
+        """
+        self.size = size
+        self.ttl = ttl
+        self.failure_ttl = failure_ttl
+
+        self._entries = OrderedDict()
+        self._pending = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return self.get(key, _missing, count=False) is not _missing
+
+    def get(self, key, default=None, count: bool = True):
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires, value = entry
+            if expires > time.time():
+                self._entries.move_to_end(key)
+                if count:
+                    self.hits += 1
+                return value
+            self._entries.pop(key)
+        if count:
+            self.misses += 1
+        return default
+
+    def set(self, key, value, ttl: int = None):
+        if ttl is None:
+            ttl = self.failure_ttl if value is None else self.ttl
+        self._entries[key] = (time.time() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def pop(self, key, default=None):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return default
+        return entry[1]
+
+    def clear(self):
+        self._entries.clear()
+
+    async def get_or_fetch(self, key, fetch):
+        """ Returns the cached value for key, or awaits fetch() once no matter how many callers ask for it. """
+        value = self.get(key, _missing, count=False)
+        if value is not _missing:
+            self.hits += 1
+            return value
+
+        while True:
+            pending = self._pending.get(key)
+            if pending is None:
+                break
+            self.coalesced += 1
+            try:
+                ok, value = await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                # The caller that ran the fetch was cancelled, not this one, so fetch again
+                if pending.cancelled():
+                    continue
+                raise
+            if not ok:
+                raise value
+            return value
+
+        self.misses += 1
+        pending = self._pending[key] = asyncio.get_event_loop().create_future()
+        try:
+            value = await fetch()
+        except Exception as e:
+            self.set(key, None)
+            pending.set_result((False, e))
+            raise
+        else:
+            self.set(key, value)
+            pending.set_result((True, value))
+            return value
+        finally:
+            if not pending.done():
+                pending.cancel()
+            self._pending.pop(key, None)
+
+    @property
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
+
+
+class PersistentCache(LRUCache):
+    def __init__(self, path: str, **kwargs):
+        """ LRUCache that can be written to and restored from a json file. """
+        super().__init__(**kwargs)
+        self.path = path
+        self.dirty = False
+        self.load()
+
+    def set(self, key, value, ttl: int = None):
+        super().set(key, value, ttl)
+        self.dirty = True
+
+    def load(self):
+        if not os.path.isfile(self.path):
+            return
+        try:
+            with codecs.open(self.path, 'r', encoding='utf8') as f:
+                entries = json.load(f)
+        except ValueError:
+            return
+        now = time.time()
+        for key, (expires, value) in entries.items():
+            if expires > now:
+                self._entries[key] = (expires, value)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def dump(self):
+        """ Snapshot of the live entries, safe to hand to write() in another thread. """
+        now = time.time()
+        self.dirty = False
+        return {key: entry for key, entry in self._entries.items() if entry[0] > now}
+
+    def write(self, entries):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        tmp_path = self.path + '.tmp'
+        with codecs.open(tmp_path, 'w', encoding='utf8') as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, self.path)
+
+    def save(self):
+        if self.dirty:
+            self.write(self.dump())
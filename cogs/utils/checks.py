@@ -37,7 +37,7 @@ def is_admin():
 
 def is_mod():
     async def pred(ctx):
-        modrole = ctx.bot.settings.get(ctx.guild, 'roles.moderator', 'default_mod')
+        modrole = ctx.bot.settings.resolve(ctx.guild).mod_role
         return has_role(ctx, modrole)
     return commands.check(pred)
 
@@ -51,11 +51,11 @@ def has_role_id(ctx, role_id):
 
 
 def is_dj(ctx):
-    dj_role_ids = ctx.bot.settings.get(ctx.guild, 'roles.dj', [])
+    dj_role_ids = ctx.bot.settings.resolve(ctx.guild).dj_roles
     if not dj_role_ids:
         return any([has_role(ctx, role) for role in ['dj', 'Dj', 'DJ', 'dJ']])
     else:
-        return any([has_role_id(ctx, role_id) for role_id in dj_role_ids])
+        return any(role.id in dj_role_ids for role in ctx.author.roles)
 
 
 def dj_or(alone: bool = False, track_requester: bool = False):
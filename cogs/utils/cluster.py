@@ -0,0 +1,237 @@
+import asyncio
+import itertools
+import json
+import logging
+import math
+import sys
+
+"""
+Runs the bot as several processes that each handle a share of the shards.
+The launcher starts the workers and relays queries between them over a local socket.
+"""
+
+# Answers like the guild list of a cluster easily outgrow the 64 KiB lines asyncio reads by default
+LINE_LIMIT = 64 * 1024 * 1024
+
+
+def shard_ids(cluster_id: int, clusters: int, shards: int):
+    """ The shards a cluster runs, each cluster gets a contiguous block. """
+    per_cluster = math.ceil(shards / clusters)
+    return list(range(cluster_id * per_cluster, min((cluster_id + 1) * per_cluster, shards)))
+
+
+async def _send(writer, message: dict):
+    writer.write(json.dumps(message).encode('utf-8') + b'\n')
+    await writer.drain()
+
+
+async def _readline(reader, logger):
+    """
+    Reads the next message line, b'' once the connection closed.
+    A line over LINE_LIMIT is skipped with a warning instead of ending the connection.
+    """
+    while True:
+        try:
+            return await reader.readuntil(b'\n')
+        except asyncio.IncompleteReadError as err:
+            return err.partial
+        except asyncio.LimitOverrunError as err:
+            logger.warning("Skipping a cluster message over %s bytes" % LINE_LIMIT)
+            await _skip_line(reader, err.consumed)
+
+
+async def _skip_line(reader, consumed: int):
+    """ Throws away the rest of a line that is over the limit, consumed is what readuntil already looked at """
+    while True:
+        await reader.readexactly(consumed)
+        try:
+            await reader.readuntil(b'\n')
+            return
+        except asyncio.IncompleteReadError:
+            return
+        except asyncio.LimitOverrunError as err:
+            consumed = err.consumed
+
+
+class Cluster:
+    def __init__(self, cluster_id: int = 0, clusters: int = 1, host: str = '127.0.0.1', port: int = None,
+                 logger=None):
+        """
+        The view a bot process has of the other clusters.
+        Without a launcher to connect to, queries are only answered by this process.
+        """
+        self.cluster_id = cluster_id
+        self.clusters = clusters
+        self.host = host
+        self.port = port
+        self.logger = logger or logging.getLogger(__name__)
+
+        self._handlers = {}
+        self._pending = {}
+        self._ids = itertools.count()
+        self._writer = None
+        self._reader_task = None
+
+    @property
+    def connected(self):
+        return self._writer is not None
+
+    def register(self, name: str, handler):
+        """ handler is a coroutine function answering the query name, its result has to be json serializable. """
+        self._handlers[name] = handler
+
+    async def connect(self):
+        if self.port is None or self.clusters <= 1:
+            return
+        reader, self._writer = await asyncio.open_connection(self.host, self.port, limit=LINE_LIMIT)
+        await _send(self._writer, {'op': 'hello', 'cluster': self.cluster_id})
+        self._reader_task = asyncio.ensure_future(self._read(reader))
+
+    async def close(self):
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    async def _answer(self, name: str):
+        handler = self._handlers.get(name)
+        if handler is None:
+            return None
+        return await handler()
+
+    async def query(self, name: str, timeout: float = 5.0):
+        """ Asks every cluster, returns a list of (cluster id, answer) ordered by cluster id. """
+        if not self.connected:
+            return [(self.cluster_id, await self._answer(name))]
+
+        query_id = next(self._ids)
+        future = self._pending[query_id] = asyncio.get_event_loop().create_future()
+        try:
+            await _send(self._writer, {'op': 'query', 'id': query_id, 'name': name, 'timeout': timeout})
+            # The launcher gives up on clusters after timeout, give it a moment to send what it has
+            answers = await asyncio.wait_for(future, timeout + 1)
+        finally:
+            self._pending.pop(query_id, None)
+        return sorted((int(cluster_id), answer) for cluster_id, answer in answers.items())
+
+    async def _read(self, reader):
+        while True:
+            line = await _readline(reader, self.logger)
+            if not line:
+                self.logger.warning("Lost the connection to the cluster launcher")
+                self._writer = None
+                return
+            message = json.loads(line)
+            if message['op'] == 'query':
+                asyncio.ensure_future(self._reply(message))
+            elif message['op'] == 'result':
+                future = self._pending.get(message['id'])
+                if future is not None and not future.done():
+                    future.set_result(message['answers'])
+
+    async def _reply(self, message: dict):
+        try:
+            answer = await self._answer(message['name'])
+        except Exception:
+            self.logger.exception("Answering cluster query %s failed" % message['name'])
+            answer = None
+        if self._writer is not None:
+            await _send(self._writer, {'op': 'reply', 'id': message['id'], 'answer': answer})
+
+
+class ClusterLauncher:
+    def __init__(self, argv, clusters: int, shards: int, host: str = '127.0.0.1', port: int = 8765,
+                 identify_delay: float = 5.0, logger=None):
+        """
+        Starts one process per cluster and relays queries between them.
+        :param argv: Command line of a worker, --cluster-id is added to it
+        :param identify_delay: Seconds waited per shard before the next cluster starts, discord allows one
+                               identify every 5 seconds
+        """
+        self.argv = argv
+        self.clusters = clusters
+        self.shards = shards
+        self.host = host
+        self.port = port
+        self.identify_delay = identify_delay
+        self.logger = logger or logging.getLogger(__name__)
+
+        self._workers = {}
+        self._queries = {}
+        self._ids = itertools.count()
+        self._closing = False
+
+    async def run(self):
+        server = await asyncio.start_server(self._handle, self.host, self.port, limit=LINE_LIMIT)
+        runners = []
+        try:
+            for cluster_id in range(self.clusters):
+                runners.append(asyncio.ensure_future(self._keep_running(cluster_id)))
+                await asyncio.sleep(self.identify_delay * len(shard_ids(cluster_id, self.clusters, self.shards)))
+            await asyncio.gather(*runners)
+        finally:
+            self._closing = True
+            for runner in runners:
+                runner.cancel()
+            server.close()
+
+    async def _keep_running(self, cluster_id: int):
+        """ Runs a worker, and starts it again if it stops without being asked to. """
+        while not self._closing:
+            process = await asyncio.create_subprocess_exec(sys.executable, *self.argv,
+                                                           '--cluster-id', str(cluster_id))
+            self.logger.info("Started cluster %s with shards %s" % (
+                cluster_id, shard_ids(cluster_id, self.clusters, self.shards)))
+            try:
+                code = await process.wait()
+            except asyncio.CancelledError:
+                process.terminate()
+                await process.wait()
+                raise
+            if code == 0:
+                self.logger.info("Cluster %s stopped" % cluster_id)
+                return
+            self.logger.warning("Cluster %s exited with %s, restarting" % (cluster_id, code))
+            await asyncio.sleep(self.identify_delay)
+
+    async def _handle(self, reader, writer):
+        cluster_id = None
+        try:
+            while True:
+                line = await _readline(reader, self.logger)
+                if not line:
+                    break
+                message = json.loads(line)
+                if message['op'] == 'hello':
+                    cluster_id = message['cluster']
+                    self._workers[cluster_id] = writer
+                elif message['op'] == 'query':
+                    asyncio.ensure_future(self._relay(writer, message))
+                elif message['op'] == 'reply':
+                    query = self._queries.get(message['id'])
+                    if query is not None:
+                        query['answers'][cluster_id] = message['answer']
+                        if len(query['answers']) >= len(query['asked']):
+                            query['done'].set()
+        finally:
+            if cluster_id is not None and self._workers.get(cluster_id) is writer:
+                del self._workers[cluster_id]
+            writer.close()
+
+    async def _relay(self, origin, message: dict):
+        """ Sends a query to every cluster and the collected answers back to the one asking. """
+        query_id = next(self._ids)
+        workers = dict(self._workers)
+        query = self._queries[query_id] = {'answers': {}, 'asked': set(workers), 'done': asyncio.Event()}
+        try:
+            for writer in workers.values():
+                await _send(writer, {'op': 'query', 'id': query_id, 'name': message['name']})
+            try:
+                await asyncio.wait_for(query['done'].wait(), message.get('timeout', 5.0))
+            except asyncio.TimeoutError:
+                missing = query['asked'] - set(query['answers'])
+                self.logger.warning("Clusters %s didn't answer %s in time" % (sorted(missing), message['name']))
+        finally:
+            self._queries.pop(query_id, None)
+        await _send(origin, {'op': 'result', 'id': message['id'], 'answers': query['answers']})
@@ -3,9 +3,11 @@ from discord.ext import commands
 
 
 class Context(commands.Context):
+    trace = None
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         if self.message.guild:
-            self.locale = self.bot.settings.get(self.message.guild, 'locale', 'default_locale')
+            self.locale = self.bot.settings.resolve(self.message.guild).locale
         else:
             self.locale = self.bot.settings.default_locale
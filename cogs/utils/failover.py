@@ -0,0 +1,91 @@
+# Discord Packages
+from lavalink import Node
+
+import logging
+
+"""
+Moves players off lavalink nodes that disconnected, are removed or can't keep up
+"""
+
+
+class Failover:
+    def __init__(self, client, selector, deficit_threshold: float = 0.05, strikes: int = 3, logger=None):
+        """
+        Watches the health of the lavalink nodes and moves their players to a healthy node.
+        :param client: The lavalink client holding the nodes
+        :param selector: NodeSelector used to pick the node players are moved to
+        :param deficit_threshold: Share of the frames a node may fail to send before it counts as degraded
+        :param strikes: Checks in a row a node has to be degraded before its players are moved
+        """
+        self.client = client
+        self.selector = selector
+        self.deficit_threshold = deficit_threshold
+        self.strikes = strikes
+        self.logger = logger or logging.getLogger(__name__)
+
+        self._strikes = {}
+
+    def players_on(self, node: Node):
+        return [player for player in self.client.player_manager.players.values() if player.node is node]
+
+    @staticmethod
+    def deficit(node: Node):
+        """
+        Share of the last minute of frames the node didn't send, 3000 frames make up a minute.
+        Nodes report -1 until they sent audio for a minute, that counts as no deficit.
+        """
+        stats = getattr(node, 'stats', None)
+        if stats is None or stats.frames_deficit == -1:
+            return 0.0
+        return max(stats.frames_deficit, 0) / 3000
+
+    async def migrate(self, player, node: Node):
+        """
+        Moves a player to node. The queue, boost state and listeners live on the player and move with it,
+        change_node resumes the current track at its position with the same volume, pause state and equalizer.
+        """
+        old_node = player.node
+        await player.change_node(node)
+        self.logger.info("Moved player of guild %s from node %s to %s" % (player.guild_id, old_node.name, node.name))
+
+    async def evacuate(self, node: Node, reason: str):
+        """ Moves every player on node to the best other node, returns the amount of players moved. """
+        players = self.players_on(node)
+        if not players:
+            return 0
+
+        moved = 0
+        for player in players:
+            target = self.selector.select(exclude=(node,), region=node.region)
+            if target is None:
+                self.logger.warning("No healthy node to move the player of guild %s to (%s)" % (
+                    player.guild_id, reason))
+                break
+            try:
+                await self.migrate(player, target)
+            except Exception:
+                self.logger.exception("Moving the player of guild %s off node %s failed" % (player.guild_id, node.name))
+            else:
+                moved += 1
+        self.logger.info("Moved %s of %s players off node %s: %s" % (moved, len(players), node.name, reason))
+        return moved
+
+    async def check_nodes(self):
+        """ Evacuates nodes that have been degraded for too long, meant to be called periodically. """
+        for node in list(self.client.node_manager.nodes):
+            if not getattr(node, 'available', True):
+                self._strikes.pop(node, None)
+                await self.evacuate(node, 'node is unavailable')
+                continue
+
+            if self.deficit(node) <= self.deficit_threshold:
+                self._strikes.pop(node, None)
+                continue
+
+            strikes = self._strikes[node] = self._strikes.get(node, 0) + 1
+            if strikes >= self.strikes:
+                self._strikes.pop(node, None)
+                await self.evacuate(node, 'frame deficit of %.1f%%' % (self.deficit(node) * 100))
+
+    def forget(self, node: Node):
+        self._strikes.pop(node, None)
@@ -0,0 +1,85 @@
+import asyncio
+import heapq
+import itertools
+import logging
+
+"""
+Deadlines for idle voice connections and menu timeouts, kept in a heap and served by a single task
+"""
+
+
+class IdleScheduler:
+    def __init__(self, callback, logger=None):
+        """
+        Calls callback(key) once the deadline armed for key passes, unless it was cancelled before that.
+        Work is only done when a deadline is armed, cancelled or passes, no matter how many keys are tracked.
+        :param callback: Coroutine function called with the key of an expired deadline
+        """
+        self.callback = callback
+        self.logger = logger or logging.getLogger(__name__)
+
+        self._deadlines = {}
+        self._heap = []
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def __contains__(self, key):
+        return key in self._deadlines
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._deadlines.clear()
+        self._heap.clear()
+
+    def arm(self, key, delay: float):
+        """ Arms a deadline delay seconds from now, a deadline that is already armed is kept. """
+        if key in self._deadlines:
+            return
+        deadline = asyncio.get_event_loop().time() + delay
+        self._deadlines[key] = deadline
+        wake = not self._heap or deadline < self._heap[0][0]
+        heapq.heappush(self._heap, (deadline, next(self._counter), key))
+        if wake:
+            self._wakeup.set()
+
+    def cancel(self, key):
+        """ Cancels the deadline of key, the heap entry is dropped once it reaches the top. """
+        if self._deadlines.pop(key, None) is None:
+            return
+        # Keep cancelled entries from piling up when deadlines are armed and cancelled over and over
+        if len(self._heap) > 2 * len(self._deadlines) + 64:
+            self._heap = [entry for entry in self._heap if self._deadlines.get(entry[2]) == entry[0]]
+            heapq.heapify(self._heap)
+
+    async def _fire(self, key):
+        try:
+            await self.callback(key)
+        except Exception:
+            self.logger.exception("Idle callback for %s failed" % key)
+
+    async def _run(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            self._wakeup.clear()
+            now = loop.time()
+            while self._heap and self._heap[0][0] <= now:
+                deadline, _, key = heapq.heappop(self._heap)
+                if self._deadlines.get(key) == deadline:
+                    del self._deadlines[key]
+                    loop.create_task(self._fire(key))
+
+            timeout = self._heap[0][0] - now if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
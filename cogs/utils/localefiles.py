@@ -0,0 +1,29 @@
+import os
+
+import yaml
+
+
+class LocaleFiles:
+    def __init__(self):
+        """ Parsed localization files shared by the Localizer and Aliaser, parsed again only when they change. """
+        self._files = {}
+
+    @staticmethod
+    def signature(paths):
+        """ Modification times of paths, compare two signatures to find out if anything changed. """
+        return {path: os.stat(path).st_mtime_ns for path in paths}
+
+    def load(self, path):
+        """ Returns the parsed content of a yaml file, or the text of any other file. """
+        mtime = os.stat(path).st_mtime_ns
+        cached = self._files.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        with open(path, "r", encoding='utf-8') as f:
+            if path.endswith('.yaml'):
+                data = yaml.load(f, Loader=yaml.SafeLoader)
+            else:
+                data = f.read()
+        self._files[path] = (mtime, data)
+        return data
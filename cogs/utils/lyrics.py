@@ -0,0 +1,112 @@
+import asyncio
+import re
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from bs4 import BeautifulSoup
+
+"""
+Lyrics from genius, shared between guilds through a persistent cache and prefetched when a track starts
+"""
+
+excluded_words = {'music', 'video', 'version', 'original', 'lyrics', 'lyric',
+                  'official', 'live', 'instrumental', 'audio', 'hd'}
+punctuation_rx = re.compile(r'[-()_\[\]]')
+
+
+def clean_title(title: str):
+    """ Turns a track title into a search query, dropping the noise youtube titles come with """
+    title = punctuation_rx.sub('', title)
+    return ' '.join(word for word in title.split() if word.lower() not in excluded_words)
+
+
+def normalize_query(query: str):
+    """ Collapses the spacing of a query, genius does not care about it """
+    return ' '.join(query.split())
+
+
+def lyrics_key(query: str):
+    """ Queries that only differ in case or spacing share their lyrics """
+    return normalize_query(query).lower()
+
+
+def parse_lyrics(html: str):
+    """ Extracts the lyrics from a genius song page, runs on a worker thread """
+    soup = BeautifulSoup(html, 'html.parser')
+    old_layout = soup.find(class_='lyrics')
+    if old_layout is not None:
+        return old_layout.get_text()
+    containers = soup.find_all(attrs={'data-lyrics-container': 'true'})
+    if not containers:
+        return None
+    for br in soup.find_all('br'):
+        br.replace_with('\n')
+    return '\n'.join(container.get_text() for container in containers)
+
+
+class Lyrics:
+    def __init__(self, bot, cache, workers: int = 1):
+        """
+        Looks up lyrics through the genius api.
+        :param cache: Cache the lyrics are kept in, a failed lookup is cached as None
+        :param workers: Threads parsing lyrics pages, parsing a page takes too long to do on the event loop
+        """
+        self.bot = bot
+        self.cache = cache
+        self.workers = workers
+        self.logger = self.bot.main_logger.bot_logger.getChild("Lyrics")
+        self._executor = None
+
+    @property
+    def token(self):
+        return self.bot.APIkeys.get('genius', None)
+
+    def cached(self, query: str):
+        """ Whether query was looked up already, get returns right away then """
+        return lyrics_key(query) in self.cache
+
+    async def get(self, query: str):
+        """
+        Returns a dict with title, url, thumbnail and lyrics, or None when genius has no match.
+        The query is searched as given, pass track titles through clean_title first.
+        """
+        return await self.cache.get_or_fetch(lyrics_key(query), lambda: self._fetch(normalize_query(query)))
+
+    def prefetch(self, query: str):
+        """ Starts looking up the lyrics of query in the background, unless they are cached already """
+        if not self.token or not query or self.cached(query):
+            return
+        task = asyncio.ensure_future(self.get(query))
+        task.add_done_callback(self._prefetched)
+
+    def _prefetched(self, task):
+        if not task.cancelled() and task.exception() is not None:
+            self.logger.debug("Prefetching lyrics failed: %s" % task.exception())
+
+    async def _fetch(self, query: str):
+        if not query:
+            return None
+        url = 'https://api.genius.com/search?' + urlencode({'access_token': self.token, 'q': query})
+        hits = (await self.bot.web.get_json(url, 'genius_api'))['response']['hits']
+        if not hits:
+            return None
+        # The search hit has everything but the lyrics, no need to look the song up
+        song = hits[0]['result']
+
+        html = await self.bot.web.get_text(song['url'], 'genius_pages')
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='LyricsParser')
+        lyrics = await asyncio.get_event_loop().run_in_executor(self._executor, parse_lyrics, html)
+        if not lyrics:
+            return None
+        return {
+            'title': song['full_title'],
+            'url': song['url'],
+            'thumbnail': song['header_image_thumbnail_url'],
+            'lyrics': lyrics
+        }
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
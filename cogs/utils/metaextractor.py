@@ -0,0 +1,79 @@
+import asyncio
+import codecs
+from html.parser import HTMLParser
+
+import aiohttp
+
+"""
+Pulls single values out of html pages without downloading or parsing more of the page than needed
+"""
+
+
+class MetaExtractor(HTMLParser):
+    def __init__(self, meta=(), link_class: str = None, stop_at_head: bool = True):
+        """
+        Incremental parser looking for one value, fed the page chunk by chunk.
+        :param meta: Property or name of the <meta> tags whose content is wanted, the first found wins
+        :param link_class: Class of an element whose href is wanted, for values that are outside of <head>
+        :param stop_at_head: Stop at </head>, where a page keeps its <meta> tags
+        """
+        super().__init__(convert_charrefs=True)
+        self.meta = set(meta)
+        self.link_class = link_class
+        self.stop_at_head = stop_at_head
+        self.result = None
+        self.done = False
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        attrs = dict(attrs)
+        if tag == 'meta' and (attrs.get('property') or attrs.get('name')) in self.meta and attrs.get('content'):
+            self.result = attrs['content']
+            self.done = True
+        elif self.link_class is not None and self.link_class in (attrs.get('class') or '').split() \
+                and attrs.get('href'):
+            self.result = attrs['href']
+            self.done = True
+
+    def handle_endtag(self, tag):
+        if tag == 'head' and self.stop_at_head:
+            self.done = True
+
+    def feed_chunk(self, chunk: str):
+        """ Feeds chunk, returns whether the rest of the page can be skipped """
+        if not self.done:
+            self.feed(chunk)
+        return self.done
+
+
+async def extract(client, url: str, extractor: MetaExtractor, max_bytes: int = 262144, timeout: float = 10.0,
+                  chunk_size: int = 16384, executor=None, endpoint: str = 'metadata'):
+    """
+    Streams url into extractor until it has its value, max_bytes were read or timeout seconds passed.
+    Chunks are parsed in executor, the default executor when None. Returns the value, or None.
+    :param client: The WebClient of the bot
+    """
+    loop = asyncio.get_event_loop()
+
+    async def read():
+        async with client.request('GET', url, endpoint, retries=0, timeout=timeout) as response:
+            try:
+                decoder = codecs.getincrementaldecoder(response.charset or 'utf-8')(errors='replace')
+            except LookupError:
+                decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+            received = 0
+            async for chunk in response.content.iter_chunked(chunk_size):
+                received += len(chunk)
+                if await loop.run_in_executor(executor, extractor.feed_chunk, decoder.decode(chunk)):
+                    break
+                if received >= max_bytes:
+                    break
+            # Leaving the response early closes the connection instead of reading the rest of the page
+
+    try:
+        await asyncio.wait_for(read(), timeout)
+    except (asyncio.TimeoutError, aiohttp.ClientError):
+        # Error statuses, refused connections and pages cut off halfway all just mean there is no value
+        pass
+    return extractor.result
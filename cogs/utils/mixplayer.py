@@ -3,12 +3,69 @@ import lavalink
 from lavalink import AudioTrack, DefaultPlayer, Node
 from lavalink.events import QueueEndEvent, TrackEndEvent, TrackExceptionEvent, TrackStartEvent, TrackStuckEvent
 
+import sys
 import typing
 from collections import OrderedDict, deque
-from itertools import chain, cycle, islice
+from itertools import accumulate, chain, cycle, islice
 from random import shuffle
 
 
+class QueuedTrack:
+    """
+    Compact record of a queued or played track, a full AudioTrack is only built when the track is played.
+    Strings are interned, so a track queued in many guilds shares its title, uri, author and encoded track.
+    """
+    __slots__ = ('track', 'identifier', 'title', 'uri', 'author', 'duration', 'requester', 'thumbnail_url',
+                 'stream', 'is_seekable')
+
+    def __init__(self, track: str, identifier: str, title: str, uri: str, author: str, duration: int,
+                 requester: int, thumbnail_url: str = None, stream: bool = False, is_seekable: bool = True):
+        self.track = sys.intern(track)
+        self.identifier = sys.intern(identifier)
+        self.title = sys.intern(title)
+        self.uri = sys.intern(uri)
+        self.author = sys.intern(author)
+        self.duration = duration
+        self.requester = requester
+        self.thumbnail_url = thumbnail_url
+        self.stream = stream
+        self.is_seekable = is_seekable
+
+    def __repr__(self):
+        return f'<QueuedTrack title={self.title} identifier={self.identifier}>'
+
+    @classmethod
+    def from_dict(cls, data: dict, requester: int, thumbnail_url: str = None):
+        """ Builds a record from a track returned by lavalink. """
+        info = data['info']
+        return cls(data['track'], info['identifier'], info['title'], info['uri'], info['author'], info['length'],
+                   requester, thumbnail_url, info['isStream'], info['isSeekable'])
+
+    @classmethod
+    def from_track(cls, track: typing.Union[dict, AudioTrack, 'QueuedTrack'], requester: int):
+        if isinstance(track, QueuedTrack):
+            return track
+        if isinstance(track, dict):
+            return cls.from_dict(track, requester)
+        return cls(track.track, track.identifier, track.title, track.uri, track.author, track.duration,
+                   track.requester, track.extra.get('thumbnail_url'), track.stream, track.is_seekable)
+
+    def to_audio_track(self):
+        data = {
+            'track': self.track,
+            'info': {
+                'identifier': self.identifier,
+                'isSeekable': self.is_seekable,
+                'author': self.author,
+                'length': self.duration,
+                'isStream': self.stream,
+                'title': self.title,
+                'uri': self.uri
+            }
+        }
+        return AudioTrack(data, self.requester, thumbnail_url=self.thumbnail_url)
+
+
 class MixPlayer(DefaultPlayer):
     def __init__(self, guild_id: int, node: Node):
         super().__init__(guild_id, node)
@@ -19,13 +76,17 @@ class MixPlayer(DefaultPlayer):
         self.skip_voters = set()
         self.boosted = False
 
-    def add(self, requester: int, track: typing.Union[dict, AudioTrack], pos: int = None):
+    def add(self, requester: int, track: typing.Union[dict, AudioTrack, QueuedTrack], pos: int = None):
         """ Adds a track to the queue. """
-        return self.queue.add_track(requester, track, pos)
+        return self.queue.add_track(requester, QueuedTrack.from_track(track, requester), pos)
 
-    def add_next(self, requester: int, track: typing.Union[dict, AudioTrack], pos: int = None):
+    def add_tracks(self, requester: int, tracks: typing.List[QueuedTrack]):
+        """ Adds several tracks to the end of a users queue at once. """
+        return self.queue.add_tracks(requester, tracks)
+
+    def add_next(self, requester: int, track: typing.Union[dict, AudioTrack, QueuedTrack], pos: int = None):
         """ Adds a track to beginning of the queue """
-        self.queue.add_next_track(track)
+        self.queue.add_next_track(QueuedTrack.from_track(track, requester))
 
     def move_user_track(self, requester: int, initial: int, final: int):
         """ Moves a track in a users queue"""
@@ -56,15 +117,13 @@ class MixPlayer(DefaultPlayer):
         return self.queue.history
 
     def queue_duration(self, include_current: bool = True):
-        duration = 0
-        for track in self.queue:
-            duration += track.duration
+        duration = self.queue.duration
         remaining = self.current.duration - self.position
         if include_current:
             return lavalink.Utils.format_time(duration + remaining)
         return lavalink.Utils.format_time(duration)
 
-    async def play(self, track: AudioTrack = None, start_time: int = 0):
+    async def play(self, track: typing.Union[AudioTrack, QueuedTrack] = None, start_time: int = 0):
 
         self.current = None
         self.last_update = 0
@@ -81,6 +140,8 @@ class MixPlayer(DefaultPlayer):
             else:
                 track = self.queue.pop_first()
 
+        if isinstance(track, QueuedTrack):
+            track = track.to_audio_track()
         self.current = track
         await self.node._send(op='play', guildId=self.guild_id,
                               track=track.track, startTime=start_time)
@@ -152,11 +213,73 @@ def roundrobin(*iterables):
             nexts = cycle(islice(nexts, num_active))
 
 
+class FenwickTree:
+    """ Growable binary indexed tree holding per slot counts. """
+    def __init__(self, size: int = 16):
+        self._values = [0] * size
+        self._tree = [0] * (size + 1)
+
+    def __len__(self):
+        return len(self._values)
+
+    def _grow(self, size: int):
+        self._values += [0] * (size - len(self._values))
+        self._tree = [0] * (size + 1)
+        for index, value in enumerate(self._values, start=1):
+            self._tree[index] += value
+            parent = index + (index & -index)
+            if parent <= size:
+                self._tree[parent] += self._tree[index]
+
+    def add(self, index: int, delta: int):
+        if index >= len(self._values):
+            self._grow(max(index + 1, len(self._values) * 2))
+        self._values[index] += delta
+        index += 1
+        while index < len(self._tree):
+            self._tree[index] += delta
+            index += index & -index
+
+    def prefix(self, index: int):
+        """ Sum of the slots in [0, index) """
+        index = min(index, len(self._values))
+        total = 0
+        while index > 0:
+            total += self._tree[index]
+            index -= index & -index
+        return total
+
+    def search(self, value: int):
+        """ Returns the first slot where the running sum exceeds value, and the sum before that slot """
+        pos = 0
+        step = 1 << (len(self._tree) - 1).bit_length()
+        while step:
+            nxt = pos + step
+            if nxt < len(self._tree) and self._tree[nxt] <= value:
+                pos = nxt
+                value -= self._tree[nxt]
+            step >>= 1
+        return pos, value
+
+    def clear(self):
+        self._values = [0] * len(self._values)
+        self._tree = [0] * len(self._tree)
+
+
 class MixQueue:
     def __init__(self):
         self.queues = OrderedDict()
         self.priority_queue = []
         self._history = deque(maxlen=11)  # 10 + current
+        # bumped on every change to the order or content of the queue, lets snapshots skip unchanged queues
+        self.revision = 0
+
+        # slot r holds the number of user queues longer than r, i.e. the size of round r in the round robin
+        self._slots = FenwickTree()
+        self._length = 0
+        # cumulative durations per user queue, dropped when the order of a queue changes
+        self._durations = {}
+        self._duration_offsets = {}
 
     def __str__(self):
         tmp = ''
@@ -175,17 +298,34 @@ class MixQueue:
         return out
 
     def __len__(self):
-        length = 0
-        for _ in self:
-            length += 1
-        return length
+        return self._length
 
     def get_queue(self):
         return list(self)
 
+    def get_range(self, start: int, stop: int):
+        """ Tracks at the global positions [start, stop), without walking the queue before them """
+        tracks = []
+        for pos in range(max(start, 0), min(stop, self._length)):
+            requester, local = self._glob_to_loc(pos)
+            if local is None:
+                break
+            tracks.append(self.priority_queue[local] if requester is None else self.queues[requester][local])
+        return tracks
+
+    def get_user_range(self, requester: int, start: int, stop: int):
+        """ Tracks [start, stop) of the queue of requester, with their global positions """
+        queue = self.queues.get(requester, [])
+        return [(track, self._loc_to_glob(requester, pos)) for pos, track in enumerate(queue[start:stop], start=start)]
+
     def clear(self):
+        self.revision += 1
         self.queues = OrderedDict()
         self.priority_queue = []
+        self._slots.clear()
+        self._length = 0
+        self._durations = {}
+        self._duration_offsets = {}
 
     # if dual is true also returns global positions of tracks
     def get_user_queue(self, requester: int, dual: bool = False):
@@ -199,10 +339,16 @@ class MixQueue:
     def pop_first(self):
         if self.priority_queue:
             next_track = self.priority_queue.pop(0)
+            self._length -= 1
+            self.revision += 1
             self._history.append(next_track)
             return next_track
         try:
-            next_track = self.queues[self.first_queue].pop(0)
+            requester = self.first_queue
+            user_queue = self.queues[requester]
+            next_track = user_queue.pop(0)
+            self._resized(len(user_queue) + 1, len(user_queue))
+            self._pop_duration(requester)
             self._shuffle()
             self._clear_empty()
             self._history.append(next_track)
@@ -210,34 +356,71 @@ class MixQueue:
         except KeyError:
             pass
 
-    def add_track(self, requester: int, track: AudioTrack, pos: int = None):
+    def add_track(self, requester: int, track: QueuedTrack, pos: int = None):
         user_queue = self.queues.get(requester)
         if user_queue is None:
-            self.queues[requester] = [track]
+            user_queue = self.queues[requester] = [track]
             localpos = 0
+            self._durations[requester] = [track.duration]
+            self._duration_offsets[requester] = 0
         elif pos is None:
             user_queue.append(track)
             localpos = len(user_queue) - 1
+            durations = self._durations.get(requester)
+            if durations is not None:
+                durations.append((durations[-1] if durations else self._duration_offsets[requester])
+                                 + track.duration)
         else:
             user_queue.insert(pos, track)
-            localpos = pos
+            localpos = min(pos, len(user_queue) - 1)
+            self._invalidate_durations(requester)
+        self._resized(len(user_queue) - 1, len(user_queue))
 
         # Return info about track position
         return track, self._loc_to_glob(requester, localpos), localpos
 
-    def add_next_track(self, track: AudioTrack):
+    def add_tracks(self, requester: int, tracks: typing.List[QueuedTrack]):
+        if not tracks:
+            return 0
+        user_queue = self.queues.get(requester)
+        if user_queue is None:
+            user_queue = self.queues[requester] = []
+            self._durations[requester] = []
+            self._duration_offsets[requester] = 0
+        user_queue.extend(tracks)
+
+        durations = self._durations.get(requester)
+        if durations is not None:
+            total = durations[-1] if durations else self._duration_offsets[requester]
+            for track in tracks:
+                total += track.duration
+                durations.append(total)
+        self._resized(len(user_queue) - len(tracks), len(user_queue))
+        return len(tracks)
+
+    def add_next_track(self, track: QueuedTrack):
         self.priority_queue.append(track)
+        self._length += 1
+        self.revision += 1
+
+    def add_history(self, tracks: typing.Iterable[QueuedTrack]):
+        """ Appends tracks to the history, oldest first """
+        self._history.extend(tracks)
 
     def remove_user_queue(self, requester: int):
         user_queue = self.queues.get(requester, [])
         if user_queue:
             self.queues.pop(requester)
+            self._resized(len(user_queue), 0)
+            self._invalidate_durations(requester)
 
     def remove_user_track(self, requester: int, pos: int):
         user_queue = self.queues.get(requester)
         if user_queue is not None:
             if pos < len(user_queue):
                 track = user_queue.pop(pos)
+                self._resized(len(user_queue) + 1, len(user_queue))
+                self._invalidate_durations(requester)
                 self._clear_empty()
                 return track
 
@@ -245,10 +428,7 @@ class MixQueue:
         q, pos = self._glob_to_loc(pos)
         if q is None or pos is None:
             return
-        queue = self.queues.get(q)
-        track = queue.pop(pos)
-        self._clear_empty()
-        return track
+        return self.remove_user_track(q, pos)
 
     def move_user_track(self, requester: int, initial: int, final: int):
         queue = self.queues.get(requester, [])
@@ -256,6 +436,8 @@ class MixQueue:
             try:
                 track = queue.pop(initial)
                 queue.insert(final, track)
+                self._invalidate_durations(requester)
+                self.revision += 1
                 return track
             except IndexError:
                 pass
@@ -264,6 +446,8 @@ class MixQueue:
         queue = self.queues.get(requester, [])
         if queue:
             shuffle(queue)
+            self._invalidate_durations(requester)
+            self.revision += 1
 
     # Switches the order of user queues
     def _shuffle(self):
@@ -274,46 +458,95 @@ class MixQueue:
         to_remove = [q for q in reversed(self.queues) if not self.queues[q]]
         for i in to_remove:
             self.queues.pop(i)
+            self._invalidate_durations(i)
+
+    # Keeps the round robin slots and total length in sync when a user queue changes length
+    def _resized(self, old: int, new: int):
+        for slot in range(new, old):
+            self._slots.add(slot, -1)
+        for slot in range(old, new):
+            self._slots.add(slot, 1)
+        self._length += new - old
+        self.revision += 1
+
+    def _invalidate_durations(self, requester):
+        self._durations.pop(requester, None)
+        self._duration_offsets.pop(requester, None)
+
+    def _pop_duration(self, requester):
+        durations = self._durations.get(requester)
+        if durations:
+            self._duration_offsets[requester] = durations.pop(0)
+
+    def _user_duration(self, requester, count: int):
+        """ Duration of the first <count> tracks in the queue of requester """
+        if count <= 0:
+            return 0
+        durations = self._durations.get(requester)
+        if durations is None:
+            durations = list(accumulate(track.duration for track in self.queues.get(requester, [])))
+            self._durations[requester] = durations
+            self._duration_offsets[requester] = 0
+        return durations[count - 1] - self._duration_offsets[requester]
 
     def _loc_to_glob(self, requester, pos):
-        globpos = len(self.priority_queue)
-        passed = False
+        globpos = len(self.priority_queue) + self._slots.prefix(pos)
         for key, queue in self.queues.items():
-            if len(queue) <= pos:
-                globpos += len(queue)
-            else:
-                globpos += pos
-                if key == requester:
-                    passed = True
-                if not passed:
-                    globpos += 1
+            if key == requester:
+                break
+            if len(queue) > pos:
+                globpos += 1
         return globpos
 
     def _glob_to_loc(self, pos: int):
-        try:
-            song = next(islice(self, pos, pos + 1))
-        except (ValueError, StopIteration):
+        if pos < 0 or pos >= self._length:
             return None, None
-        user_queue = self.queues.get(song.requester, [])
 
         # In case song is in the priority queue
-        if not user_queue or song not in user_queue:
+        if pos < len(self.priority_queue):
             return None, pos
 
-        for i, s in enumerate(user_queue):
-            if s == song:
-                return song.requester, i
+        local, offset = self._slots.search(pos - len(self.priority_queue))
+        for requester, queue in self.queues.items():
+            if len(queue) > local:
+                if offset == 0:
+                    return requester, local
+                offset -= 1
+        return None, None
+
+    def duration_until(self, pos: int):
+        """ Duration of the tracks ahead of the global position <pos> """
+        if pos >= self._length:
+            return self.duration
+        if pos <= len(self.priority_queue):
+            return sum(track.duration for track in self.priority_queue[:pos])
+
+        requester, local = self._glob_to_loc(pos)
+        duration = sum(track.duration for track in self.priority_queue)
+        passed = False
+        for key, queue in self.queues.items():
+            if key == requester:
+                passed = True
+            count = min(len(queue), local)
+            if not passed and len(queue) > local:
+                count += 1
+            duration += self._user_duration(key, count)
+        return duration
+
+    @property
+    def duration(self):
+        duration = sum(track.duration for track in self.priority_queue)
+        for key, queue in self.queues.items():
+            duration += self._user_duration(key, len(queue))
+        return duration
 
     @property
     def first_queue(self):
-        try:
-            return list(self.queues.keys())[0]
-        except IndexError:
-            pass
+        return next(iter(self.queues), None)
 
     @property
     def empty(self):
-        return len(self) == 0
+        return self._length == 0
 
     @property
     def history(self):
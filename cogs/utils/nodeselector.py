@@ -0,0 +1,62 @@
+# Discord Packages
+from lavalink import Node
+
+"""
+Picks the lavalink node new players are put on
+"""
+
+
+class NodeSelector:
+    def __init__(self, client, region_penalty: float = 100.0):
+        """
+        Scores nodes by their live stats, lower is better.
+        :param client: The lavalink client holding the nodes
+        :param region_penalty: Added to nodes outside the region of the guild
+        """
+        self.client = client
+        self.region_penalty = region_penalty
+
+    def region_of(self, endpoint):
+        """ Maps a discord voice region to the region names used for nodes. """
+        if endpoint is None:
+            return None
+        get_region = getattr(self.client.node_manager, 'get_region', None)
+        if get_region is not None:
+            return get_region(endpoint) or endpoint
+        return endpoint
+
+    @staticmethod
+    def load(node: Node):
+        """
+        Load based penalty, the one lavalink uses for its own balancing plus a share for idle players.
+        Covers playing players, cpu load and nulled and missing frames, frame counts a node did not report are left out.
+        """
+        stats = getattr(node, 'stats', None)
+        if stats is None:
+            return 0.0
+        return stats.penalty.total + stats.players * 0.25
+
+    def score(self, node: Node, region: str = None):
+        """ Returns the score of a node, None when it can't take players. """
+        if not getattr(node, 'available', True):
+            return None
+        score = self.load(node)
+        if region is not None and node.region != region:
+            score += self.region_penalty
+        return score
+
+    def scores(self, endpoint: str = None, region: str = None):
+        region = region or self.region_of(endpoint)
+        return [(node, self.score(node, region)) for node in self.client.node_manager.nodes]
+
+    def select(self, endpoint: str = None, exclude=(), region: str = None):
+        """
+        Returns the least loaded available node, preferring nodes in the region of endpoint.
+        :param exclude: Nodes that should not be picked, like a node that players are moved off
+        :param region: Preferred node region, used instead of the region of endpoint
+        """
+        candidates = [(score, index, node) for index, (node, score) in enumerate(self.scores(endpoint, region))
+                      if score is not None and node not in exclude]
+        if not candidates:
+            return None
+        return min(candidates)[2]
@@ -0,0 +1,67 @@
+import codecs
+import json
+import logging
+import os
+import uuid
+
+"""
+Resume keys of the lavalink nodes, kept in the data directory so a restarted bot can take over the running sessions.
+"""
+
+
+class NodeSessions:
+    def __init__(self, path, timeout: int = 60, logger=None):
+        """
+        One resume key per node name.
+        :param timeout: Seconds a node keeps the players of a disconnected session around, 0 turns resuming off
+        """
+        self.path = path
+        self.timeout = timeout
+        self.logger = logger or logging.getLogger(__name__)
+        self.resuming = set()
+
+        self._keys = {}
+        if os.path.isfile(self.path):
+            try:
+                with codecs.open(self.path, 'r', encoding='utf8') as f:
+                    self._keys = json.load(f)
+            except ValueError:
+                self.logger.warning("Ignoring the unreadable lavalink sessions in %s" % self.path)
+        # Only these nodes had a session to resume, keys made in this run are for sessions that start now
+        self._stored = set(self._keys)
+
+    @property
+    def enabled(self):
+        return bool(self.timeout)
+
+    def key(self, name: str):
+        """ Returns the resume key of a node, a new key is made and saved the first time a node is seen """
+        if not self.enabled:
+            return None
+        key = self._keys.get(name)
+        if key is None:
+            key = self._keys[name] = uuid.uuid4().hex
+            self.save()
+        return key
+
+    def prepare(self, node):
+        """
+        Call right after the node is added, before its websocket connects.
+        When the node had a session before, the first connection asks lavalink to resume it.
+        """
+        if not self.enabled or node.name not in self._stored:
+            return
+        # Lavalink.py only sends the resume key after it configured resuming itself, which it does after connecting
+        node._ws._resuming_configured = True
+        self.resuming.add(node.name)
+
+    async def configure(self, node):
+        """ Asks the node to keep the session around when the bot goes away, needed on every new session """
+        if self.enabled:
+            await node._send(op='configureResuming', key=self.key(node.name), timeout=self.timeout)
+
+    def save(self):
+        tmp_path = self.path + '.tmp'
+        with codecs.open(tmp_path, 'w', encoding='utf8') as f:
+            json.dump(self._keys, f)
+        os.replace(tmp_path, self.path)
@@ -2,6 +2,8 @@
 import discord
 
 import asyncio
+import math
+from collections import OrderedDict
 
 
 class CantScroll(Exception):
@@ -109,30 +111,97 @@ class FieldPaginator(BasePaginator):
         self._current_page.add_field(**field)
 
 
-class QueuePaginator(TextPaginator):
-    def __init__(self, localizer, queue, color, user_name: str = None):
+class LazyPages:
+    def __init__(self, paginator):
+        """ Page sequence for the Scroller, pages are rendered when they are shown """
+        self.paginator = paginator
+
+    def __len__(self):
+        return self.paginator.page_count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError('page index out of range')
+        return self.paginator.render_page(index)
+
+
+class LazyQueuePaginator(BasePaginator):
+    def __init__(self, localizer, queue, color, requester: int = None, user_name: str = None, per_page: int = 10,
+                 max_size: int = 2000, cache_size: int = 3):
+        """
+        Pages through a live MixQueue, only rendering the page that is shown.
+        The page count follows the queue length, and cached pages are rendered again once the queue changed.
+        :param requester: Shows the queue of this user instead of the whole queue
+        :param cache_size: Rendered pages kept around, for scrolling back and forth
+        """
+        super().__init__(max_size=max_size, max_units=per_page)
         self.localizer = localizer
         self.queue = queue
+        self.color = color
+        self.requester = requester
+        self.user_name = user_name
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
 
-        if user_name is None:
-            title = localizer.format_str("{queue.length}", _length=len(queue))
-        else:
-            title = localizer.format_str("{queue.userqueue}",  _user=user_name, _length=len(queue))
+    @property
+    def length(self):
+        if self.requester is None:
+            return len(self.queue)
+        return len(self.queue.get_user_queue(self.requester))
 
-        super().__init__(max_lines=10, **{"color": color, "title": title})
+    @property
+    def page_count(self):
+        return math.ceil(self.length / self._max_units)
 
-        for index, temp in enumerate(queue):
-            if user_name is None:
-                track = temp
-                queued_track = localizer.format_str("{queue.globaltrack}", _index=index+1,  _title=track.title,
-                                                    _uri=track.uri, _user_id=track.requester)
-            else:
-                track, globpos = temp
-                queued_track = localizer.format_str("{queue.usertrack}", _index=index+1, _globalindex=globpos+1,
-                                                    _title=track.title, _uri=track.uri)
+    @property
+    def pages(self):
+        return LazyPages(self)
+
+    def _lines(self, page: int, title_length: int = None):
+        start = page * self._max_units
+        stop = start + self._max_units
+
+        def cut(title):
+            if title_length is not None and len(title) > title_length:
+                return title[:title_length - 1] + '…'
+            return title
+
+        if self.requester is None:
+            return [self.localizer.format_str("{queue.globaltrack}", _index=index + 1, _title=cut(track.title),
+                                              _uri=track.uri, _user_id=track.requester)
+                    for index, track in enumerate(self.queue.get_range(start, stop), start=start)]
+        return [self.localizer.format_str("{queue.usertrack}", _index=index + 1, _globalindex=globpos + 1,
+                                          _title=cut(track.title), _uri=track.uri)
+                for index, (track, globpos) in enumerate(self.queue.get_user_range(self.requester, start, stop),
+                                                         start=start)]
+
+    def render_page(self, page: int):
+        key = (page, self.queue.revision)
+        embed = self._cache.get(key)
+        if embed is not None:
+            self._cache.move_to_end(key)
+            return embed
+
+        lines = self._lines(page)
+        if sum(len(line) + 1 for line in lines) > self._max_size:
+            # Long titles are shortened rather than spilling tracks onto another page
+            lines = self._lines(page, title_length=max(self._max_size // self._max_units - 120, 16))
+
+        length = self.length
+        if self.requester is None:
+            title = self.localizer.format_str("{queue.length}", _length=length)
+        else:
+            title = self.localizer.format_str("{queue.userqueue}", _user=self.user_name, _length=length)
+        embed = discord.Embed(color=self.color, title=title, description='\n'.join(lines))
+        embed.set_footer(text=self.localizer.format_str("{queue.pageindicator}", _current=page + 1,
+                                                        _total=self.page_count))
 
-            self.add_line(queued_track)
-        self.add_page_indicator(self.localizer, "{queue.pageindicator}")
+        self._cache[key] = embed
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return embed
 
 
 class HelpPaginator(FieldPaginator):
@@ -190,6 +259,8 @@ class Scroller:
             ('\N{BLACK RIGHT-POINTING DOUBLE TRIANGLE WITH VERTICAL BAR}', self.last_page),
             ('❌', self.stop_scrolling),
         ]
+        self.reaction_actions = dict(self.reaction_emojis)
+        self.session = None
 
         if ctx.guild is not None:
             self.permissions = self.channel.permissions_for(ctx.guild.me)
@@ -220,9 +291,16 @@ class Scroller:
             return await self.channel.send(embed=self.pages[0])
 
         self.message = await self.channel.send(embed=self.pages[0])
+        self.session = self.bot.reaction_router.open(self.message.id, self.author.id,
+                                                     self.reaction_actions, self.timeout)
+        self.bot.loop.create_task(self.add_reactions())
+
+    async def add_reactions(self):
         for (reaction, _) in self.reaction_emojis:
             if len(self.pages) == 2 and reaction in ('\u23ed', '\u23ee'):
                 continue
+            if self.session.closed:
+                break
 
             await self.message.add_reaction(reaction)
 
@@ -251,44 +329,31 @@ class Scroller:
             if self.clear_command:
                 await self.cmdmsg.delete()
 
-    def react_check(self, reaction, user):
-        if user is None or user.id != self.author.id:
-            return False
-
-        if reaction.message.id != self.message.id:
-            return False
-
-        for (emoji, func) in self.reaction_emojis:
-            if reaction.emoji == emoji:
-                self.match = func
-                return True
-        return False
-
     async def start_scrolling(self):
-        if not self.scrolling:
-            await self.send()
-        else:
-            self.bot.loop.create_task(self.send())
+        await self.send()
+        if self.session is None:
+            return
+
+        with self.session:
+            while self.scrolling:
+                try:
+                    reaction, user = await self.session.wait()
+                except asyncio.TimeoutError:
+                    self.scrolling = False
+                    try:
+                        await self.message.clear_reactions()
+                        if self.timeout_delete:
+                            await self.message.delete()
+                            if self.clear_command:
+                                await self.cmdmsg.delete()
+                    except (discord.Forbidden, discord.NotFound):
+                        pass
+                    finally:
+                        break
 
-        while self.scrolling:
-            try:
-                reaction, user = await self.bot.wait_for('reaction_add', check=self.react_check, timeout=self.timeout)
-            except asyncio.TimeoutError:
-                self.scrolling = False
                 try:
-                    await self.message.clear_reactions()
-                    if self.timeout_delete:
-                        await self.message.delete()
-                        if self.clear_command:
-                            await self.cmdmsg.delete()
+                    await self.message.remove_reaction(reaction, user)
                 except discord.Forbidden:
                     pass
-                finally:
-                    break
-
-            try:
-                await self.message.remove_reaction(reaction, user)
-            except discord.Forbidden:
-                pass
 
-            await self.match()
+                await self.reaction_actions[reaction.emoji]()
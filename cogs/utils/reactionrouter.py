@@ -0,0 +1,141 @@
+import asyncio
+import logging
+
+from .idlescheduler import IdleScheduler
+
+"""
+Hands reactions to the interactive menu they were added to, instead of every menu checking every reaction
+"""
+
+
+class ReactionSession:
+    def __init__(self, router, message_id: int, user_id: int, emojis, timeout: float, backlog: int = 5):
+        """
+        The reactions one user adds to one menu message.
+        :param emojis: The emojis the menu reacts to, other reactions never reach it
+        :param timeout: Seconds without a reaction before the session ends
+        :param backlog: Reactions kept for the menu while it is busy, reactions beyond that are dropped
+        """
+        self.router = router
+        self.message_id = message_id
+        self.user_id = user_id
+        self.emojis = frozenset(emojis)
+        self.timeout = timeout
+        self.backlog = backlog
+        self.closed = False
+        self._reactions = asyncio.Queue()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def accepts(self, reaction, user):
+        return user.id == self.user_id and reaction.emoji in self.emojis
+
+    def deliver(self, reaction, user):
+        if self.closed or self._reactions.qsize() >= self.backlog:
+            return
+        self._reactions.put_nowait((reaction, user))
+
+    async def wait(self):
+        """ Returns the next (reaction, user), raises asyncio.TimeoutError once the session ended """
+        if self.closed and self._reactions.empty():
+            raise asyncio.TimeoutError
+        self.router.rearm(self)
+        item = await self._reactions.get()
+        if item is None:
+            raise asyncio.TimeoutError
+        return item
+
+    def end(self):
+        """ Wakes up the menu waiting on this session, without removing it from the router """
+        if not self.closed:
+            self.closed = True
+            self._reactions.put_nowait(None)
+
+    def close(self):
+        self.router.remove(self)
+
+
+class ReactionRouter:
+    def __init__(self, metrics=None, logger=None):
+        """
+        Keeps the open menu sessions by message id, so a reaction is only looked at by the menu it belongs to.
+        Sessions end once their timeout passed or their message was deleted, even when no menu waits on them anymore.
+        :param metrics: MetricsRegistry the menu stats are kept in, left out when None
+        """
+        self.logger = logger or logging.getLogger(__name__)
+        self._sessions = {}
+        self.scheduler = IdleScheduler(self._expire, logger=self.logger)
+
+        if metrics is not None:
+            self.delivered = metrics.counter('menu_reactions_total', 'Reactions handed to an interactive menu')
+            self.expired = metrics.counter('menu_timeouts_total', 'Interactive menus that timed out')
+        else:
+            self.delivered = self.expired = None
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, message_id):
+        return message_id in self._sessions
+
+    def open(self, message_id: int, user_id: int, emojis, timeout: float, **kwargs):
+        """
+        Starts routing the reactions user_id adds to message_id, a session the message had already is ended.
+        Close the returned session when the menu is done, it can be used in a with block.
+        """
+        old = self._sessions.get(message_id)
+        if old is not None:
+            self.remove(old)
+        self.scheduler.start()
+        session = ReactionSession(self, message_id, user_id, emojis, timeout, **kwargs)
+        self._sessions[message_id] = session
+        self.scheduler.arm(message_id, timeout)
+        return session
+
+    def rearm(self, session):
+        if self._sessions.get(session.message_id) is session:
+            self.scheduler.cancel(session.message_id)
+            self.scheduler.arm(session.message_id, session.timeout)
+
+    def remove(self, session):
+        if self._sessions.get(session.message_id) is session:
+            del self._sessions[session.message_id]
+            self.scheduler.cancel(session.message_id)
+        session.end()
+
+    async def _expire(self, message_id):
+        session = self._sessions.pop(message_id, None)
+        if session is not None:
+            if self.expired is not None:
+                self.expired.inc()
+            session.end()
+
+    async def on_reaction_add(self, reaction, user):
+        session = self._sessions.get(reaction.message.id)
+        if session is None or not session.accepts(reaction, user):
+            return
+        if self.delivered is not None:
+            self.delivered.inc()
+        session.deliver(reaction, user)
+
+    def discard(self, message_id: int):
+        """ Ends the session of a message that is gone """
+        session = self._sessions.get(message_id)
+        if session is not None:
+            self.remove(session)
+
+    async def on_raw_message_delete(self, payload):
+        self.discard(payload.message_id)
+
+    async def on_raw_bulk_message_delete(self, payload):
+        for message_id in payload.message_ids:
+            self.discard(message_id)
+
+    def close(self):
+        for session in list(self._sessions.values()):
+            self.remove(session)
+        self.scheduler.close()
@@ -69,6 +69,7 @@ class Selector(TextPaginator):
         self.control_input = False
         self.scrolling = True
         self.stopped = False
+        self.session = None
 
         self.add_page_indicator(self.localizer, "{queue.pageindicator}")
         if self.round_titles:
@@ -94,28 +95,18 @@ class Selector(TextPaginator):
         for page in self.pages:
             page.title = updated_title
 
-    def _react_check(self, reaction, user):
-        if user is None or user.id != self.author.id:
-            return False
-
-        if reaction.message.id != self.message.id:
-            return False
-
-        for i, emoji in enumerate(self.select_emojis):
-            if emoji == reaction.emoji:
-                choice = i + self.current_page * self.num_selections
-                if choice >= len(self.selections):
-                    return True
+    def _resolve(self, emoji):
+        """ Sets the function and arguments the reaction emoji stands for, match is None for an empty slot """
+        self.match = None
+        if emoji in self.select_emojis:
+            choice = self.select_emojis.index(emoji) + self.current_page * self.num_selections
+            if choice < len(self.selections):
                 self.match = self.selections[choice][1]
                 self.args = self.selections[choice][2]
-                return True
+            return
 
-        for (emoji, func) in self.control_emojis:
-            if reaction.emoji == emoji:
-                self.match = func
-                self.control_input = True
-                return True
-        return False
+        self.match = dict(self.control_emojis)[emoji]
+        self.control_input = True
 
     async def send(self):
         # No embeds to scroll through
@@ -123,7 +114,12 @@ class Selector(TextPaginator):
             return
 
         self.message = await self.channel.send(embed=self.pages[0])
+        self.session = self.bot.reaction_router.open(
+            self.message.id, self.author.id, self.select_emojis + [emoji for emoji, _ in self.control_emojis],
+            self.timeout)
+        self.bot.loop.create_task(self.add_reactions())
 
+    async def add_reactions(self):
         for reaction in self.select_emojis[:self.max_selections]:
             if not self.stopped:
                 await self.message.add_reaction(reaction)
@@ -138,58 +134,59 @@ class Selector(TextPaginator):
 
     async def start_scrolling(self):
         result = None
-        if not self.scrolling:
-            await self.send()
-        else:
-            self.bot.loop.create_task(self.send())
+        await self.send()
+        if self.session is None:
+            return self.message, None, []
 
         current_round = 0
         results = []
-        while self.scrolling:
-            try:
-                reaction, user = await self.bot.wait_for('reaction_add', check=self._react_check, timeout=self.timeout)
-            except asyncio.TimeoutError:
-                self.scrolling = False
+        with self.session:
+            while self.scrolling:
                 try:
-                    await self.message.clear_reactions()
-                except (discord.Forbidden, discord.HTTPException):
-                    pass
-                finally:
-                    break
-
-            try:
-                await self.message.remove_reaction(reaction, user)
-            except (discord.Forbidden, discord.HTTPException, discord.NotFound, discord.InvalidArgument):
-                pass
-            if self.match:
-                if inspect.iscoroutinefunction(self.match):
-                    if self.args:
-                        result = await self.match(*self.args)
-                    else:
-                        result = await self.match()
-                else:
-                    if self.args:
-                        result = self.match(*self.args)
-                    else:
-                        result = self.match()
-            else:
-                continue
-
-            if self.terminate_on_select and not self.control_input:
-                current_round += 1
-                results.append(result)
-                if not self.round_titles:
-                    self.stopped = True
+                    reaction, user = await self.session.wait()
+                except asyncio.TimeoutError:
+                    self.scrolling = False
                     try:
                         await self.message.clear_reactions()
                     except (discord.Forbidden, discord.HTTPException):
                         pass
-                    break
-                if self.round_titles:
-                    self.update_embed_title(self.round_titles.pop(0))
-                    await self.scroll(self.current_page)
-            self.args = None
-            self.control_input = False
+                    finally:
+                        break
+
+                try:
+                    await self.message.remove_reaction(reaction, user)
+                except (discord.Forbidden, discord.HTTPException, discord.NotFound, discord.InvalidArgument):
+                    pass
+                self._resolve(reaction.emoji)
+                if self.match:
+                    if inspect.iscoroutinefunction(self.match):
+                        if self.args:
+                            result = await self.match(*self.args)
+                        else:
+                            result = await self.match()
+                    else:
+                        if self.args:
+                            result = self.match(*self.args)
+                        else:
+                            result = self.match()
+                else:
+                    continue
+
+                if self.terminate_on_select and not self.control_input:
+                    current_round += 1
+                    results.append(result)
+                    if not self.round_titles:
+                        self.stopped = True
+                        try:
+                            await self.message.clear_reactions()
+                        except (discord.Forbidden, discord.HTTPException):
+                            pass
+                        break
+                    if self.round_titles:
+                        self.update_embed_title(self.round_titles.pop(0))
+                        await self.scroll(self.current_page)
+                self.args = None
+                self.control_input = False
         if len(results) == 1:
             return self.message, self.pages[self.current_page], results[0]
         else:
@@ -1,20 +1,42 @@
-import codecs
 import locale as localee
 import os
 
-import yaml
+# Bot Utilities
+from cogs.utils.settingsstorage import SqliteStorage, YamlStorage, migrate
+
+
+class GuildSettings:
+    __slots__ = ('prefixes', 'locale', 'text_channels', 'music_channels', 'listen_channels', 'mod_role', 'dj_roles',
+                 'threshold', 'max_duration', 'is_dynamic', 'idle_timeout')
+
+    def __init__(self, settings, guild):
+        """ The settings of a guild resolved against the defaults, used on every message. """
+        self.prefixes = tuple(settings.get(guild, 'prefixes', 'default_prefix'))
+        self.locale = settings.get(guild, 'locale', 'default_locale')
+        self.text_channels = frozenset(settings.get(guild, 'channels.text', []) or [])
+        self.music_channels = frozenset(settings.get(guild, 'channels.music', []) or [])
+        self.listen_channels = frozenset(settings.get(guild, 'channels.listen_only', []) or [])
+        self.mod_role = settings.get(guild, 'roles.moderator', 'default_mod')
+        self.dj_roles = frozenset(settings.get(guild, 'roles.dj', []) or [])
+        self.threshold = settings.get(guild, 'vote_threshold', 'default_threshold')
+        self.max_duration = settings.get(guild, 'duration.max', None)
+        self.is_dynamic = settings.get(guild, 'duration.is_dynamic', 'default_is_dynamic')
+        self.idle_timeout = settings.get(guild, 'idle_timeout', 'default_idle_timeout')
 
 
 class Settings:
-    def __init__(self, datadir, **default_settings):
+    def __init__(self, datadir, storage: str = 'yaml', flush_delay: float = 5.0, max_flush_delay: float = 30.0,
+                 **default_settings):
         self._DATA_PATH = f"{datadir}/bot/"
         self._SETTINGS_PATH = self._DATA_PATH + 'settings.yaml'
+        self._DATABASE_PATH = self._DATA_PATH + 'settings.sqlite3'
 
         self.default_prefix = default_settings["prefix"]
         self.default_mod = default_settings["moderator role"]
         self.default_locale = default_settings["locale"]
         self.default_threshold = default_settings["threshold"]
         self.default_is_dynamic = default_settings["dynamic max duration"]
+        self.default_idle_timeout = default_settings.get("idle timeout", 60)
 
         if not self.default_locale:
             locale, codepage = localee.getlocale()
@@ -24,54 +46,42 @@ class Settings:
         if not os.path.exists(self._DATA_PATH):
             os.makedirs(self._DATA_PATH)
 
-        if not os.path.isfile(self._SETTINGS_PATH):
-            with codecs.open(self._SETTINGS_PATH, "w+", encoding='utf8') as f:
-                yaml.dump({}, f, indent=2)
-
-        with codecs.open(self._SETTINGS_PATH, "r", encoding='utf8') as f:
-            self.settings = yaml.load(f, Loader=yaml.SafeLoader)
-
-    def _set(self, d, keys, val):
-        key = keys[0]
-        if len(keys) == 1:
-            if val is None:
-                try:
-                    d.pop(key)
-                except KeyError:
-                    pass
-            else:
-                d[key] = val
-            return
-        if key in d.keys():
-            if not isinstance(d[key], dict):
-                d[key] = {}
-            self._set(d[key], keys[1:], val)
+        if storage == 'sqlite':
+            is_new = not os.path.isfile(self._DATABASE_PATH)
+            self.storage = SqliteStorage(self._DATABASE_PATH, flush_delay=flush_delay,
+                                         max_flush_delay=max_flush_delay)
+            # One-shot import of the old settings file when the database is first created
+            if is_new and os.path.isfile(self._SETTINGS_PATH):
+                old_storage = YamlStorage(self._SETTINGS_PATH)
+                migrate(old_storage, self.storage)
+                old_storage.close()
+        elif storage == 'yaml':
+            self.storage = YamlStorage(self._SETTINGS_PATH, flush_delay=flush_delay, max_flush_delay=max_flush_delay)
         else:
-            d[key] = {}
-            self._set(d[key], keys[1:], val)
-
-    def _get(self, d, keys):
-        key = keys[0]
-        try:
-            if len(keys) > 1 and isinstance(d[key], dict):
-                return self._get(d[key], keys[1:])
-            else:
-                return d[key]
-        except KeyError:
-            return None
+            raise ValueError(f'Unknown settings storage: {storage}')
+
+        self._resolved = {}
+
+    def flush(self):
+        self.storage.flush()
+
+    def close(self):
+        self.storage.close()
 
     def set(self, guild, setting, value):
         """ Set value in settings, will overwrite any existing values. """
         guild_id = str(guild.id)
 
-        if guild_id not in self.settings.keys():
-            self.settings[guild_id] = {}
-
-        self.settings[guild_id]["_servername"] = guild.name
-        self._set(self.settings[guild_id], setting.split('.'), value)
+        self.storage.set(guild_id, ["_servername"], guild.name)
+        self.storage.set(guild_id, setting.split('.'), value)
+        self._resolved.pop(guild.id, None)
 
-        with codecs.open(self._SETTINGS_PATH, 'w', encoding='utf8') as f:
-            yaml.dump(self.settings, f, indent=2)
+    def resolve(self, guild):
+        """ Returns the resolved settings of a guild, rebuilt after the guild changes a setting. """
+        resolved = self._resolved.get(guild.id)
+        if resolved is None:
+            resolved = self._resolved[guild.id] = GuildSettings(self, guild)
+        return resolved
 
     def get(self, guild, setting, default=''):
         """ Gets a value from the settings if a default return value is specified
@@ -84,10 +94,7 @@ class Settings:
         elif not default:
             default = None
 
-        if guild_id not in self.settings.keys():
-            return default
-
-        value = self._get(self.settings[guild_id], setting.split('.'))
+        value = self.storage.get(guild_id, setting.split('.'))
         if value is not None:
             return value
         else:
@@ -0,0 +1,371 @@
+import codecs
+import copy
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import yaml
+
+"""
+Storage engines for the guild settings. Keys are lists of path components, e.g. ['channels', 'text'].
+"""
+
+
+# The settings of thousands of guilds take seconds to parse without libyaml
+_Loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+class _NoAliasDumper(yaml.Dumper):
+    # Guild blocks are dumped one by one and concatenated, anchors would collide between them
+    def ignore_aliases(self, data):
+        return True
+
+
+class SettingsStorage:
+    def get(self, guild_id: str, keys: list):
+        """ Returns the value at keys, None if nothing is stored. """
+        raise NotImplementedError
+
+    def set(self, guild_id: str, keys: list, value):
+        """ Stores value at keys, a value of None removes the key. """
+        raise NotImplementedError
+
+    def guilds(self):
+        """ Returns every stored guild id. """
+        raise NotImplementedError
+
+    def dump_guild(self, guild_id: str):
+        """ Returns the whole settings tree of a guild. """
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class _WriteBehind:
+    """ Debounced writes by a worker thread, for engines whose writes are too slow to do on the event loop """
+    def _start_writer(self, flush_delay, max_flush_delay, logger):
+        self.flush_delay = flush_delay
+        self.max_flush_delay = max_flush_delay
+        self.logger = logger or logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._changed = threading.Event()
+        self._stopping = threading.Event()
+        self._closed = False
+        self._first_change = None
+        self._last_change = None
+
+        self._writer = threading.Thread(target=self._write_behind, name='SettingsWriter', daemon=True)
+        self._writer.start()
+
+    def _mark_changed(self):
+        """ Call with _lock held """
+        self._last_change = time.monotonic()
+        if self._first_change is None:
+            self._first_change = self._last_change
+        self._changed.set()
+
+    def _write_behind(self):
+        while not self._closed:
+            self._changed.wait()
+            # Wait for the changes to settle down, but never longer than max_flush_delay
+            while not self._closed:
+                now = time.monotonic()
+                with self._lock:
+                    if self._last_change is None:
+                        break
+                    settle = self._last_change + self.flush_delay
+                    deadline = self._first_change + self.max_flush_delay
+                wait = min(settle, deadline) - now
+                if wait <= 0:
+                    break
+                # Woken up early by close
+                self._stopping.wait(wait)
+            try:
+                self.flush()
+            except Exception:
+                self.logger.exception("Writing the settings failed, retrying in %s seconds" % self.flush_delay)
+                # The changes are still pending, try again once flush_delay passed
+                with self._lock:
+                    self._mark_changed()
+
+    def close(self):
+        """ Stops the writer and writes anything still pending. """
+        if self._closed:
+            return
+        self._closed = True
+        self._stopping.set()
+        self._changed.set()
+        self._writer.join()
+        self.flush()
+
+
+def _set(d, keys, val):
+    key = keys[0]
+    if len(keys) == 1:
+        if val is None:
+            try:
+                d.pop(key)
+            except KeyError:
+                pass
+        else:
+            d[key] = val
+        return
+    if key in d.keys():
+        if not isinstance(d[key], dict):
+            d[key] = {}
+        _set(d[key], keys[1:], val)
+    else:
+        d[key] = {}
+        _set(d[key], keys[1:], val)
+
+
+def _get(d, keys):
+    key = keys[0]
+    try:
+        if len(keys) > 1 and isinstance(d[key], dict):
+            return _get(d[key], keys[1:])
+        else:
+            return d[key]
+    except KeyError:
+        return None
+
+
+class YamlStorage(_WriteBehind, SettingsStorage):
+    def __init__(self, path, flush_delay: float = 5.0, max_flush_delay: float = 30.0, logger=None):
+        """
+        The whole settings document kept in memory and written to a single yaml file.
+        Changes are written by a worker thread once no new changes have arrived for flush_delay seconds,
+        only guilds that changed since the last write are serialized again.
+        """
+        self.path = path
+
+        if not os.path.isfile(self.path):
+            with codecs.open(self.path, "w+", encoding='utf8') as f:
+                yaml.dump({}, f, indent=2)
+
+        with codecs.open(self.path, "r", encoding='utf8') as f:
+            self.settings = yaml.load(f, Loader=_Loader) or {}
+
+        self._dirty = set()
+        # Set when the chunks hold changes that did not make it to disk yet
+        self._unwritten = False
+        # The dumped guilds, only made by the writer once the file has to be written the first time
+        self._chunks = None
+        self._start_writer(flush_delay, max_flush_delay, logger)
+
+    def get(self, guild_id, keys):
+        if guild_id not in self.settings.keys():
+            return None
+        return _get(self.settings[guild_id], keys)
+
+    def set(self, guild_id, keys, value):
+        with self._lock:
+            if guild_id not in self.settings.keys():
+                self.settings[guild_id] = {}
+            _set(self.settings[guild_id], keys, value)
+
+            self._dirty.add(guild_id)
+            self._mark_changed()
+
+    def guilds(self):
+        return list(self.settings.keys())
+
+    def dump_guild(self, guild_id):
+        return self.settings.get(guild_id, {})
+
+    def _dump_chunk(self, guild_id):
+        """ Dumps a copy of a guild taken under _lock, so set never waits on yaml. None when the guild is gone """
+        with self._lock:
+            if guild_id not in self.settings:
+                return None
+            tree = copy.deepcopy(self.settings[guild_id])
+        return yaml.dump({guild_id: tree}, Dumper=_NoAliasDumper, indent=2)
+
+    def flush(self):
+        """ Writes pending changes to disk, the file is replaced atomically. """
+        with self._flush_lock:
+            with self._lock:
+                self._changed.clear()
+                self._first_change = self._last_change = None
+                dirty, self._dirty = self._dirty, set()
+                if self._chunks is None and dirty:
+                    dirty = set(self.settings)
+                if not dirty and not self._unwritten:
+                    return
+
+            chunks = {} if self._chunks is None else self._chunks
+            try:
+                # A guild changed while it is dumped is dirty again, and dumped again by the next flush
+                for guild_id in dirty:
+                    chunk = self._dump_chunk(guild_id)
+                    if chunk is None:
+                        chunks.pop(guild_id, None)
+                    else:
+                        chunks[guild_id] = chunk
+            except Exception:
+                with self._lock:
+                    self._dirty |= dirty
+                raise
+            self._chunks = chunks
+            self._unwritten = True
+
+            tmp_path = self.path + '.tmp'
+            with codecs.open(tmp_path, 'w', encoding='utf8') as f:
+                if chunks:
+                    f.writelines(chunks.values())
+                else:
+                    yaml.dump({}, f, indent=2)
+            os.replace(tmp_path, self.path)
+            self._unwritten = False
+
+
+class SqliteStorage(_WriteBehind, SettingsStorage):
+    def __init__(self, path, flush_delay: float = 5.0, max_flush_delay: float = 30.0, logger=None):
+        """
+        One row per guild and key path, with json encoded values.
+        Nested values are stored as their leaves, so 'channels.text' and 'channels.music' are separate rows.
+        Empty sub trees are not kept, where the yaml storage would return {} this returns None.
+        Changes are queued and applied by a worker thread in one short transaction on its own connection,
+        reads see the queued changes on top of what is stored. The database is never left locked between writes,
+        so several processes can share it.
+        """
+        self.path = path
+        # Written by the writer thread only, the event loop only ever reads through self.db
+        self._write_db = sqlite3.connect(self.path, check_same_thread=False)
+        self._write_db.execute('PRAGMA journal_mode=WAL')
+        self._write_db.execute('PRAGMA synchronous=NORMAL')
+        self._write_db.execute('CREATE TABLE IF NOT EXISTS settings ('
+                               'guild_id TEXT NOT NULL, path TEXT NOT NULL, value TEXT NOT NULL, '
+                               'PRIMARY KEY (guild_id, path)) WITHOUT ROWID')
+        self._write_db.commit()
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        # Changes not committed yet, per guild in the order they were made
+        self._pending = {}
+        self._start_writer(flush_delay, max_flush_delay, logger)
+
+    @staticmethod
+    def _leaves(keys, value):
+        if isinstance(value, dict):
+            for key, sub_value in value.items():
+                yield from SqliteStorage._leaves(keys + [str(key)], sub_value)
+        elif value is not None:
+            yield '.'.join(keys), json.dumps(value)
+
+    @staticmethod
+    def _subtree(path):
+        # Every path below path, '/' is the character following '.'
+        return path + '.', path + '/'
+
+    def _pending_tree(self, guild_id):
+        """ The stored tree of a guild with its queued changes applied, call with _lock held """
+        tree = {}
+        rows = self.db.execute('SELECT path, value FROM settings WHERE guild_id = ?', (guild_id,)).fetchall()
+        for path, value in rows:
+            _set(tree, path.split('.'), json.loads(value))
+        for keys, value in self._pending[guild_id]:
+            _set(tree, keys, value)
+        # Stored the same way the rows would store it, empty sub trees are dropped
+        stored = {}
+        for path, value in self._leaves([], tree):
+            _set(stored, path.split('.'), json.loads(value))
+        return stored
+
+    def get(self, guild_id, keys):
+        with self._lock:
+            if guild_id in self._pending:
+                return _get(self._pending_tree(guild_id), keys)
+            # Like the yaml storage a leaf above the requested path is returned as is
+            paths = ['.'.join(keys[:i]) for i in range(1, len(keys) + 1)]
+            path = paths[-1]
+            low, high = self._subtree(path)
+            rows = self.db.execute(f'SELECT path, value FROM settings WHERE guild_id = ? AND '
+                                   f'(path IN ({", ".join("?" * len(paths))}) OR (path >= ? AND path < ?))',
+                                   (guild_id, *paths, low, high)).fetchall()
+        if not rows:
+            return None
+
+        tree = {}
+        for row_path, value in rows:
+            if row_path in paths:
+                return json.loads(value)
+            _set(tree, row_path[len(low):].split('.'), json.loads(value))
+        return tree
+
+    def set(self, guild_id, keys, value):
+        with self._lock:
+            self._pending.setdefault(guild_id, []).append((list(keys), copy.deepcopy(value)))
+            self._mark_changed()
+
+    def _write(self, guild_id, keys, value):
+        path = '.'.join(keys)
+        low, high = self._subtree(path)
+        # Setting a path replaces anything below it, and any leaf above it stops being a leaf
+        self._write_db.execute('DELETE FROM settings WHERE guild_id = ? AND (path = ? OR (path >= ? AND path < ?))',
+                               (guild_id, path, low, high))
+        parents = ['.'.join(keys[:i]) for i in range(1, len(keys))]
+        if parents:
+            self._write_db.execute(f'DELETE FROM settings WHERE guild_id = ? AND path IN '
+                                   f'({", ".join("?" * len(parents))})', (guild_id, *parents))
+        self._write_db.executemany('INSERT INTO settings (guild_id, path, value) VALUES (?, ?, ?)',
+                                   [(guild_id, leaf, leaf_value) for leaf, leaf_value in self._leaves(keys, value)])
+
+    def guilds(self):
+        with self._lock:
+            guilds = {row[0] for row in self.db.execute('SELECT DISTINCT guild_id FROM settings')}
+            for guild_id in self._pending:
+                if self._pending_tree(guild_id):
+                    guilds.add(guild_id)
+                else:
+                    guilds.discard(guild_id)
+        return list(guilds)
+
+    def dump_guild(self, guild_id):
+        with self._lock:
+            if guild_id in self._pending:
+                return self._pending_tree(guild_id)
+            rows = self.db.execute('SELECT path, value FROM settings WHERE guild_id = ?', (guild_id,)).fetchall()
+        tree = {}
+        for path, value in rows:
+            _set(tree, path.split('.'), json.loads(value))
+        return tree
+
+    def flush(self):
+        """ Applies the queued changes in one transaction, they stay queued for reads until it is committed """
+        with self._flush_lock:
+            with self._lock:
+                self._changed.clear()
+                self._first_change = self._last_change = None
+                batch = {guild_id: list(changes) for guild_id, changes in self._pending.items()}
+            if not batch:
+                return
+            with self._write_db:
+                for guild_id, changes in batch.items():
+                    for keys, value in changes:
+                        self._write(guild_id, keys, value)
+            with self._lock:
+                for guild_id, changes in batch.items():
+                    pending = self._pending[guild_id]
+                    del pending[:len(changes)]
+                    if not pending:
+                        del self._pending[guild_id]
+
+    def close(self):
+        super().close()
+        self.db.close()
+        self._write_db.close()
+
+
+def migrate(source: SettingsStorage, target: SettingsStorage):
+    """ Copies every guild from source into target. """
+    for guild_id in source.guilds():
+        for key, value in source.dump_guild(guild_id).items():
+            target.set(guild_id, [key], value)
+    target.flush()
@@ -0,0 +1,125 @@
+import json
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .mixplayer import QueuedTrack
+
+"""
+Snapshots of the players kept in the data directory, so queues survive a restart of the bot.
+Tracks are stored as the encoded lavalink track with its metadata, nothing has to be looked up again to restore them.
+"""
+
+
+def dump_track(track: QueuedTrack):
+    return [track.track, track.identifier, track.title, track.uri, track.author, track.duration,
+            track.requester, track.thumbnail_url, track.stream, track.is_seekable]
+
+
+def load_track(record):
+    return QueuedTrack(*record)
+
+
+def dump_queue(queue):
+    """ Everything a MixQueue needs to be rebuilt in the same order. """
+    return {
+        'priority': [dump_track(track) for track in queue.priority_queue],
+        'queues': [[requester, [dump_track(track) for track in tracks]] for requester, tracks in queue.queues.items()],
+        'history': [dump_track(track) for track in reversed(queue.history)]
+    }
+
+
+def load_queue(queue, data: dict):
+    queue.clear()
+    for record in data['priority']:
+        queue.add_next_track(load_track(record))
+    for requester, records in data['queues']:
+        queue.add_tracks(requester, [load_track(record) for record in records])
+    queue.add_history(load_track(record) for record in data['history'])
+
+
+def dump_state(player):
+    """ The part of a player that changes while a track plays, small enough to write every time. """
+    return {
+        'channel': player.channel_id,
+        'node': player.node.name,
+        'current': dump_track(QueuedTrack.from_track(player.current, player.current.requester))
+        if player.current is not None else None,
+        'position': int(player.position),
+        'paused': player.paused,
+        'volume': player.volume,
+        'boosted': player.boosted
+    }
+
+
+class SnapshotStore:
+    def __init__(self, path):
+        """
+        One row per player. The queue is only written again when its revision changed since the last snapshot,
+        the playing state is written every time. Writes happen on a worker thread.
+        """
+        self.path = path
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS players ('
+                        'guild_id INTEGER PRIMARY KEY, state TEXT NOT NULL, queue TEXT NOT NULL, saved REAL NOT NULL)')
+        self.db.commit()
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='SnapshotWriter')
+        self._revisions = {}
+
+    def snapshot(self, players):
+        """
+        Serializes players, call it on the event loop so every player is captured in a consistent state.
+        Returns the rows to hand to write, players with nothing to play are left out and removed from the store.
+        """
+        now = time.time()
+        states, queues, removed = [], [], []
+        for player in players:
+            guild_id = int(player.guild_id)
+            if not player.is_connected or (player.current is None and player.queue.empty):
+                if guild_id in self._revisions:
+                    removed.append(guild_id)
+                continue
+            state = json.dumps(dump_state(player))
+            revision = player.queue.revision
+            if self._revisions.get(guild_id) == revision:
+                states.append((state, now, guild_id))
+            else:
+                queues.append((guild_id, state, json.dumps(dump_queue(player.queue)), now))
+                self._revisions[guild_id] = revision
+
+        seen = {int(player.guild_id) for player in players}
+        removed.extend(guild_id for guild_id in self._revisions if guild_id not in seen)
+        for guild_id in removed:
+            self._revisions.pop(guild_id, None)
+        return states, queues, removed
+
+    def _write(self, states, queues, removed):
+        with self.db:
+            self.db.executemany('UPDATE players SET state = ?, saved = ? WHERE guild_id = ?', states)
+            self.db.executemany('INSERT OR REPLACE INTO players (guild_id, state, queue, saved) VALUES (?, ?, ?, ?)',
+                                queues)
+            self.db.executemany('DELETE FROM players WHERE guild_id = ?', [(guild_id,) for guild_id in removed])
+
+    async def save(self, loop, players):
+        """ Snapshots players and writes the changes without blocking the event loop. Returns the rows written. """
+        states, queues, removed = self.snapshot(players)
+        await loop.run_in_executor(self._executor, self._write, states, queues, removed)
+        return len(states) + len(queues)
+
+    def load(self, max_age: float = None):
+        """ Returns (guild id, state, queue) of every stored player, skipping snapshots older than max_age seconds. """
+        oldest = time.time() - max_age if max_age else 0
+        rows = self.db.execute('SELECT guild_id, state, queue FROM players WHERE saved >= ?', (oldest,)).fetchall()
+        self.db.execute('DELETE FROM players WHERE saved < ?', (oldest,))
+        self.db.commit()
+        for guild_id, _, _ in rows:
+            # Unknown revision, the next snapshot rewrites the row, or removes it if the player wasn't restored
+            self._revisions[guild_id] = None
+        return [(guild_id, json.loads(state), json.loads(queue)) for guild_id, state, queue in rows]
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.db.close()
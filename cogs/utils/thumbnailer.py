@@ -1,4 +1,6 @@
-from bs4 import BeautifulSoup as bs4
+import asyncio
+
+from .metaextractor import MetaExtractor, extract
 
 
 class ThumbNailer(object):
@@ -6,52 +8,62 @@ class ThumbNailer(object):
         self.bot = bot
         self.logger = self.bot.main_logger.bot_logger.getChild("ThumbNailer")
 
-    async def get_html(self, url):
-        async with self.bot.session.get(url, timeout=30) as response:
-            assert response.status == 200
-            return await response.read()
-
     @staticmethod
-    async def _soundcloud(self, url):
-        html = await ThumbNailer.get_html(self, url)
+    async def _extract(self, url, extractor, **kwargs):
         try:
-            soup = bs4(html, 'html.parser')
-            img = soup.find("meta", property="twitter:image")
-            return img["content"]
+            return await extract(self.bot.web, url, extractor, endpoint='thumbnails', **kwargs)
         except Exception as e:
             self.logger.exception("%s" % e)
 
+    @staticmethod
+    async def _soundcloud(self, url):
+        return await ThumbNailer._extract(self, url, MetaExtractor(meta=('twitter:image',)))
+
     async def _bandcamp(self, url):
-        html = await ThumbNailer.get_html(self, url)
-        try:
-            soup = bs4(html, 'html.parser')
-            img = soup.find(class_="popupImage").get("href")
-            return img
-        except Exception as e:
-            self.logger.exception("%s" % e)
+        # The full size cover is only linked in the body, after the player scripts
+        return await ThumbNailer._extract(self, url, MetaExtractor(link_class='popupImage', stop_at_head=False),
+                                          max_bytes=1048576)
 
     async def _vimeo(self, url):
-        html = await ThumbNailer.get_html(self, url)
-        try:
-            soup = bs4(html, 'html.parser')
-            img = soup.find("meta", property="og:image")
-            return img["content"]
-        except Exception as e:
-            self.logger.exception("%s" % e)
+        return await ThumbNailer._extract(self, url, MetaExtractor(meta=('og:image',)))
 
     @staticmethod
-    async def identify(self, identifier, uri):
+    def youtube(identifier, uri):
+        """ Returns the thumbnail of youtube tracks without a lookup, None for anything else. """
         if "youtube" in uri:
-            thumbnail_url = f"https://img.youtube.com/vi/{identifier}/0.jpg"
-            return thumbnail_url
-        elif "soundcloud" in uri:
-            thumbnail_url = await ThumbNailer._soundcloud(self, url=uri)
-            return thumbnail_url
+            return f"https://img.youtube.com/vi/{identifier}/0.jpg"
+
+    @staticmethod
+    async def _lookup(self, uri):
+        if "soundcloud" in uri:
+            return await ThumbNailer._soundcloud(self, url=uri)
         elif "bandcamp" in uri:
-            thumbnail_url = await ThumbNailer._bandcamp(self, url=uri)
-            return thumbnail_url
+            return await ThumbNailer._bandcamp(self, url=uri)
         elif "vimeo" in uri:
-            thumbnail_url = await ThumbNailer._vimeo(self, url=uri)
-            return thumbnail_url
-        else:
+            return await ThumbNailer._vimeo(self, url=uri)
+
+    @staticmethod
+    async def identify(self, identifier, uri):
+        if "youtube" in uri:
+            return ThumbNailer.youtube(identifier, uri)
+        elif not any(site in uri for site in ("soundcloud", "bandcamp", "vimeo")):
             return None
+
+        cache = getattr(self.bot, 'caches', {}).get('thumbnails')
+        if cache is None:
+            return await ThumbNailer._lookup(self, uri)
+        return await cache.get_or_fetch(uri, lambda: ThumbNailer._lookup(self, uri))
+
+    @staticmethod
+    async def identify_tracks(self, tracks, limit: int = 5):
+        """ Resolves thumbnails for already queued tracks, with at most <limit> lookups at a time. """
+        semaphore = asyncio.Semaphore(limit)
+
+        async def resolve(track):
+            async with semaphore:
+                try:
+                    track.thumbnail_url = await ThumbNailer.identify(self, track.identifier, track.uri)
+                except Exception as e:
+                    self.logger.debug("Thumbnail lookup for %s failed: %s" % (track.uri, e))
+
+        await asyncio.gather(*[resolve(track) for track in tracks])
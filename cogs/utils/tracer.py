@@ -0,0 +1,101 @@
+import logging
+import random
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+"""
+Opt-in timing of the stages a command goes through, from parsing the message to the reply
+"""
+
+
+class Trace:
+    __slots__ = ('name', 'start', 'spans', '_open')
+
+    def __init__(self):
+        """ The spans of a single invocation, spans may nest so their durations don't have to add up. """
+        self.name = None
+        self.start = time.perf_counter()
+        self.spans = []
+        self._open = {}
+
+    def begin(self, stage: str):
+        self._open[stage] = time.perf_counter()
+
+    def end(self, stage: str):
+        start = self._open.pop(stage, None)
+        if start is not None:
+            self.spans.append((stage, time.perf_counter() - start))
+
+    @contextmanager
+    def span(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans.append((stage, time.perf_counter() - start))
+
+    @property
+    def duration(self):
+        return time.perf_counter() - self.start
+
+
+def span(ctx, stage: str):
+    """ Times stage on the trace of ctx, does nothing when the invocation isn't traced. """
+    trace = getattr(ctx, 'trace', None)
+    if trace is None:
+        return nullcontext()
+    return trace.span(stage)
+
+
+class Tracer:
+    def __init__(self, sample_rate: float = 0.0, slow_threshold: float = 2.0, window: int = 512, logger=None):
+        """
+        Records the stage durations of a sample of command invocations.
+        :param sample_rate: Share of invocations traced, 0 turns tracing off
+        :param slow_threshold: Seconds after which a traced invocation is logged with its spans
+        :param window: Durations kept per command and stage for the percentiles
+        """
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+        self.window = window
+        self.logger = logger or logging.getLogger(__name__)
+
+        self._durations = {}
+        self.slow = deque(maxlen=20)
+
+    def start(self):
+        """ Returns a new trace for a sampled invocation, None otherwise. """
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return None
+        return Trace()
+
+    def finish(self, trace: Trace):
+        total = trace.duration
+        stages = self._durations.setdefault(trace.name, {})
+        for stage, duration in trace.spans + [('total', total)]:
+            durations = stages.get(stage)
+            if durations is None:
+                durations = stages[stage] = deque(maxlen=self.window)
+            durations.append(duration)
+
+        if total >= self.slow_threshold:
+            spans = ', '.join(f'{stage} {duration * 1000:.1f}ms' for stage, duration in trace.spans)
+            self.slow.append((time.time(), trace.name, total, trace.spans))
+            self.logger.warning("Slow command %s took %.1fms: %s" % (trace.name, total * 1000, spans))
+
+    def commands(self):
+        """ Commands with traces, with the amount of invocations traced. """
+        return {name: len(stages['total']) for name, stages in self._durations.items()}
+
+    def percentiles(self, command: str, quantiles=(0.5, 0.9, 0.99)):
+        """ Returns stage: (count, [durations at quantiles]) for command. """
+        result = {}
+        for stage, durations in self._durations.get(command, {}).items():
+            ordered = sorted(durations)
+            result[stage] = (len(ordered), [ordered[min(int(q * len(ordered)), len(ordered) - 1)] for q in quantiles])
+        return result
+
+    def clear(self):
+        self._durations.clear()
+        self.slow.clear()
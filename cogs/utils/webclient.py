@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+
+import aiohttp
+
+"""
+The http client every cog shares for requests to the web, one connection pool for the lifetime of the bot
+"""
+
+retry_statuses = {429, 500, 502, 503, 504}
+
+
+class WebClient:
+    def __init__(self, metrics=None, logger=None, limit: int = 100, limit_per_host: int = 10, dns_ttl: int = 300,
+                 keepalive: float = 30.0, timeout: float = 15.0, retries: int = 2, backoff: float = 0.5):
+        """
+        Pooled aiohttp session with retries and latency stats per endpoint.
+        :param metrics: MetricsRegistry the request stats are kept in, left out when None
+        :param limit: Connections open at once, limit_per_host applies to every host on its own
+        :param dns_ttl: Seconds resolved hosts are cached
+        :param keepalive: Seconds an idle connection is kept for the next request
+        :param timeout: Default total timeout of a request in seconds
+        :param retries: Attempts made again after a connection error, a timeout or a 429/5xx status
+        :param backoff: Seconds waited before the first retry, doubled for every retry after it
+        """
+        self.logger = logger or logging.getLogger(__name__)
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_ttl = dns_ttl
+        self.keepalive = keepalive
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self._session = None
+
+        if metrics is not None:
+            self.latency = metrics.histogram('http_request_seconds', 'Time until the response headers arrived',
+                                             ('endpoint',))
+            self.requests = metrics.counter('http_requests_total', 'Http requests', ('endpoint', 'status'))
+            self.retried = metrics.counter('http_retries_total', 'Http requests made again', ('endpoint',))
+        else:
+            self.latency = self.requests = self.retried = None
+
+    @property
+    def session(self):
+        """ Created on first use, so it belongs to the running event loop """
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit_per_host,
+                                             use_dns_cache=True, ttl_dns_cache=self.dns_ttl,
+                                             keepalive_timeout=self.keepalive)
+            self._session = aiohttp.ClientSession(connector=connector,
+                                                  timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self._session
+
+    def _record(self, endpoint, status, start=None):
+        if self.requests is None:
+            return
+        self.requests.inc(endpoint=endpoint, status=status)
+        if start is not None:
+            self.latency.observe(time.perf_counter() - start, endpoint=endpoint)
+
+    def _delay(self, attempt, response=None):
+        delay = self.backoff * 2 ** attempt
+        if response is not None and response.status == 429:
+            try:
+                delay = max(delay, min(float(response.headers.get('Retry-After', 0)), 30.0))
+            except ValueError:
+                pass
+        return delay
+
+    @asynccontextmanager
+    async def request(self, method: str, url: str, endpoint: str = 'other', retries: int = None, **kwargs):
+        """
+        Yields the response once it has a successful status, the body is left for the caller to read.
+        Raises aiohttp.ClientResponseError for error statuses, after the retries for 429 and 5xx ran out.
+        :param endpoint: Name the request is counted under in the stats, like 'genius'
+        """
+        retries = self.retries if retries is None else retries
+        if isinstance(kwargs.get('timeout'), (int, float)):
+            kwargs['timeout'] = aiohttp.ClientTimeout(total=kwargs['timeout'])
+
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                response = await self.session.request(method, url, **kwargs)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                self._record(endpoint, 'error')
+                if attempt >= retries:
+                    raise
+                self.logger.debug("Retrying %s after %s" % (url, type(e).__name__))
+                delay = self._delay(attempt)
+            else:
+                self._record(endpoint, response.status, start)
+                if response.status not in retry_statuses or attempt >= retries:
+                    break
+                delay = self._delay(attempt, response)
+                response.release()
+                self.logger.debug("Retrying %s after status %s" % (url, response.status))
+
+            if self.retried is not None:
+                self.retried.inc(endpoint=endpoint)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+        try:
+            response.raise_for_status()
+            yield response
+        finally:
+            response.release()
+
+    async def get_json(self, url: str, endpoint: str = 'other', **kwargs):
+        async with self.request('GET', url, endpoint, **kwargs) as response:
+            return await response.json()
+
+    async def get_text(self, url: str, endpoint: str = 'other', **kwargs):
+        async with self.request('GET', url, endpoint, **kwargs) as response:
+            return await response.text()
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
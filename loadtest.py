@@ -0,0 +1,427 @@
+"""
+Load test for the command pipeline, runs the real cogs against a fake gateway and fake lavalink nodes.
+
+    python loadtest.py --guilds 1000 --playlist 300 --skips 20
+
+Nothing is sent to discord or lavalink, messages are fed straight into Bot.process_commands.
+"""
+
+# Discord Packages
+import discord
+import lavalink
+import lavalink.events
+
+import asyncio
+import gc
+import random
+import resource
+import tempfile
+import time
+import tracemalloc
+from argparse import ArgumentParser, RawTextHelpFormatter
+from collections import Counter
+
+import bot as botmodule
+
+# Bot Utilities
+from cogs.utils.context import Context
+from cogs.utils.failover import Failover
+from cogs.utils.logger import BotLogger
+from cogs.utils.mixplayer import MixPlayer
+from cogs.utils.nodeselector import NodeSelector
+from cogs.utils.nodesessions import NodeSessions
+from cogs.utils.snapshots import SnapshotStore
+
+OWNER_ID = 1
+BOT_ID = 2
+
+
+class FakePermissions:
+    connect = True
+    speak = True
+    administrator = False
+
+
+class FakeVoiceState:
+    def __init__(self, channel=None):
+        self.channel = channel
+        self.deaf = False
+        self.self_deaf = False
+
+
+class FakeMember:
+    def __init__(self, member_id, name, guild, bot=False):
+        self.id = member_id
+        self.name = name
+        self.nick = None
+        self.display_name = name
+        self.discriminator = '0001'
+        self.mention = f'<@{member_id}>'
+        self.avatar_url = ''
+        self.color = discord.Colour.default()
+        self.bot = bot
+        self.guild = guild
+        self.roles = []
+        self.guild_permissions = FakePermissions()
+        self.voice = None
+
+    def __eq__(self, other):
+        return isinstance(other, FakeMember) and other.id == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+class FakeVoiceChannel:
+    def __init__(self, channel_id, guild):
+        self.id = channel_id
+        self.name = f'voice-{channel_id}'
+        self.guild = guild
+        self.members = []
+
+    def permissions_for(self, member):
+        return FakePermissions()
+
+
+class FakeTextChannel:
+    def __init__(self, channel_id, guild):
+        self.id = channel_id
+        self.name = f'text-{channel_id}'
+        self.guild = guild
+        self.mention = f'<#{channel_id}>'
+
+
+class FakeGuild:
+    def __init__(self, guild_id, user_id):
+        self.id = guild_id
+        self.name = f'guild-{guild_id}'
+        self.region = 'eu'
+        self.icon_url = ''
+        self.me = FakeMember(BOT_ID, 'bot', self, bot=True)
+        self.user = FakeMember(user_id, f'user-{user_id}', self)
+        self.text_channel = FakeTextChannel(guild_id * 10 + 1, self)
+        self.voice_channel = FakeVoiceChannel(guild_id * 10 + 2, self)
+        self._members = {self.me.id: self.me, self.user.id: self.user}
+        self._channels = {self.text_channel.id: self.text_channel, self.voice_channel.id: self.voice_channel}
+
+    @property
+    def members(self):
+        return list(self._members.values())
+
+    def get_member(self, member_id):
+        return self._members.get(member_id)
+
+    def get_channel(self, channel_id):
+        return self._channels.get(channel_id)
+
+
+class FakeMessage:
+    _ids = iter(range(10 ** 9, 10 ** 12))
+
+    def __init__(self, state, content, author, channel):
+        self.id = next(self._ids)
+        self._state = state
+        self.content = content
+        self.author = author
+        self.channel = channel
+        self.guild = channel.guild
+        self.mentions = []
+
+    async def edit(self, **kwargs):
+        pass
+
+    async def delete(self, **kwargs):
+        pass
+
+    async def add_reaction(self, emoji):
+        pass
+
+    async def remove_reaction(self, emoji, member):
+        pass
+
+    async def clear_reactions(self):
+        pass
+
+
+class HarnessContext(Context):
+    async def send(self, content=None, **kwargs):
+        self.bot.sent += 1
+        return FakeMessage(self._state, content, self.me, self.channel)
+
+
+class FakeGateway:
+    def __init__(self, bot):
+        """ Stands in for the discord websocket, voice state changes are applied right away. """
+        self.bot = bot
+
+    async def voice_state(self, guild_id, channel_id, self_mute=False, self_deaf=False):
+        guild = self.bot.get_guild(int(guild_id))
+        player = self.bot.lavalink.player_manager.get(int(guild_id))
+        before = guild.me.voice or FakeVoiceState()
+        channel = guild.get_channel(int(channel_id)) if channel_id else None
+
+        if before.channel is not None:
+            before.channel.members.remove(guild.me)
+        if channel is not None:
+            channel.members.append(guild.me)
+        guild.me.voice = FakeVoiceState(channel)
+        if player is not None:
+            player.channel_id = channel_id
+        self.bot.dispatch('voice_state_update', guild.me, before, guild.me.voice)
+
+
+class FakeNode:
+    def __init__(self, client, name, region, playlist_length: int, track_length: int, rest_latency: float):
+        """ Lavalink node answering track lookups with canned results, nothing is played. """
+        self._manager = client.node_manager
+        self.client = client
+        self.host = 'fake'
+        self.port = 0
+        self.password = ''
+        self.name = name
+        self.region = region
+        self.stats = None
+        self.available = True
+
+        self.playlist_length = playlist_length
+        self.track_length = track_length
+        self.rest_latency = rest_latency
+        self.ops = Counter()
+
+    @property
+    def players(self):
+        return [player for player in self.client.player_manager.players.values() if player.node is self]
+
+    def _track(self, identifier, title):
+        return {
+            'track': f'fake:{identifier}',
+            'info': {
+                'identifier': identifier,
+                'isSeekable': True,
+                'author': 'loadtest',
+                'length': self.track_length,
+                'isStream': False,
+                'position': 0,
+                'title': title,
+                'uri': f'https://www.youtube.com/watch?v={identifier}'
+            }
+        }
+
+    async def get_tracks(self, query):
+        await asyncio.sleep(self.rest_latency)
+        self.ops['loadtracks'] += 1
+        if query.startswith('ytsearch:'):
+            identifier = f'search{abs(hash(query)) % 10 ** 8}'
+            return {'loadType': 'SEARCH_RESULT', 'playlistInfo': {},
+                    'tracks': [self._track(identifier, query[len('ytsearch:'):])]}
+
+        playlist = query.rsplit('=', 1)[-1]
+        return {'loadType': 'PLAYLIST_LOADED', 'playlistInfo': {'name': playlist, 'selectedTrack': -1},
+                'tracks': [self._track(f'{playlist}-{i}', f'{playlist} #{i}') for i in range(self.playlist_length)]}
+
+    async def _send(self, **data):
+        self.ops[data.get('op')] += 1
+
+    async def _dispatch_event(self, event):
+        for hook in self.client._event_hooks['Generic']:
+            await hook(event)
+
+    async def finish_track(self, player):
+        """ Ends the current track of player the way lavalink reports a finished track. """
+        if player.current is None:
+            return
+        event = lavalink.events.TrackEndEvent(player, player.current, 'FINISHED')
+        await self._dispatch_event(event)
+        await player.handle_event(event)
+
+
+class HarnessBot(botmodule.Bot):
+    async def get_context(self, message, *, cls=Context):
+        return await super().get_context(message, cls=HarnessContext)
+
+    async def is_owner(self, user):
+        return user.id == OWNER_ID
+
+
+class Phase:
+    def __init__(self, name):
+        self.name = name
+        self.latencies = []
+        self.start = time.perf_counter()
+        self.end = None
+
+    def report(self, sent):
+        wall = self.end - self.start
+        ordered = sorted(self.latencies)
+
+        def quantile(q):
+            return ordered[min(int(q * len(ordered)), len(ordered) - 1)] * 1000 if ordered else 0.0
+
+        print(f'{self.name}: {len(ordered)} messages in {wall:.2f}s, {len(ordered) / wall:.0f} msg/s, '
+              f'{sent} replies\n  latency p50 {quantile(0.5):.2f}ms  p90 {quantile(0.9):.2f}ms  '
+              f'p99 {quantile(0.99):.2f}ms  max {quantile(1.0):.2f}ms')
+
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        self.errors = Counter()
+
+    def setup_bot(self, datadir):
+        conf = {
+            'bot': {'token': None, 'description': 'Load test', 'playing status': 'load test'},
+            'default server settings': {'prefix': ['!'], 'moderator role': 'Moderator', 'locale': 'en_en',
+                                        'threshold': 50, 'dynamic max duration': False},
+            'tracing': {'sample rate': self.args.trace_sample, 'slow command': self.args.slow_command},
+            'track cache': {'size': self.args.track_cache},
+            # Snapshots are taken and restored by the restore phase, not on a timer
+            'snapshots': {'interval': 0, 'restore concurrency': self.args.concurrency}
+        }
+        botmodule.conf = conf
+        botmodule.logger = BotLogger(False, None)
+
+        bot = HarnessBot(datadir)
+        bot.sent = 0
+        bot._connection.user = FakeMember(BOT_ID, 'bot', None, bot=True)
+        gateway = FakeGateway(bot)
+        bot._connection._get_websocket = lambda guild_id=None, shard_id=None: gateway
+
+        # What NodeManager sets up, with fake nodes instead of the ones in config.yaml
+        bot.lavalink = lavalink.Client(BOT_ID, player=MixPlayer)
+        bot.node_selector = NodeSelector(bot.lavalink)
+        bot.failover = Failover(bot.lavalink, bot.node_selector)
+        bot.node_sessions = NodeSessions(f'{datadir}/lavalink_sessions.json', timeout=0)
+        self.nodes = [FakeNode(bot.lavalink, f'fake-{i}', 'eu', self.args.playlist, self.args.track_length,
+                               self.args.rest_latency / 1000) for i in range(self.args.nodes)]
+        bot.lavalink.node_manager.nodes.extend(self.nodes)
+        bot.load_extension('cogs.music')
+        bot.load_extension('cogs.musicevents')
+        bot.load_extension('cogs.snapshots')
+
+        @bot.listen()
+        async def on_command_error(ctx, err):
+            self.errors[type(getattr(err, 'original', err)).__name__] += 1
+
+        self.guilds = []
+        for guild_id in range(1, self.args.guilds + 1):
+            guild = FakeGuild(1000 + guild_id, 10 ** 6 + guild_id)
+            guild.user.voice = FakeVoiceState(guild.voice_channel)
+            guild.voice_channel.members.append(guild.user)
+            bot._connection._guilds[guild.id] = guild
+            self.guilds.append(guild)
+        return bot
+
+    async def send(self, bot, phase, guild, content, semaphore):
+        message = FakeMessage(bot._connection, content, guild.user, guild.text_channel)
+        async with semaphore:
+            start = time.perf_counter()
+            await bot.process_commands(message)
+            phase.latencies.append(time.perf_counter() - start)
+
+    async def run_phase(self, bot, name, contents):
+        semaphore = asyncio.Semaphore(self.args.concurrency)
+        sent = bot.sent
+        phase = Phase(name)
+        await asyncio.gather(*(self.send(bot, phase, guild, content, semaphore) for guild, content in contents))
+        # Let listeners scheduled by dispatch run before the phase is closed
+        await asyncio.sleep(0)
+        phase.end = time.perf_counter()
+        phase.report(bot.sent - sent)
+
+    async def track_events(self, bot):
+        """ Finishes random tracks at the requested rate, like lavalink does when songs end. """
+        interval = 1 / self.args.track_events
+        while True:
+            await asyncio.sleep(interval)
+            players = list(bot.lavalink.player_manager.players.values())
+            if players:
+                player = random.choice(players)
+                await player.node.finish_track(player)
+
+    async def run(self):
+        tracemalloc.start()
+        with tempfile.TemporaryDirectory() as datadir:
+            bot = self.setup_bot(datadir)
+            events = asyncio.ensure_future(self.track_events(bot)) if self.args.track_events > 0 else None
+            try:
+                await self.run_phase(bot, 'queue', [(guild, f'!play https://www.youtube.com/playlist?list=PL{guild.id}')
+                                                    for guild in self.guilds])
+                for _ in range(self.args.skips):
+                    await self.run_phase(bot, 'skip', [(guild, '!skip') for guild in self.guilds])
+                await self.run_phase(bot, 'now', [(guild, '!now') for guild in self.guilds])
+                if self.args.restore:
+                    await self.restore_phase(bot)
+            finally:
+                if events is not None:
+                    events.cancel()
+                self.report(bot)
+                bot.settings.close()
+                bot.get_cog('Snapshots').store.close()
+                session = getattr(bot.lavalink, '_session', None)
+                if session is not None:
+                    await session.close()
+
+    async def restore_phase(self, bot):
+        """ Saves every player, throws them away like a restart would and restores them from the snapshots """
+        cog = bot.get_cog('Snapshots')
+        queued = sum(len(player.queue) for player in bot.lavalink.player_manager.players.values())
+
+        start = time.perf_counter()
+        written = await cog.save()
+        print(f'\nsnapshot: {written} players in {(time.perf_counter() - start) * 1000:.1f}ms')
+        start = time.perf_counter()
+        written = await cog.save()
+        print(f'snapshot again, unchanged queues: {written} players in {(time.perf_counter() - start) * 1000:.1f}ms')
+
+        for guild in self.guilds:
+            bot.lavalink.player_manager.remove(guild.id)
+            if guild.me.voice is not None and guild.me.voice.channel is not None:
+                guild.me.voice.channel.members.remove(guild.me)
+            guild.me.voice = None
+        cog.store.close()
+        cog.store = SnapshotStore(cog.store.path)
+
+        start = time.perf_counter()
+        restored = await cog.restore()
+        wall = time.perf_counter() - start
+        players = bot.lavalink.player_manager.players.values()
+        print(f'restore: {restored} players in {wall:.2f}s, '
+              f'{sum(len(player.queue) for player in players)} of {queued} queued tracks back')
+
+    def report(self, bot):
+        gc.collect()
+        current, peak = tracemalloc.get_traced_memory()
+        players = bot.lavalink.player_manager.players.values()
+        print(f'\n{len(players)} players, {sum(len(player.queue) for player in players)} queued tracks')
+        print(f'memory: {current / 2 ** 20:.1f}MiB traced, {peak / 2 ** 20:.1f}MiB peak, '
+              f'{resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f}MiB max rss')
+        print(f'lavalink ops: {dict(sum((node.ops for node in self.nodes), Counter()))}')
+        if self.errors:
+            print(f'command errors: {dict(self.errors)}')
+
+        for name in sorted(bot.tracer.commands()):
+            print(f'\nstages of {name}:')
+            for stage, (count, (p50, p90, p99)) in bot.tracer.percentiles(name).items():
+                print(f'  {stage:<14} p50 {p50 * 1000:8.3f}ms  p90 {p90 * 1000:8.3f}ms  p99 {p99 * 1000:8.3f}ms  '
+                      f'({count} samples)')
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(prog='Shite Music Bot load test',
+                            description='Drives the bot with synthetic guilds, messages and lavalink nodes',
+                            formatter_class=RawTextHelpFormatter)
+
+    parser.add_argument("--guilds", type=int, default=1000, help='Simulated guilds, one listener each')
+    parser.add_argument("--playlist", type=int, default=300, help='Tracks in the playlist every guild queues')
+    parser.add_argument("--skips", type=int, default=10, help='Rounds where every guild skips once')
+    parser.add_argument("--nodes", type=int, default=2, help='Fake lavalink nodes')
+    parser.add_argument("--concurrency", type=int, default=100, help='Messages processed at the same time')
+    parser.add_argument("--track-length", type=int, default=210000, help='Track length in ms')
+    parser.add_argument("--rest-latency", type=float, default=5.0, help='Delay of fake track lookups in ms')
+    parser.add_argument("--track-events", type=float, default=0, help='Tracks finished per second by the nodes')
+    parser.add_argument("--track-cache", type=int, default=1024, help='Size of the shared track cache')
+    parser.add_argument("--trace-sample", type=float, default=0.1, help='Share of commands traced stage by stage')
+    parser.add_argument("--restore", action='store_true', help='Snapshot every player and time restoring them')
+    parser.add_argument("--slow-command", type=float, default=5.0, help='Seconds before a command is logged as slow')
+
+    asyncio.run(LoadTest(parser.parse_args()).run())
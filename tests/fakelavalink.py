@@ -0,0 +1,100 @@
+"""
+Stand-in for the websocket of lavalink nodes, so a real lavalink.Client can be driven without a server
+"""
+
+import asyncio
+import json
+
+import aiohttp
+
+
+class FakeMessage:
+    def __init__(self, data: dict):
+        self.type = aiohttp.WSMsgType.TEXT
+        self.data = json.dumps(data)
+        self.extra = None
+
+    def json(self):
+        return json.loads(self.data)
+
+
+class FakeSocket:
+    def __init__(self, headers):
+        """ One websocket connection, keeps what the client sent and hands it what the test pushes """
+        self.headers = headers
+        self.sent = []
+        self.closed = False
+        self._incoming = asyncio.Queue()
+
+    async def send_json(self, data):
+        self.sent.append(data)
+
+    def push(self, data: dict):
+        self._incoming.put_nowait(FakeMessage(data))
+
+    async def close(self):
+        self.closed = True
+        self._incoming.put_nowait(None)
+
+    def ops(self, op):
+        return [payload for payload in self.sent if payload['op'] == op]
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        message = await self._incoming.get()
+        if message is None:
+            raise StopAsyncIteration
+        return message
+
+
+class FakeLavalink:
+    def __init__(self, client):
+        """
+        Answers the websocket connections of client, one FakeSocket per connection.
+        A port that is taken down refuses new connections until it is brought back up.
+        """
+        self.client = client
+        self.sockets = {}
+        self.down = set()
+        self._up = {}
+        client._session.ws_connect = self.connect
+
+    async def connect(self, url, headers=None, **kwargs):
+        port = int(url.rsplit(':', 1)[1])
+        while port in self.down:
+            await self._up.setdefault(port, asyncio.Event()).wait()
+        socket = self.sockets[port] = FakeSocket(headers or {})
+        return socket
+
+    async def take_down(self, port: int):
+        self.down.add(port)
+        self._up.pop(port, None)
+        await self.sockets[port].close()
+        await asyncio.sleep(0)
+
+    def bring_up(self, port: int):
+        self.down.discard(port)
+        event = self._up.pop(port, None)
+        if event is not None:
+            event.set()
+
+    async def wait_connected(self, *nodes):
+        while not all(node.available for node in nodes):
+            await asyncio.sleep(0)
+
+    @staticmethod
+    def stats(players=0, playing=0, system_load=0.0, deficit=None, nulled=None):
+        """ A stats message as lavalink sends it, frameStats is left out until the node sent audio for a minute """
+        payload = {
+            'op': 'stats',
+            'uptime': 3600000,
+            'players': players,
+            'playingPlayers': playing,
+            'memory': {'free': 100, 'used': 200, 'allocated': 300, 'reservable': 400},
+            'cpu': {'cores': 4, 'systemLoad': system_load, 'lavalinkLoad': system_load / 2}
+        }
+        if deficit is not None or nulled is not None:
+            payload['frameStats'] = {'sent': 3000 * playing, 'nulled': nulled or 0, 'deficit': deficit or 0}
+        return payload
@@ -0,0 +1,75 @@
+# Discord Packages
+from discord.ext import commands
+from discord.ext.commands.view import StringView
+
+import unittest
+from types import SimpleNamespace
+
+# Bot Utilities
+from cogs.utils.alias import Aliaser
+
+
+async def noop(ctx):
+    pass
+
+
+class AliaserTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.aliaser = Aliaser('./localization', 'en_en')
+        cls.root = commands.Group(noop, name='root')
+        settings = commands.Group(noop, name='settings')
+        settings.add_command(commands.Command(noop, name='current'))
+        settings.add_command(commands.Command(noop, name='serverlocale'))
+        cls.root.add_command(settings)
+        cls.root.add_command(commands.Command(noop, name='play'))
+        cls.root.add_command(commands.Command(noop, name='help'))
+
+    def context(self, content, locale):
+        view = StringView(content)
+        view.skip_string('!')
+        # Like the bot itself, the root group holds every top level command
+        return SimpleNamespace(bot=self.root, prefix='!', view=view, locale=locale)
+
+    def test_command_alias(self):
+        ctx = self.context('!p never gonna', 'en_en')
+        ctx.view.get_word()
+        self.aliaser.get_command(ctx)
+        self.assertEqual(ctx.command.name, 'play')
+        self.assertEqual(ctx.invoker, 'p never gonna')
+        self.assertEqual(ctx.view.buffer, '!p never gonna')
+
+    def test_subcommand_alias(self):
+        ctx = self.context('!innstillinger språk en_en', 'nb_no')
+        ctx.view.get_word()
+        self.aliaser.get_command(ctx)
+        self.assertEqual(ctx.command.name, 'settings')
+        self.assertEqual(ctx.view.buffer, '!innstillinger serverlocale en_en')
+        ctx.view.skip_ws()
+        self.assertEqual(ctx.view.get_word(), 'serverlocale')
+
+    def test_help_resolves_from_the_top_level(self):
+        # help reads the rest of the buffer as the command to describe
+        ctx = self.context('!help innstillinger vis', 'nb_no')
+        ctx.view.get_word()
+        ctx.view.skip_ws()
+        self.aliaser.get_subcommand(ctx)
+        self.assertEqual(ctx.view.buffer[ctx.view.index:ctx.view.end], 'settings current')
+
+    def test_help_entries(self):
+        entry = self.aliaser.get_cmd_help('nb_no', 'serverlocale', ['settings'])
+        self.assertEqual(entry['aliases'], ['språk'])
+        self.assertEqual(self.aliaser.get_cmd_help('nb_no', 'settings')['aliases'], ['innstillinger', 'oppsett'])
+        # Help looks commands up by their name, an alias is no command name
+        self.assertEqual(self.aliaser.get_cmd_help('nb_no', 'innstillinger'), [])
+        self.assertEqual(self.aliaser.get_cmd_help('nb_no', 'missing', ['settings']), [])
+        self.assertIsNone(self.aliaser.get_cmd_help('nb_no', 'current', ['play']))
+
+    def test_aliases_convert_to_names(self):
+        self.assertEqual(self.aliaser.convert_alias('nb_no', 'innstillinger'), 'settings')
+        self.assertEqual(self.aliaser.convert_alias('nb_no', 'vis', ['settings']), 'current')
+        self.assertEqual(self.aliaser.convert_alias('nb_no', 'unknown', ['settings']), 'unknown')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import asyncio
+import unittest
+
+# Bot Utilities
+from cogs.utils.cache import LRUCache
+
+
+class GetOrFetchTest(unittest.IsolatedAsyncioTestCase):
+    async def test_coalesced_callers_share_one_fetch(self):
+        cache = LRUCache()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return 'value'
+
+        results = await asyncio.gather(*(cache.get_or_fetch('key', fetch) for _ in range(5)))
+        self.assertEqual(results, ['value'] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache.coalesced, 4)
+
+    async def test_failed_fetch_reaches_every_caller(self):
+        cache = LRUCache()
+
+        async def fetch():
+            await asyncio.sleep(0.01)
+            raise ValueError('lookup failed')
+
+        results = await asyncio.gather(*(cache.get_or_fetch('key', fetch) for _ in range(3)), return_exceptions=True)
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+        self.assertFalse(cache._pending)
+
+    async def test_cancelled_fetch_does_not_strand_waiters(self):
+        cache = LRUCache()
+        started = asyncio.Event()
+
+        async def slow_fetch():
+            started.set()
+            await asyncio.sleep(10)
+
+        async def fetch():
+            return 'value'
+
+        leader = asyncio.ensure_future(cache.get_or_fetch('key', slow_fetch))
+        await started.wait()
+        waiter = asyncio.ensure_future(cache.get_or_fetch('key', fetch))
+        await asyncio.sleep(0)
+        leader.cancel()
+
+        self.assertEqual(await asyncio.wait_for(waiter, 1), 'value')
+        with self.assertRaises(asyncio.CancelledError):
+            await leader
+        self.assertFalse(cache._pending)
+
+    async def test_cancelled_waiter_leaves_the_fetch_running(self):
+        cache = LRUCache()
+
+        async def fetch():
+            await asyncio.sleep(0.05)
+            return 'value'
+
+        leader = asyncio.ensure_future(cache.get_or_fetch('key', fetch))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(cache.get_or_fetch('key', fetch))
+        await asyncio.sleep(0)
+        waiter.cancel()
+
+        self.assertEqual(await leader, 'value')
+        self.assertEqual(cache.get('key'), 'value')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import asyncio
+import json
+import logging
+import unittest
+
+# Bot Utilities
+from cogs.utils import cluster
+from cogs.utils.cluster import Cluster
+
+
+def line(message: dict):
+    return json.dumps(message).encode('utf-8') + b'\n'
+
+
+class ReadLineTest(unittest.IsolatedAsyncioTestCase):
+    def reader(self, *chunks, limit=64):
+        reader = asyncio.StreamReader(limit=limit)
+        for chunk in chunks:
+            reader.feed_data(chunk)
+        reader.feed_eof()
+        return reader
+
+    async def read_all(self, reader):
+        lines = []
+        with self.assertLogs('test', 'WARNING') as logs:
+            while True:
+                data = await cluster._readline(reader, logging.getLogger('test'))
+                if not data:
+                    return lines, logs.output
+                lines.append(data)
+
+    async def test_line_over_the_limit_is_skipped(self):
+        # Separator beyond the limit, and a line that does not end in the buffer at all
+        reader = self.reader(b'a' * 100 + b'\n' + b'first\n', b'b' * 300, b'b' * 300 + b'\nsecond\n')
+        lines, warnings = await self.read_all(reader)
+        self.assertEqual(lines, [b'first\n', b'second\n'])
+        self.assertEqual(len(warnings), 2)
+
+    async def test_unterminated_last_line(self):
+        reader = self.reader(b'first\nlast', limit=64)
+        self.assertEqual(await cluster._readline(reader, None), b'first\n')
+        self.assertEqual(await cluster._readline(reader, None), b'last')
+        self.assertEqual(await cluster._readline(reader, None), b'')
+
+
+class ClusterLinkTest(unittest.IsolatedAsyncioTestCase):
+    async def test_oversized_answer_keeps_the_link(self):
+        worker = Cluster(0, 2)
+        reader = asyncio.StreamReader(limit=64)
+        worker._writer = object()
+        read = asyncio.ensure_future(worker._read(reader))
+
+        dropped = worker._pending[1] = asyncio.get_event_loop().create_future()
+        answered = worker._pending[2] = asyncio.get_event_loop().create_future()
+        with self.assertLogs(worker.logger, 'WARNING'):
+            reader.feed_data(line({'op': 'result', 'id': 1, 'answers': {'0': 'x' * 1000}}))
+            reader.feed_data(line({'op': 'result', 'id': 2, 'answers': {'0': 'guilds'}}))
+            self.assertEqual(await asyncio.wait_for(answered, 1), {'0': 'guilds'})
+        self.assertFalse(dropped.done())
+        self.assertTrue(worker.connected)
+
+        reader.feed_eof()
+        await read
+        self.assertFalse(worker.connected)
+
+
+if __name__ == '__main__':
+    unittest.main()
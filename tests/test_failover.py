@@ -0,0 +1,114 @@
+# Discord Packages
+import lavalink
+
+import asyncio
+import unittest
+
+# Bot Utilities
+from cogs.utils.failover import Failover
+from cogs.utils.mixplayer import MixPlayer, QueuedTrack
+from cogs.utils.nodeselector import NodeSelector
+from .fakelavalink import FakeLavalink
+
+GUILD_ID = 1234
+
+
+def queued_track(index, requester=1):
+    return QueuedTrack(f'encoded{index}', f'id{index}', f'Song {index}', f'https://example.com/{index}',
+                       'Artist', 200000, requester)
+
+
+class FailoverTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.client = lavalink.Client(1, player=MixPlayer)
+        self.lavalink = FakeLavalink(self.client)
+        self.client.add_node('first', 2333, 'pw', 'eu', name='first', reconnect_attempts=-1)
+        self.client.add_node('second', 2334, 'pw', 'eu', name='second', reconnect_attempts=-1)
+        self.first, self.second = self.client.node_manager.nodes
+        await self.lavalink.wait_connected(self.first, self.second)
+
+        self.failover = Failover(self.client, NodeSelector(self.client), strikes=3)
+        self.player = self.client.player_manager.create(GUILD_ID, node=self.first)
+        await self.start_playing()
+
+    async def asyncTearDown(self):
+        for task in asyncio.all_tasks():
+            if task is not asyncio.current_task():
+                task.cancel()
+        await self.client._session.close()
+
+    async def start_playing(self):
+        player = self.player
+        player.channel_id = '42'
+        player._voice_state.update({'sessionId': 'session', 'event': {'token': 'token', 'endpoint': 'eu.discord'}})
+        for index in range(5):
+            player.add(requester=index % 2 + 1, track=queued_track(index))
+        await player.play()
+        await player.set_volume(40)
+        await player.bassboost(True)
+        await player.set_pause(True)
+        # The position is only known from the player updates of the node
+        self.lavalink.sockets[2333].push({'op': 'playerUpdate', 'guildId': str(GUILD_ID),
+                                          'state': {'time': 0, 'position': 42000}})
+        await asyncio.sleep(0.01)
+
+    def assertResumedOn(self, port):
+        sent = self.lavalink.sockets[port]
+        self.assertIs(self.player.node, self.second)
+        self.assertEqual(sent.ops('voiceUpdate')[-1]['sessionId'], 'session')
+        play = sent.ops('play')[-1]
+        self.assertEqual(play['track'], 'encoded0')
+        self.assertEqual(play['startTime'], 42000)
+        self.assertTrue(sent.ops('pause')[-1]['pause'])
+        self.assertEqual(sent.ops('volume')[-1]['volume'], 40)
+        self.assertEqual(len(sent.ops('equalizer')[-1]['bands']), 15)
+
+        self.assertTrue(self.player.boosted)
+        self.assertEqual([track.identifier for track in self.player.queue], ['id1', 'id2', 'id3', 'id4'])
+
+    async def test_removed_node(self):
+        moved = await self.failover.evacuate(self.first, 'node is being removed')
+        self.assertEqual(moved, 1)
+        self.assertEqual(self.lavalink.sockets[2333].ops('destroy')[-1]['guildId'], str(GUILD_ID))
+        self.assertResumedOn(2334)
+
+    async def test_disconnected_node(self):
+        await self.lavalink.take_down(2333)
+        await asyncio.sleep(0.01)
+        self.assertFalse(self.first.available)
+        await self.failover.check_nodes()
+        self.assertResumedOn(2334)
+
+    async def test_degraded_node(self):
+        # A fifth of the frames of the last minute went missing
+        self.lavalink.sockets[2333].push(FakeLavalink.stats(players=1, playing=1, deficit=600))
+        self.lavalink.sockets[2334].push(FakeLavalink.stats(deficit=0))
+        await asyncio.sleep(0.01)
+        self.assertAlmostEqual(Failover.deficit(self.first), 0.2)
+
+        for _ in range(2):
+            await self.failover.check_nodes()
+            self.assertIs(self.player.node, self.first)
+        await self.failover.check_nodes()
+        self.assertResumedOn(2334)
+
+    async def test_recovered_node_loses_its_strikes(self):
+        socket = self.lavalink.sockets[2333]
+        for deficit in (600, 600, 0, 600, 600):
+            socket.push(FakeLavalink.stats(players=1, playing=1, deficit=deficit))
+            await asyncio.sleep(0.01)
+            await self.failover.check_nodes()
+        self.assertIs(self.player.node, self.first)
+
+    async def test_unreported_frames_are_healthy(self):
+        self.lavalink.sockets[2333].push(FakeLavalink.stats(players=1, playing=1))
+        await asyncio.sleep(0.01)
+        self.assertEqual(self.first.stats.frames_deficit, -1)
+        self.assertEqual(Failover.deficit(self.first), 0.0)
+        for _ in range(3):
+            await self.failover.check_nodes()
+        self.assertIs(self.player.node, self.first)
+
+
+if __name__ == '__main__':
+    unittest.main()
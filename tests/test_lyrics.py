@@ -0,0 +1,39 @@
+import logging
+import unittest
+from types import SimpleNamespace
+
+# Bot Utilities
+from cogs.utils.cache import LRUCache
+from cogs.utils.lyrics import Lyrics, clean_title, lyrics_key
+
+
+class LyricsTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        bot = SimpleNamespace(main_logger=SimpleNamespace(bot_logger=logging.getLogger('test')),
+                              APIkeys={'genius': 'token'})
+        self.lyrics = Lyrics(bot, LRUCache())
+        self.searched = []
+
+        async def fetch(query):
+            self.searched.append(query)
+            return {'title': query, 'lyrics': '...'}
+        self.lyrics._fetch = fetch
+
+    def test_key_keeps_the_words_of_the_query(self):
+        self.assertEqual(lyrics_key('  Live  Forever '), 'live forever')
+        self.assertNotEqual(lyrics_key('Live Forever'), lyrics_key('Forever'))
+        self.assertNotEqual(lyrics_key('Hurt (Official Video)'), lyrics_key('Hurt'))
+
+    async def test_user_query_is_searched_as_given(self):
+        await self.lyrics.get('Live  and Let Die')
+        await self.lyrics.get('live and let die')
+        self.assertEqual(self.searched, ['Live and Let Die'])
+
+    async def test_cleaned_title_shares_the_lyrics_of_the_plain_query(self):
+        await self.lyrics.get(clean_title('Johnny Cash - Hurt (Official Music Video) [HD]'))
+        self.assertEqual(self.searched, ['Johnny Cash Hurt'])
+        self.assertTrue(self.lyrics.cached('johnny cash hurt'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+import aiohttp
+
+# Bot Utilities
+from cogs.utils.metaextractor import MetaExtractor, extract
+
+PAGE = b'<html><head><title>Song</title><meta property="og:image" content="https://example.com/cover.jpg">'
+
+
+class FakeContent:
+    def __init__(self, chunks, error=None):
+        self.chunks = chunks
+        self.error = error
+
+    async def iter_chunked(self, size):
+        for chunk in self.chunks:
+            yield chunk
+        if self.error is not None:
+            raise self.error
+
+
+class FakeClient:
+    def __init__(self, chunks=(), error=None, connect_error=None):
+        """ Stands in for the WebClient, serving chunks and failing with error once they ran out """
+        self.response = SimpleNamespace(charset='utf-8', content=FakeContent(chunks, error))
+        self.connect_error = connect_error
+
+    @asynccontextmanager
+    async def request(self, method, url, endpoint, **kwargs):
+        if self.connect_error is not None:
+            raise self.connect_error
+        yield self.response
+
+
+class ExtractTest(unittest.IsolatedAsyncioTestCase):
+    async def extract(self, client):
+        return await extract(client, 'https://example.com', MetaExtractor(meta=('og:image',)))
+
+    async def test_value_found(self):
+        self.assertEqual(await self.extract(FakeClient([PAGE[:40], PAGE[40:]])), 'https://example.com/cover.jpg')
+
+    async def test_connection_refused(self):
+        error = aiohttp.ClientConnectorError(SimpleNamespace(ssl=None, host='example.com', port=443),
+                                             OSError(111, 'Connection refused'))
+        self.assertIsNone(await self.extract(FakeClient(connect_error=error)))
+
+    async def test_error_status(self):
+        error = aiohttp.ClientResponseError(SimpleNamespace(real_url='https://example.com'), (), status=404)
+        self.assertIsNone(await self.extract(FakeClient(connect_error=error)))
+
+    async def test_page_cut_off(self):
+        client = FakeClient([PAGE[:40]], error=aiohttp.ClientPayloadError('Response payload is not completed'))
+        self.assertIsNone(await self.extract(client))
+
+    async def test_server_disconnected(self):
+        client = FakeClient([PAGE[:40]], error=aiohttp.ServerDisconnectedError())
+        self.assertIsNone(await self.extract(client))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+import random
+import unittest
+from itertools import accumulate
+
+# Bot Utilities
+from cogs.utils.mixplayer import FenwickTree, MixQueue, QueuedTrack
+
+
+class FenwickTreeTest(unittest.TestCase):
+    def test_matches_the_plain_counts(self):
+        rng = random.Random(1)
+        tree = FenwickTree(size=2)
+        counts = []
+        for _ in range(500):
+            index = rng.randrange(40)
+            if index >= len(counts):
+                counts += [0] * (index + 1 - len(counts))
+            delta = rng.randint(0 if counts[index] == 0 else -counts[index], 3)
+            counts[index] += delta
+            tree.add(index, delta)
+
+            sums = [0] + list(accumulate(counts))
+            for end in range(len(counts) + 2):
+                self.assertEqual(tree.prefix(end), sums[min(end, len(counts))])
+            for value in range(sums[-1]):
+                slot = next(slot for slot in range(len(counts)) if sums[slot + 1] > value)
+                self.assertEqual(tree.search(value), (slot, value - sums[slot]))
+
+
+class MixQueueTest(unittest.TestCase):
+    """ Checks the indexed answers of MixQueue against the round robin order it iterates in """
+
+    def setUp(self):
+        self.rng = random.Random(0)
+        self.queue = MixQueue()
+        self.tracks = 0
+
+    def track(self, requester):
+        self.tracks += 1
+        return QueuedTrack(f'encoded{self.tracks}', f'id{self.tracks}', f'Song {self.tracks}', 'https://example.com',
+                           'Artist', self.rng.randint(1, 600) * 1000, requester)
+
+    def random_change(self):
+        rng, queue = self.rng, self.queue
+        requesters = list(queue.queues)
+        requester = rng.choice(requesters) if requesters and rng.random() < 0.8 else rng.randint(1, 8)
+        size = len(queue.queues.get(requester, []))
+        change = rng.choice(['add', 'add', 'insert', 'add_many', 'next', 'pop', 'pop', 'remove', 'remove_global',
+                             'move', 'shuffle', 'remove_user', 'clear'])
+
+        if change == 'add':
+            track, position, _ = queue.add_track(requester, self.track(requester))
+            self.assertIs(list(queue)[position], track)
+        elif change == 'insert':
+            track, position, _ = queue.add_track(requester, self.track(requester), pos=rng.randint(0, size))
+            self.assertIs(list(queue)[position], track)
+        elif change == 'add_many':
+            queue.add_tracks(requester, [self.track(requester) for _ in range(rng.randint(0, 12))])
+        elif change == 'next':
+            queue.add_next_track(self.track(requester))
+        elif change == 'pop':
+            expected = next(iter(queue), None)
+            self.assertIs(queue.pop_first(), expected)
+        elif change == 'remove' and size:
+            queue.remove_user_track(requester, rng.randrange(size))
+        elif change == 'remove_global' and len(queue):
+            position = rng.randrange(len(queue))
+            expected = list(queue)[position]
+            removed = queue.remove_global_track(position)
+            # Tracks of the priority queue can't be removed by position
+            self.assertIn(removed, (expected, None))
+        elif change == 'move' and size:
+            queue.move_user_track(requester, rng.randrange(size), rng.randrange(size))
+        elif change == 'shuffle':
+            queue.shuffle_user_queue(requester)
+        elif change == 'remove_user':
+            queue.remove_user_queue(requester)
+        elif change == 'clear' and rng.random() < 0.1:
+            queue.clear()
+        return change
+
+    def assertIndexed(self):
+        queue = self.queue
+        order = list(queue)
+        self.assertEqual(len(queue), len(order))
+        self.assertEqual(queue.empty, not order)
+
+        for _ in range(5):
+            start = self.rng.randint(-2, len(order) + 2)
+            stop = self.rng.randint(start, len(order) + 4)
+            self.assertEqual(queue.get_range(start, stop), order[max(start, 0):max(stop, 0)])
+
+        for requester, user_queue in queue.queues.items():
+            self.assertTrue(user_queue)
+            for track, position in queue.get_user_queue(requester, dual=True):
+                self.assertIs(order[position], track)
+            start = self.rng.randint(0, len(user_queue))
+            self.assertEqual([order[position] for _, position in queue.get_user_range(requester, start, start + 10)],
+                             user_queue[start:start + 10])
+
+        durations = [0] + list(accumulate(track.duration for track in order))
+        for position in range(len(order) + 2):
+            self.assertEqual(queue.duration_until(position), durations[min(position, len(order))])
+        self.assertEqual(queue.duration, durations[-1])
+
+    def test_random_changes(self):
+        for _ in range(2000):
+            before = list(self.queue), self.queue.revision
+            self.random_change()
+            if list(self.queue) != before[0]:
+                # Snapshots skip queues whose revision did not change
+                self.assertGreater(self.queue.revision, before[1])
+            self.assertIndexed()
+
+    def test_large_queues(self):
+        for requester in range(1, 6):
+            self.queue.add_tracks(requester, [self.track(requester) for _ in range(self.rng.randint(50, 300))])
+        for _ in range(300):
+            self.random_change()
+        self.assertIndexed()
+
+
+if __name__ == '__main__':
+    unittest.main()
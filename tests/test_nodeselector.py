@@ -0,0 +1,66 @@
+# Discord Packages
+from lavalink.stats import Stats
+
+import unittest
+from types import SimpleNamespace
+
+# Bot Utilities
+from cogs.utils.nodeselector import NodeSelector
+from .fakelavalink import FakeLavalink
+
+
+class FakeNode:
+    def __init__(self, name, region='europe', available=True, **stats):
+        self.name = name
+        self.region = region
+        self.available = available
+        self.stats = Stats(self, FakeLavalink.stats(**stats))
+
+    def __repr__(self):
+        return self.name
+
+
+class NodeSelectorTest(unittest.TestCase):
+    def selector(self, *nodes):
+        return NodeSelector(SimpleNamespace(node_manager=SimpleNamespace(nodes=list(nodes))))
+
+    def test_prefers_fewer_players(self):
+        busy = FakeNode('busy', players=20, playing=15)
+        idle = FakeNode('idle', players=2, playing=1)
+        self.assertIs(self.selector(busy, idle).select(), idle)
+
+    def test_cpu_load_counts(self):
+        loaded = FakeNode('loaded', players=5, playing=5, system_load=0.9)
+        calm = FakeNode('calm', players=5, playing=5, system_load=0.1)
+        self.assertGreater(NodeSelector.load(loaded), NodeSelector.load(calm) + 100)
+        self.assertIs(self.selector(loaded, calm).select(), calm)
+
+    def test_frame_loss_counts(self):
+        dropping = FakeNode('dropping', players=5, playing=5, deficit=1500, nulled=300)
+        healthy = FakeNode('healthy', players=10, playing=10, deficit=0, nulled=0)
+        self.assertGreater(NodeSelector.load(dropping), NodeSelector.load(healthy))
+        self.assertIs(self.selector(dropping, healthy).select(), healthy)
+
+    def test_unreported_frames_are_not_a_penalty(self):
+        fresh = FakeNode('fresh', players=4, playing=4)
+        self.assertEqual(fresh.stats.frames_deficit, -1)
+        self.assertAlmostEqual(NodeSelector.load(fresh), 4 + 4 * 0.25)
+
+    def test_region_and_availability(self):
+        local = FakeNode('local', region='europe', players=10, playing=10)
+        remote = FakeNode('remote', region='us', players=0, playing=0)
+        down = FakeNode('down', region='europe', available=False)
+        selector = self.selector(local, remote, down)
+        self.assertIs(selector.select(region='europe'), local)
+        self.assertIs(selector.select(region='us'), remote)
+        self.assertIsNone(selector.score(down, 'europe'))
+        self.assertIs(selector.select(region='europe', exclude=(local,)), remote)
+
+    def test_node_without_stats(self):
+        node = FakeNode('new')
+        node.stats = None
+        self.assertEqual(NodeSelector.load(node), 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
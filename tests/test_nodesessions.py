@@ -0,0 +1,65 @@
+# Discord Packages
+import lavalink
+
+import asyncio
+import os
+import tempfile
+import unittest
+
+# Bot Utilities
+from cogs.utils.nodesessions import NodeSessions
+from .fakelavalink import FakeLavalink
+
+
+class NodeSessionsTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'lavalink_sessions.json')
+
+    async def asyncTearDown(self):
+        for task in asyncio.all_tasks():
+            if task is not asyncio.current_task():
+                task.cancel()
+        self.tmp.cleanup()
+
+    async def connect(self, sessions, name):
+        """ Adds a node the way the node manager does, returns the websocket it opened """
+        client = lavalink.Client(1)
+        fake = FakeLavalink(client)
+        self.addAsyncCleanup(client._session.close)
+        client.add_node('localhost', 2333, 'pw', 'eu', name=name, resume_key=sessions.key(name),
+                        resume_timeout=sessions.timeout)
+        node = client.node_manager.nodes[-1]
+        sessions.prepare(node)
+        await fake.wait_connected(node)
+        return fake.sockets[2333]
+
+    async def test_first_time_node_starts_a_session(self):
+        sessions = NodeSessions(self.path)
+        socket = await self.connect(sessions, 'first')
+
+        self.assertNotIn('Resume-Key', socket.headers)
+        self.assertEqual(sessions.resuming, set())
+        configure = socket.ops('configureResuming')[-1]
+        self.assertEqual(configure['key'], sessions.key('first'))
+
+    async def test_known_node_resumes_its_session(self):
+        key = NodeSessions(self.path).key('first')
+
+        sessions = NodeSessions(self.path)
+        socket = await self.connect(sessions, 'first')
+
+        self.assertEqual(socket.headers['Resume-Key'], key)
+        self.assertEqual(sessions.resuming, {'first'})
+
+    async def test_disabled(self):
+        sessions = NodeSessions(self.path, timeout=0)
+        socket = await self.connect(sessions, 'first')
+
+        self.assertIsNone(sessions.key('first'))
+        self.assertNotIn('Resume-Key', socket.headers)
+        self.assertFalse(os.path.exists(self.path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,221 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+# Bot Utilities
+from cogs.utils import settingsstorage
+from cogs.utils.settingsstorage import SqliteStorage, YamlStorage, migrate
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class StorageParityTest(unittest.TestCase):
+    """ Runs the same changes against both engines, they have to read back the same """
+    # Reads are answered before the writer ran, sqlite answers them from its queued changes
+    flushed = False
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.engines = self.open()
+
+    def open(self):
+        engines = {
+            'yaml': YamlStorage(os.path.join(self.tmp.name, 'settings.yaml'), flush_delay=3600),
+            'sqlite': SqliteStorage(os.path.join(self.tmp.name, 'settings.sqlite3'), flush_delay=3600)
+        }
+        for engine in engines.values():
+            self.addCleanup(engine.close)
+        return engines
+
+    def apply(self, guild_id, keys, value):
+        for engine in self.engines.values():
+            engine.set(guild_id, keys, value)
+            if self.flushed:
+                engine.flush()
+
+    def assertParity(self, guild_id, keys, expected):
+        for name, engine in self.engines.items():
+            with self.subTest(engine=name, keys=keys):
+                self.assertEqual(engine.get(guild_id, keys), expected)
+
+    def test_leaves(self):
+        self.apply('1', ['prefixes'], ['!', '?'])
+        self.apply('1', ['vote_threshold'], 50)
+        self.apply('1', ['duration', 'is_dynamic'], True)
+        self.assertParity('1', ['prefixes'], ['!', '?'])
+        self.assertParity('1', ['vote_threshold'], 50)
+        self.assertParity('1', ['duration', 'is_dynamic'], True)
+        self.assertParity('1', ['duration'], {'is_dynamic': True})
+        self.assertParity('1', ['missing'], None)
+        self.assertParity('2', ['prefixes'], None)
+
+    def test_replacing_trees(self):
+        self.apply('1', ['channels'], {'text': [1, 2], 'music': [3]})
+        self.assertParity('1', ['channels', 'music'], [3])
+        self.apply('1', ['channels', 'text'], [4])
+        self.assertParity('1', ['channels'], {'text': [4], 'music': [3]})
+        # A leaf replaces the tree below it, and a tree replaces a leaf above it
+        self.apply('1', ['channels'], 'none')
+        self.assertParity('1', ['channels'], 'none')
+        self.assertParity('1', ['channels', 'text'], 'none')
+        self.apply('1', ['channels', 'text'], [5])
+        self.assertParity('1', ['channels'], {'text': [5]})
+
+    def test_removing(self):
+        self.apply('1', ['roles', 'dj'], [1])
+        self.apply('1', ['roles', 'mod'], [2])
+        self.apply('1', ['roles', 'dj'], None)
+        self.assertParity('1', ['roles', 'dj'], None)
+        self.assertParity('1', ['roles'], {'mod': [2]})
+
+    def test_guilds_and_dumps(self):
+        self.apply('1', ['locale'], 'en_en')
+        self.apply('2', ['duration', 'max'], 600)
+        for name, engine in self.engines.items():
+            with self.subTest(engine=name):
+                self.assertEqual(sorted(engine.guilds()), ['1', '2'])
+                self.assertEqual(engine.dump_guild('2'), {'duration': {'max': 600}})
+
+    def test_reopening(self):
+        self.apply('1', ['channels'], {'text': [1]})
+        self.apply('2', ['prefixes'], ['!'])
+        for engine in self.engines.values():
+            engine.close()
+        self.engines = self.open()
+        self.assertParity('1', ['channels', 'text'], [1])
+        self.assertParity('2', ['prefixes'], ['!'])
+
+    def test_migrate(self):
+        yaml_storage = self.engines['yaml']
+        yaml_storage.set('1', ['channels'], {'text': [1], 'music': [2]})
+        yaml_storage.set('2', ['locale'], 'nb_no')
+        target = SqliteStorage(os.path.join(self.tmp.name, 'migrated.sqlite3'))
+        self.addCleanup(target.close)
+        migrate(yaml_storage, target)
+        for guild_id in yaml_storage.guilds():
+            self.assertEqual(target.dump_guild(guild_id), yaml_storage.dump_guild(guild_id))
+
+
+class CommittedParityTest(StorageParityTest):
+    """ The same, with every change written before it is read """
+    flushed = True
+
+
+class WriteBehindTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_yaml_writer_survives_a_failed_flush(self):
+        path = os.path.join(self.tmp.name, 'settings.yaml')
+        storage = YamlStorage(path, flush_delay=0.01)
+        self.addCleanup(storage.close)
+        real_replace = os.replace
+        failures = []
+
+        def replace(src, dst):
+            if not failures:
+                failures.append(dst)
+                raise OSError('No space left on device')
+            real_replace(src, dst)
+
+        with mock.patch.object(settingsstorage.os, 'replace', replace), \
+                mock.patch.object(storage.logger, 'exception'):
+            storage.set('1', ['locale'], 'en_en')
+            self.assertTrue(wait_until(lambda: failures))
+            self.assertTrue(wait_until(lambda: 'en_en' in open(path).read()))
+            self.assertTrue(storage._writer.is_alive())
+
+            storage.set('1', ['locale'], 'nb_no')
+            self.assertTrue(wait_until(lambda: 'nb_no' in open(path).read()))
+
+    def test_yaml_open_dumps_nothing(self):
+        path = os.path.join(self.tmp.name, 'settings.yaml')
+        storage = YamlStorage(path)
+        for guild_id in range(3):
+            storage.set(str(guild_id), ['locale'], 'en_en')
+        storage.close()
+
+        storage = YamlStorage(path, flush_delay=0.01)
+        self.addCleanup(storage.close)
+        self.assertIsNone(storage._chunks)
+        # The first write dumps every guild, the ones that did not change included
+        storage.set('1', ['locale'], 'nb_no')
+        storage.flush()
+        reopened = YamlStorage(path)
+        self.addCleanup(reopened.close)
+        self.assertEqual(sorted(reopened.guilds()), ['0', '1', '2'])
+        self.assertEqual(reopened.get('1', ['locale']), 'nb_no')
+
+    def test_yaml_set_does_not_wait_for_the_dump(self):
+        path = os.path.join(self.tmp.name, 'settings.yaml')
+        storage = YamlStorage(path, flush_delay=0.01)
+        self.addCleanup(storage.close)
+        dumping = threading.Event()
+        release = threading.Event()
+        real_dump = settingsstorage.yaml.dump
+
+        def slow_dump(*args, **kwargs):
+            dumping.set()
+            release.wait(5)
+            return real_dump(*args, **kwargs)
+
+        with mock.patch.object(settingsstorage.yaml, 'dump', slow_dump):
+            storage.set('1', ['locale'], 'en_en')
+            self.assertTrue(dumping.wait(2))
+            start = time.monotonic()
+            storage.set('1', ['locale'], 'nb_no')
+            self.assertLess(time.monotonic() - start, 1.0)
+            release.set()
+            self.assertTrue(wait_until(lambda: 'nb_no' in open(path).read()))
+
+    def test_sqlite_commits_behind(self):
+        path = os.path.join(self.tmp.name, 'settings.sqlite3')
+        storage = SqliteStorage(path, flush_delay=0.05)
+        self.addCleanup(storage.close)
+        storage.set('1', ['locale'], 'en_en')
+        # Visible to reads right away, committed by the writer once the changes settled
+        self.assertEqual(storage.get('1', ['locale']), 'en_en')
+
+        reader = sqlite3.connect(path)
+        self.addCleanup(reader.close)
+
+        def committed():
+            return reader.execute('SELECT count(*) FROM settings').fetchone()[0] == 1
+        self.assertTrue(wait_until(committed))
+
+    def test_sqlite_shared_between_processes(self):
+        path = os.path.join(self.tmp.name, 'settings.sqlite3')
+        first = SqliteStorage(path, flush_delay=3600, max_flush_delay=3600)
+        self.addCleanup(first.close)
+        first.set('1', ['locale'], 'en_en')
+        self.assertFalse(first.db.in_transaction)
+        self.assertFalse(first._write_db.in_transaction)
+
+        # Another cluster writes while the first still has changes queued, nothing waits on a lock
+        second = SqliteStorage(path, flush_delay=3600, max_flush_delay=3600)
+        self.addCleanup(second.close)
+        start = time.monotonic()
+        second.set('2', ['locale'], 'nb_no')
+        second.flush()
+        self.assertLess(time.monotonic() - start, 1.0)
+
+        self.assertEqual(first.get('2', ['locale']), 'nb_no')
+        first.flush()
+        self.assertEqual(second.get('1', ['locale']), 'en_en')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+# Discord Packages
+import lavalink
+
+import asyncio
+import logging
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+from cogs.snapshots import Snapshots
+
+# Bot Utilities
+from cogs.utils.cluster import Cluster
+from cogs.utils.metrics import MetricsRegistry
+from cogs.utils.mixplayer import MixPlayer, QueuedTrack
+from cogs.utils.snapshots import dump_track
+from .fakelavalink import FakeLavalink
+
+GUILD_ID = 1234
+
+
+class FakeMember:
+    def __init__(self, member_id, channel=None, bot=False, deaf=False):
+        """ A member in the voice channel, hashable like a discord.Member """
+        self.id = member_id
+        self.bot = bot
+        self.voice = SimpleNamespace(channel=channel, deaf=False, self_deaf=deaf)
+
+
+class AttachPlayersTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.client = lavalink.Client(1, player=MixPlayer)
+        self.lavalink = FakeLavalink(self.client)
+        self.client.add_node('first', 2333, 'pw', 'eu', name='first')
+        self.node = self.client.node_manager.nodes[0]
+        await self.lavalink.wait_connected(self.node)
+
+        self.channel = SimpleNamespace(id=42, members=[])
+        self.guild = SimpleNamespace(id=GUILD_ID, me=FakeMember(1, self.channel, bot=True))
+        self.channel.members.append(self.guild.me)
+        bot = SimpleNamespace(main_logger=SimpleNamespace(bot_logger=logging.getLogger('test')),
+                              snapshot_conf={'interval': 0}, cluster=Cluster(), datadir=self.tmp.name,
+                              metrics=MetricsRegistry(), lavalink=self.client,
+                              node_sessions=SimpleNamespace(resuming={'first'}),
+                              get_guild=lambda guild_id: self.guild if guild_id == GUILD_ID else None)
+        self.cog = Snapshots(bot)
+
+    async def asyncTearDown(self):
+        self.cog.store.close()
+        for task in asyncio.all_tasks():
+            if task is not asyncio.current_task():
+                task.cancel()
+        await self.client._session.close()
+        self.tmp.cleanup()
+
+    def snapshot(self):
+        track = dump_track(QueuedTrack('encoded', 'id', 'Song', 'https://example.com', 'Artist', 200000, 2))
+        state = {'channel': '42', 'node': 'first', 'current': track, 'position': 1000, 'paused': False,
+                 'volume': 100, 'boosted': False}
+        return GUILD_ID, state, {'priority': [], 'queues': [[2, [track]]], 'history': []}
+
+    async def test_listeners_are_known_after_resuming(self):
+        listener = FakeMember(2, self.channel)
+        deafened = FakeMember(3, self.channel, deaf=True)
+        self.channel.members += [listener, deafened, FakeMember(4, self.channel, bot=True)]
+
+        attaching = asyncio.ensure_future(self.cog.attach_players([self.snapshot()], timeout=2))
+        await asyncio.sleep(0.01)
+        self.lavalink.sockets[2333].push({'op': 'playerUpdate', 'guildId': str(GUILD_ID),
+                                          'state': {'time': 0, 'position': 6000}})
+        self.assertEqual(await attaching, {GUILD_ID})
+
+        player = self.client.player_manager.get(GUILD_ID)
+        self.assertEqual(player.listeners, {listener})
+        self.assertEqual(len(player.queue), 1)
+
+    async def test_player_without_update_is_dropped(self):
+        self.assertEqual(await self.cog.attach_players([self.snapshot()], timeout=0.3), set())
+        self.assertIsNone(self.client.player_manager.get(GUILD_ID))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import asyncio
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from cogs.music import Music
+
+# Bot Utilities
+from cogs.utils import cache
+from cogs.utils.cache import LRUCache
+from cogs.utils.metrics import MetricsRegistry
+
+
+class StubNode:
+    def __init__(self, name='stub'):
+        """ Answers track lookups like a lavalink node, holding them until release() when gated """
+        self.name = name
+        self.lookups = []
+        self.results = {}
+        self.gate = None
+
+    def release(self):
+        self.gate.set()
+
+    async def get_tracks(self, query):
+        self.lookups.append(query)
+        if self.gate is not None:
+            await self.gate.wait()
+        return self.results.get(query, {'loadType': 'NO_MATCHES', 'tracks': []})
+
+
+def search_result(*titles):
+    return {'loadType': 'SEARCH_RESULT', 'tracks': [{'track': title, 'info': {'title': title}} for title in titles]}
+
+
+class TrackCacheTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.now = time.time()
+        clock = mock.patch.object(cache.time, 'time', lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+
+        self.cache = LRUCache(ttl=1800, failure_ttl=60)
+        metrics = MetricsRegistry()
+        # get_tracks only needs the cache and the latency histogram of the cog
+        self.cog = SimpleNamespace(bot=SimpleNamespace(caches={'tracks': self.cache}),
+                                   rest_latency=metrics.histogram('lavalink_rest_seconds', 'Latency', ('node',)))
+        self.node = StubNode()
+        self.node.results['ytsearch:never gonna give you up'] = search_result('Never Gonna Give You Up')
+
+    def get_tracks(self, query):
+        return Music.get_tracks(self.cog, self.node, query)
+
+    async def test_concurrent_queries_share_one_lookup(self):
+        self.node.gate = asyncio.Event()
+        lookups = [asyncio.ensure_future(self.get_tracks(query)) for query in
+                   ('ytsearch:Never Gonna Give You Up', 'ytsearch:never  gonna give you up ', 'YTSEARCH:never gonna '
+                    'give you up')]
+        await asyncio.sleep(0)
+        self.node.release()
+        results = await asyncio.gather(*lookups)
+
+        self.assertEqual(len(self.node.lookups), 1)
+        self.assertTrue(all(result is results[0] for result in results))
+        self.assertEqual(self.cache.coalesced, 2)
+
+    async def test_results_expire(self):
+        await self.get_tracks('ytsearch:never gonna give you up')
+        self.now += 1799
+        await self.get_tracks('ytsearch:never gonna give you up')
+        self.assertEqual(len(self.node.lookups), 1)
+
+        self.now += 2
+        await self.get_tracks('ytsearch:never gonna give you up')
+        self.assertEqual(len(self.node.lookups), 2)
+
+    async def test_empty_results_are_not_kept_alive_by_hits(self):
+        empty = await self.get_tracks('ytsearch:nothing like this')
+        self.assertEqual(empty['tracks'], [])
+        expires = self.cache._entries['ytsearch:nothing like this'][0]
+        self.assertEqual(expires, self.now + 60)
+
+        # Hits within the failure ttl neither look it up again nor push its expiry back
+        for _ in range(5):
+            self.now += 10
+            self.assertIs(await self.get_tracks('ytsearch:nothing like this'), empty)
+        self.assertEqual(self.cache._entries['ytsearch:nothing like this'][0], expires)
+        self.assertEqual(len(self.node.lookups), 1)
+
+        self.now += 11
+        await self.get_tracks('ytsearch:nothing like this')
+        self.assertEqual(len(self.node.lookups), 2)
+
+    async def test_failed_lookup_is_cached_shortly(self):
+        async def failing(query):
+            self.node.lookups.append(query)
+            raise OSError('node unreachable')
+        self.node.get_tracks = failing
+
+        with self.assertRaises(OSError):
+            await self.get_tracks('ytsearch:never gonna give you up')
+        self.assertIsNone(await self.get_tracks('ytsearch:never gonna give you up'))
+        self.now += 61
+        with self.assertRaises(OSError):
+            await self.get_tracks('ytsearch:never gonna give you up')
+        self.assertEqual(len(self.node.lookups), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()